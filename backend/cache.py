@@ -0,0 +1,260 @@
+"""
+Read-mostly caches for data loaded from 511 or derived from it.
+
+A Cache holds one immutable snapshot (value + load time) that is replaced as a whole, so
+readers never see a partial update. Loads are single-flight: however many callers find the
+entry missing or stale, one load runs and the rest share it. Stale entries are served at once
+while a background refresh runs (stale-while-revalidate); when a refresh fails the old
+snapshot keeps being served until it is max_stale seconds old (serve-stale-on-error).
+Each cache counts hits, stale hits, misses, successful refreshes and refresh errors.
+
+Caches given a sizeof share one memory budget (MEMORY_BUDGET_BYTES): each snapshot's size is
+estimated when it is loaded, and while the total is over budget the least recently used
+snapshots of unpinned caches are evicted (dropped, and reloaded on their next use). Pinned
+caches count toward the total but are never evicted, so the data of one operator cannot be
+pushed out by another's.
+
+Everything runs on the event loop; loaders may hand CPU-heavy work to asyncio.to_thread but
+must not touch the cache from that thread.
+"""
+
+import asyncio
+import itertools
+import os
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+Snapshot = namedtuple("Snapshot", "value fetched_at")
+
+# name -> Cache, for stats
+CACHES = {}
+
+MEMORY_BUDGET_BYTES = int(float(os.getenv("CACHE_MEMORY_BUDGET_MB", "512")) * 1024 * 1024)
+# Containers longer than this are sized from an even sample of their elements
+SIZE_SAMPLE = 64
+
+
+class Cache:
+    """
+    loader(previous_value_or_None) is awaited to produce a new value; raising keeps the old one.
+    An entry is fresh while younger than ttl, or, if is_current is given, while
+    is_current(value) is true (e.g. "built from the current feed version"). It may be served
+    stale until max_stale seconds after it was loaded (None: indefinitely).
+    sizeof(value) -> estimated bytes puts the cache under the memory budget; pinned exempts it
+    from eviction; on_evict() is called after an eviction (e.g. to drop other references to the value).
+    """
+
+    def __init__(self, name, loader, ttl=None, max_stale=None, is_current=None, sizeof=None, pinned=False,
+                 on_evict=None):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.is_current = is_current
+        self.sizeof = sizeof
+        self.pinned = pinned
+        self.on_evict = on_evict
+        self._snapshot = None
+        self._task = None
+        self.size = 0
+        self.last_used = 0.0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def peek(self):
+        """Current value if it may still be served (fresh or within max_stale), else None. Never loads."""
+        snap = self._snapshot
+        now = time.time()
+        if snap is None or not self._servable(snap, now):
+            return None
+        self.last_used = now
+        return snap.value
+
+    def age(self):
+        """Seconds since the current value was loaded (None if empty)."""
+        snap = self._snapshot
+        return None if snap is None else time.time() - snap.fetched_at
+
+    def is_fresh(self):
+        snap = self._snapshot
+        return snap is not None and self._fresh(snap, time.time())
+
+    def install(self, value, fetched_at=None):
+        """Replace the snapshot with value (e.g. loaded from disk at startup)."""
+        self._snapshot = Snapshot(value, time.time() if fetched_at is None else fetched_at)
+        self.last_used = time.time()
+        self._account(value)
+
+    def invalidate(self):
+        """Drop the snapshot; the next get() loads."""
+        self._snapshot = None
+        self.size = 0
+
+    def evict(self):
+        """Drop the snapshot to free memory (see enforce_budget)."""
+        self.invalidate()
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict()
+
+    def _account(self, value):
+        if self.sizeof is not None:
+            self.size = self.sizeof(value)
+            enforce_budget(keep=self)
+
+    def _fresh(self, snap, now):
+        if self.is_current is not None:
+            return self.is_current(snap.value)
+        return self.ttl is not None and now - snap.fetched_at < self.ttl
+
+    def _servable(self, snap, now):
+        return self.max_stale is None or now - snap.fetched_at < self.max_stale
+
+    async def get(self):
+        """
+        The cached value. Fresh: returned as is. Stale but servable: returned at once, and a
+        background refresh is started. Missing or too stale: waits for the (shared) load,
+        which raises if the loader fails.
+        """
+        snap = self._snapshot
+        now = self.last_used = time.time()
+        if snap is not None:
+            if self._fresh(snap, now):
+                self.hits += 1
+                return snap.value
+            if self._servable(snap, now):
+                self.stale_hits += 1
+                self._start_refresh()
+                return snap.value
+        self.misses += 1
+        return await self.refresh()
+
+    async def refresh(self):
+        """Load now (joining a load already in flight) and return the new value; raises on failure."""
+        # shield: a cancelled caller (e.g. client disconnect) must not cancel the shared load
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self):
+        task = self._task
+        if task is None:
+            task = self._task = asyncio.ensure_future(self._load())
+            task.add_done_callback(self._load_done)
+        return task
+
+    def _load_done(self, task):
+        if self._task is task:
+            self._task = None
+        # Background refreshes may have no awaiter; retrieve the error so it isn't logged as lost
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self):
+        previous = self._snapshot
+        try:
+            value = await self.loader(previous.value if previous is not None else None)
+        except Exception:
+            self.refresh_errors += 1
+            raise
+        self.refreshes += 1
+        self._snapshot = Snapshot(value, time.time())
+        self._account(value)
+        return value
+
+    def stats(self):
+        age = self.age()
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "age_sec": round(age, 1) if age is not None else None,
+            "refreshing": self._task is not None,
+            "size_bytes": self.size,
+            "evictions": self.evictions,
+            "pinned": self.pinned,
+        }
+
+
+def stats():
+    """{cache name: counters} for every cache created so far."""
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def enforce_budget(keep=None):
+    """
+    Evict least recently used unpinned snapshots until the sized caches fit MEMORY_BUDGET_BYTES.
+    keep (the cache that just loaded) and caches with a load in flight are left alone.
+    """
+    total = sum(c.size for c in CACHES.values())
+    if total <= MEMORY_BUDGET_BYTES:
+        return
+    victims = sorted(
+        (c for c in CACHES.values() if c.size and not c.pinned and c is not keep and c._task is None),
+        key=lambda c: c.last_used,
+    )
+    for cache in victims:
+        total -= cache.size
+        cache.evict()
+        if total <= MEMORY_BUDGET_BYTES:
+            return
+
+
+def memory_stats():
+    """Estimated bytes held by sized caches, pinned and in total, against the budget."""
+    return {
+        "budget_bytes": MEMORY_BUDGET_BYTES,
+        "used_bytes": sum(c.size for c in CACHES.values()),
+        "pinned_bytes": sum(c.size for c in CACHES.values() if c.pinned),
+        "evictions": sum(c.evictions for c in CACHES.values()),
+    }
+
+
+def estimate_size(obj, _seen=None):
+    """
+    Approximate deep size of obj in bytes: numpy arrays and array.array by their buffers,
+    protobuf messages from their serialized size, containers and plain objects recursively,
+    long containers extrapolated from SIZE_SAMPLE evenly spaced elements. Each object is
+    counted once per call.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+    if isinstance(obj, array):
+        return sys.getsizeof(obj)
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):  # numpy array
+        return nbytes + 112
+    if callable(getattr(obj, "ByteSize", None)):  # protobuf message; parsed it takes a few times its wire size
+        return sys.getsizeof(obj) + obj.ByteSize() * 3
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        n, elements = len(obj), obj.items()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        n, elements = len(obj), obj
+    else:
+        attrs = getattr(obj, "__dict__", None)
+        if attrs is None:
+            attrs = {k: getattr(obj, k) for k in getattr(type(obj), "__slots__", ()) if hasattr(obj, k)}
+        n, elements = len(attrs), attrs.values()
+    if n == 0:
+        return size
+    step = max(1, n // SIZE_SAMPLE)
+    sampled, measured = 0, 0
+    for element in itertools.islice(elements, 0, None, step):
+        sampled += 1
+        if isinstance(obj, dict):
+            measured += estimate_size(element[0], seen) + estimate_size(element[1], seen)
+        else:
+            measured += estimate_size(element, seen)
+    return size + measured * n // sampled
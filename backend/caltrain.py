@@ -2,27 +2,50 @@
 Caltrain data from the 511 SF Bay API.
 
 Use get_caltrain_stops() to get stop IDs, then get_next_trains(stop_id) for predictions.
+Functions that call 511 are async (await them, or wrap in asyncio.run() from sync code).
 All times are also returned in Pacific (PST/PDT) as *_local fields.
 
 Primary source: GTFS-Realtime Trip Updates (Caltrain populates this; SIRI StopMonitoring is often empty).
-Fallback: SIRI StopMonitoring.
+Fallbacks: the static GTFS schedule (local), then SIRI StopMonitoring.
 """
 
-import csv
-import io
-import math
+import asyncio
+import bisect
+import functools
+import hashlib
 import os
-import re
 import time
-import zipfile
+from array import array
+from collections import namedtuple
 from pathlib import Path
 
-import requests
 from google.transit import gtfs_realtime_pb2
 from dotenv import load_dotenv
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
+# Support both: run from repo root (backend.*) and from app root (e.g. Docker)
+try:
+    from backend import gtfs_cache, health, metrics, shared_snapshot, upstream
+    from backend.cache import Cache, estimate_size
+    from backend.gtfs_static import GtfsStatic
+    from backend.journey import MAX_LEGS, ConnectionTimetable
+    from backend.schedule import Schedule, service_day_start
+    from backend.spatial import StopIndex, valid_point
+    from backend.stations import StationModel, display_name, stop_direction
+except ModuleNotFoundError:
+    import gtfs_cache
+    import health
+    import metrics
+    import shared_snapshot
+    from cache import Cache, estimate_size
+    import upstream
+    from gtfs_static import GtfsStatic
+    from journey import MAX_LEGS, ConnectionTimetable
+    from schedule import Schedule, service_day_start
+    from spatial import StopIndex, valid_point
+    from stations import StationModel, display_name, stop_direction
+
 # Load .env from backend directory (API credentials)
 load_dotenv(Path(__file__).resolve().parent / ".env")
 
@@ -30,19 +53,70 @@ API_KEY = os.getenv("API_KEY")
 CALTRAIN_OPERATOR_ID = "CT"
 PACIFIC = ZoneInfo("America/Los_Angeles")
 
-# Cache stops list (rarely changes); TTL 24 hours
-_stops_cache = None
-_stops_cache_time = 0
+# Every cache below is a cache.Cache per (kind, operator_id), created on first use (see _operator_cache):
+#   stops: StationModel over the stop list; refreshed every STOPS_CACHE_TTL_SEC
+#   stops_coords: StopIndex over stops with coordinates; same TTL
+#   gtfs_static: GtfsData from the operator's GtfsStatic bundle; revalidated every GTFS_STATIC_TTL_SEC
+#   travel_times, trip_timetable, schedule, connections: derived from gtfs_static; rebuilt when its version changes
+#   gtfs_rt: GtfsRtSnapshot; one upstream fetch serves every stop
+# Stale entries are served while they refresh in the background, and through refresh failures.
+# All of them count toward cache.MEMORY_BUDGET_BYTES; those of PINNED_OPERATORS are never evicted
+# (comma-separated operator IDs), so other agencies' feeds can't push Caltrain's out.
+_caches = {}
 STOPS_CACHE_TTL_SEC = 86400
-
-# Cache stops with coordinates for nearest-station lookup
-_stops_coords_cache = None
-_stops_coords_cache_time = 0
-
-# Cache travel-time matrix from GTFS stop_times; TTL 24 hours
-_travel_time_cache = None
-_travel_time_cache_time = 0
-TRAVEL_TIME_CACHE_TTL_SEC = 86400
+GTFS_STATIC_TTL_SEC = 86400
+PINNED_OPERATORS = tuple(op.strip() for op in os.getenv("PINNED_OPERATORS", "CT").split(",") if op.strip())
+
+
+def _parse_ttl_overrides(spec):
+    """{(operator_id, kind): seconds} from e.g. "SF:gtfs_rt=60,gtfs_static=43200;AC:stops=3600"."""
+    overrides = {}
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        operator_id, _, settings = part.partition(":")
+        for item in filter(None, settings.split(",")):
+            kind, _, seconds = item.partition("=")
+            overrides[(operator_id.strip(), kind.strip())] = float(seconds)
+    return overrides
+
+
+# Per-operator refresh schedules: TTL overrides by cache kind (gtfs_rt, gtfs_static, stops, stops_coords)
+_TTL_OVERRIDES = _parse_ttl_overrides(os.getenv("OPERATOR_CACHE_TTL", ""))
+
+
+def operator_ttl(kind, operator_id, default):
+    """TTL in seconds of operator_id's kind cache: its OPERATOR_CACHE_TTL override, else default."""
+    return _TTL_OVERRIDES.get((operator_id, kind), default)
+
+# Static GTFS bundle per operator (holds the HTTP validators for conditional GETs)
+_gtfs_static = {}  # operator_id -> GtfsStatic
+
+# GTFS-RT is refetched at most once per GTFS_RT_CACHE_TTL_SEC (override via env, e.g. 15-30 s). If 511
+# fails, the last snapshot is served until it is GTFS_RT_MAX_STALE_SEC old, then GTFS-RT counts as empty.
+GTFS_RT_CACHE_TTL_SEC = int(os.getenv("GTFS_RT_CACHE_TTL_SEC", "20"))
+GTFS_RT_MAX_STALE_SEC = int(os.getenv("GTFS_RT_MAX_STALE_SEC", "120"))
+
+# Departure sources are raced: GTFS-RT starts first; the schedule and StopMonitoring start together
+# after NEXT_TRAINS_HEDGE_SEC (or as soon as GTFS-RT comes back empty). The highest-priority non-empty
+# result wins; whatever is still running at NEXT_TRAINS_BUDGET_SEC is cancelled.
+NEXT_TRAINS_HEDGE_SEC = float(os.getenv("NEXT_TRAINS_HEDGE_SEC", "0.3"))
+NEXT_TRAINS_BUDGET_SEC = float(os.getenv("NEXT_TRAINS_BUDGET_SEC", "6"))
+
+# One parsed feed plus its indexes: stops is stop_id -> (sorted departure times, RtDeparture records),
+# trips is trip_id -> {stop_id: RtDeparture}; version is the sha1 of the protobuf
+GtfsRtSnapshot = namedtuple("GtfsRtSnapshot", "fetched_at feed stops trips version")
+# Compact record for one trip's predicted departure at one stop (ts = epoch seconds, delay in seconds)
+RtDeparture = namedtuple("RtDeparture", "ts trip_id route_id delay")
+# One train at a stop, from any departure source. Times are epoch seconds (None when the source omits
+# them); strings are only produced when a response is built (visit_dict, _format_trains).
+Departure = namedtuple(
+    "Departure",
+    "trip_id line_name line_ref destination expected_departure expected_arrival aimed_departure aimed_arrival",
+)
+
+# Data derived from one GtfsData version: (from_id, to_id) -> median minutes, and
+# trip_id -> {stop_id: row in stop_times}
+TravelTimes = namedtuple("TravelTimes", "version table")
+TripTimetable = namedtuple("TripTimetable", "version stop_times rows")
 
 # Last-resort embedded list if both GTFS and NeTEx fail (e.g. API change or outage).
 # Main Caltrain stations; IDs from GTFS. Update occasionally if new stations added.
@@ -100,104 +174,309 @@ EMBEDDED_STOPS = [
 ]
 
 
-def _fetch_json(url, params, timeout=10):
-    """GET url with params; handle 511 UTF-8 BOM and return JSON."""
-    r = requests.get(url, params=params, timeout=timeout)
-    r.encoding = "utf-8-sig"
-    return r.json()
+def _size_without(value, *shared):
+    return estimate_size(value, {id(o) for o in shared})
+
+
+# Estimated size of a cached value, leaving out what it shares with the GtfsData it was built from
+# (counted in the gtfs_static cache)
+_SIZEOF = {
+    "trip_timetable": lambda v: estimate_size(v.rows),
+    "schedule": lambda v: _size_without(v, v.trip_ids),
+    "connections": lambda v: _size_without(v, v.schedule, v.stop_ids, v.trip_ids),
+}
 
 
-def check_511_api_health(operator_id=CALTRAIN_OPERATOR_ID, timeout=5):
+def _operator_cache(kind, operator_id, make):
     """
-    Check if the 511 API is reachable and responsive.
-    Returns True if healthy, False otherwise.
+    The Cache for (kind, operator_id); make() creates it on first use. Every cache is sized
+    against the memory budget and pinned if operator_id is in PINNED_OPERATORS.
     """
-    try:
-        _fetch_json(
-            "https://api.511.org/transit/stops",
-            {"api_key": API_KEY, "operator_id": operator_id, "format": "json"},
-            timeout=timeout,
-        )
-        return True
-    except Exception:
-        return False
+    cache = _caches.get((kind, operator_id))
+    if cache is None:
+        cache = _caches[(kind, operator_id)] = make()
+        cache.sizeof = _SIZEOF.get(kind, estimate_size)
+        cache.pinned = operator_id in PINNED_OPERATORS
+    return cache
 
 
-def _utc_to_local(iso_utc_str):
-    """Turn a UTC ISO time string into Pacific time only, e.g. '8:41 AM' (timezone shown in header)."""
-    if not iso_utc_str:
-        return None
+async def _fetch_json(endpoint, params, timeout=None):
+    """GET 511 /transit/<endpoint> with params; handle 511 UTF-8 BOM and return JSON."""
+    return await upstream.fetch_json(endpoint, params, timeout=timeout)
+
+
+async def probe_511_endpoints(operator_id=CALTRAIN_OPERATOR_ID, max_age=60):
+    """
+    Exercise each endpoint in health.ENDPOINTS that no request has touched in max_age seconds,
+    so /api/health stays current without calling 511 itself. Outcomes are recorded by upstream.
+    tripupdates and datafeeds probes are real refreshes (shared with the poller and bundle), and
+    datafeeds is only probed conditionally, never by downloading the whole zip.
+    """
+    now = time.time()
+
+    def stale(endpoint):
+        seen = health.get(endpoint).last_seen()
+        return seen is None or now - seen >= max_age
+
+    stop_id = EMBEDDED_STOPS[0]["id"]
+    probes = []
+    if stale("tripupdates"):
+        probes.append(refresh_gtfs_rt_snapshot(operator_id))
+    if stale("stoptimetable"):
+        probes.append(_fetch_json(
+            "stoptimetable",
+            {"api_key": API_KEY, "operatorref": operator_id, "monitoringref": stop_id, "format": "json"},
+        ))
+    if stale("StopMonitoring"):
+        probes.append(_fetch_json(
+            "StopMonitoring", {"api_key": API_KEY, "agency": operator_id, "stopcode": stop_id, "format": "json"},
+        ))
+    bundle = _gtfs_static_bundle(operator_id)
+    if stale("datafeeds") and bundle.data is not None and (bundle.etag or bundle.last_modified):
+        probes.append(refresh_gtfs_static(operator_id))
+    await asyncio.gather(*probes, return_exceptions=True)
+
+
+def _epoch_to_local(ts):
+    """Epoch seconds -> Pacific time string like '3:45 PM' (timezone shown in header)."""
+    return _minute_to_local(int(ts) // 60)
+
+
+@functools.lru_cache(maxsize=4096)
+def _minute_to_local(minute):
+    local = datetime.fromtimestamp(minute * 60, tz=PACIFIC)
+    h = local.hour % 12 or 12
+    return f"{h}:{local.minute:02d} {local.strftime('%p')}"
+
+
+def _epoch_to_iso(ts):
+    """Epoch seconds -> UTC ISO string like '2025-01-31T17:45:00+00:00'."""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _iso_to_epoch(iso_utc_str):
+    """ISO time (UTC if no offset) -> epoch seconds; None if missing or unparseable."""
     try:
         dt = datetime.fromisoformat(iso_utc_str.replace("Z", "+00:00"))
-        local = dt.astimezone(PACIFIC)
-        h = local.hour % 12 or 12
-        return f"{h}:{local.minute:02d} {local.strftime('%p')}"
-    except (ValueError, TypeError):
+    except (AttributeError, ValueError, TypeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _parse_gtfs_rt_feed(content, fetched_at=None):
+    """Parse a tripupdates protobuf into a new GtfsRtSnapshot (CPU-bound; run off the event loop)."""
+    start = time.perf_counter()
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    parsed = time.perf_counter()
+    stops = _index_gtfs_rt_feed(feed)
+    metrics.GTFS_RT_PARSE_SECONDS.observe(parsed - start, "protobuf")
+    metrics.GTFS_RT_PARSE_SECONDS.observe(time.perf_counter() - parsed, "index")
+    metrics.GTFS_RT_PAYLOAD_BYTES.observe(len(content))
+    version = hashlib.sha1(content).hexdigest()
+    return GtfsRtSnapshot(time.time() if fetched_at is None else fetched_at, feed, stops, _index_gtfs_rt_trips(stops),
+                          version)
+
+
+def _index_gtfs_rt_feed(feed):
+    """
+    Build stop_id -> (times, departures) from a FeedMessage, each sorted by departure time.
+    Keeps the first predicted time per (trip, stop), like the original per-stop scan.
+    """
+    by_stop = {}
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        tu = entity.trip_update
+        trip_id = tu.trip.trip_id
+        route_id = (tu.trip.route_id or "").strip()
+        seen = set()
+        for stu in tu.stop_time_update:
+            stop_id = stu.stop_id
+            if stop_id in seen:
+                continue
+            dep = stu.departure if stu.HasField("departure") else stu.arrival if stu.HasField("arrival") else None
+            arr = stu.arrival if stu.HasField("arrival") else stu.departure if stu.HasField("departure") else None
+            ts = dep.time if dep and dep.time else (arr.time if arr and arr.time else 0)
+            if not ts:
+                continue
+            seen.add(stop_id)
+            delay = dep.delay if dep and dep.HasField("delay") else None
+            by_stop.setdefault(stop_id, []).append(RtDeparture(ts, trip_id, route_id, delay))
+    stops = {}
+    for stop_id, deps in by_stop.items():
+        deps.sort(key=lambda d: d.ts)
+        stops[stop_id] = ([d.ts for d in deps], deps)
+    return stops
+
+
+def _index_gtfs_rt_trips(stops):
+    """trip_id -> {stop_id: RtDeparture} over the same records as the per-stop index."""
+    trips = {}
+    for stop_id, (_, deps) in stops.items():
+        for d in deps:
+            trips.setdefault(d.trip_id, {})[stop_id] = d
+    return trips
+
+
+async def _load_gtfs_rt_snapshot(operator_id, previous=None):
+    """
+    Fetch, parse and index the feed into a new GtfsRtSnapshot. Raises on failure.
+    With shared snapshots (see shared_snapshot.py) the leader publishes what it fetched, and the
+    other workers adopt the published feed instead (previous, if it is the same version).
+    """
+    source = shared_snapshot.feed_source()
+    if source == "upstream":
+        content = await upstream.fetch_bytes("tripupdates", {"api_key": API_KEY, "agency": operator_id})
+        if shared_snapshot.SHARED_SNAPSHOTS:
+            await asyncio.to_thread(shared_snapshot.write_realtime, operator_id, content)
+        return await asyncio.to_thread(_parse_gtfs_rt_feed, content)
+    if source == "remote":
+        await shared_snapshot.pull(operator_id, "realtime")
+    shared = await asyncio.to_thread(shared_snapshot.read_realtime, operator_id)
+    if shared is None or time.time() - shared.fetched_at > GTFS_RT_MAX_STALE_SEC:
+        raise LookupError(f"no current shared GTFS-RT snapshot for {operator_id}")
+    if previous is not None and previous.version == shared.version:
+        return previous
+    return await asyncio.to_thread(_parse_gtfs_rt_feed, shared.content, shared.fetched_at)
+
+
+def _gtfs_rt_cache(operator_id):
+    return _operator_cache("gtfs_rt", operator_id, lambda: Cache(
+        f"gtfs_rt:{operator_id}",
+        lambda previous: _load_gtfs_rt_snapshot(operator_id, previous),
+        ttl=operator_ttl("gtfs_rt", operator_id, GTFS_RT_CACHE_TTL_SEC),
+        max_stale=GTFS_RT_MAX_STALE_SEC,
+    ))
+
+
+async def _get_gtfs_rt_snapshot(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Current GtfsRtSnapshot shared by all requests (do not mutate it).
+    Refreshed in the background once older than GTFS_RT_CACHE_TTL_SEC; concurrent callers
+    share one fetch. Returns None if there is no snapshot younger than GTFS_RT_MAX_STALE_SEC.
+    """
+    try:
+        return await _gtfs_rt_cache(operator_id).get()
+    except Exception:
         return None
 
 
-def _get_next_trains_from_gtfs_rt(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
+async def refresh_gtfs_rt_snapshot(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Fetch and index the feed now, replacing the shared snapshot (used by the background poller).
+    Returns the new GtfsRtSnapshot, or if the fetch failed the previous one while still servable (else None).
+    """
+    cache = _gtfs_rt_cache(operator_id)
+    try:
+        return await cache.refresh()
+    except Exception:
+        return cache.peek()
+
+
+async def get_gtfs_rt_feed(operator_id=CALTRAIN_OPERATOR_ID):
+    """Parsed GTFS-Realtime FeedMessage from the shared snapshot, or None (do not mutate it)."""
+    snap = await _get_gtfs_rt_snapshot(operator_id=operator_id)
+    return snap.feed if snap is not None else None
+
+
+def gtfs_rt_departures(stops_index, stop_id, after_ts, limit=None):
+    """
+    RtDeparture records at stop_id with ts >= after_ts, in time order, from a snapshot's index.
+    Binary search to the first match, then slice: O(log n + k).
+    """
+    entry = stops_index.get(str(stop_id))
+    if entry is None:
+        return []
+    times, deps = entry
+    i = bisect.bisect_left(times, after_ts)
+    return deps[i:] if limit is None else deps[i:i + limit]
+
+
+async def _get_next_trains_from_gtfs_rt(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
     """
     Next train predictions from GTFS-Realtime Trip Updates (primary source for Caltrain).
-    Returns list of dicts in same format as get_next_trains, or [] on failure.
+    Looks up the shared snapshot's per-stop index (see _get_gtfs_rt_snapshot).
+    Returns a list of Departure, or [] on failure.
     """
-    stop_str = str(stop_id)
-    visits = []
     try:
-        r = requests.get(
-            "https://api.511.org/transit/tripupdates",
-            params={"api_key": API_KEY, "agency": operator_id},
-            timeout=10,
-        )
-        r.raise_for_status()
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(r.content)
-        now_ts = int(time.time())
-        for entity in feed.entity:
-            if not entity.HasField("trip_update"):
-                continue
-            tu = entity.trip_update
-            trip = tu.trip
-            route_id = (trip.route_id or "").strip()
-            for stu in tu.stop_time_update:
-                if stu.stop_id != stop_str:
-                    continue
-                dep = stu.departure if stu.HasField("departure") else stu.arrival if stu.HasField("arrival") else None
-                arr = stu.arrival if stu.HasField("arrival") else stu.departure if stu.HasField("departure") else None
-                ts = dep.time if dep and dep.time else (arr.time if arr and arr.time else 0)
-                if ts < now_ts - 60:
-                    continue
-                dt_utc = datetime.fromtimestamp(ts, tz=timezone.utc)
-                iso_str = dt_utc.strftime("%Y-%m-%dT%H:%M:%S+00:00")
-                visits.append({
-                    "line_name": route_id,
-                    "line_ref": route_id,
-                    "destination": route_id or "—",
-                    "expected_departure": iso_str,
-                    "expected_arrival": iso_str,
-                    "aimed_departure": iso_str,
-                    "aimed_arrival": iso_str,
-                    "expected_departure_local": _utc_to_local(iso_str),
-                    "expected_arrival_local": _utc_to_local(iso_str),
-                    "aimed_departure_local": _utc_to_local(iso_str),
-                    "aimed_arrival_local": _utc_to_local(iso_str),
-                })
-                break
+        snap = await _get_gtfs_rt_snapshot(operator_id=operator_id)
+        if snap is None:
+            return []
+        return _gtfs_rt_visits(snap, stop_id, limit=limit)
     except Exception:
-        pass
-    return visits
+        return []
 
 
-def _get_next_trains_from_stoptimetable(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
+def _gtfs_rt_visits(snap, stop_id, limit=None):
+    """Departures at stop_id from one GtfsRtSnapshot."""
+    return [
+        _epoch_departure(d.ts, d.trip_id, d.route_id, d.route_id)
+        for d in gtfs_rt_departures(snap.stops, stop_id, int(time.time()) - 60, limit=limit)
+    ]
+
+
+def _epoch_departure(ts, trip_id, line_ref, destination):
+    """Departure known only as one time (expected = aimed, arrival = departure)."""
+    return Departure(trip_id, line_ref, line_ref, destination or "—", ts, ts, ts, ts)
+
+
+def visit_dict(d):
     """
-    Scheduled departures from SIRI Stop Timetable (fallback when real-time is empty).
-    Returns list of dicts in same format as get_next_trains.
+    A Departure as the visit dict returned by get_next_trains and /api/stops/{id}/trains: UTC ISO
+    times and Pacific *_local strings (None where the source had no time).
+    """
+    times = (d.expected_departure, d.expected_arrival, d.aimed_departure, d.aimed_arrival)
+    iso = [_epoch_to_iso(ts) if ts is not None else None for ts in times]
+    local = [_epoch_to_local(ts) if ts is not None else None for ts in times]
+    return {
+        "trip_id": d.trip_id,
+        "line_name": d.line_name,
+        "line_ref": d.line_ref,
+        "destination": d.destination,
+        "expected_departure": iso[0],
+        "expected_arrival": iso[1],
+        "aimed_departure": iso[2],
+        "aimed_arrival": iso[3],
+        "expected_departure_local": local[0],
+        "expected_arrival_local": local[1],
+        "aimed_departure_local": local[2],
+        "aimed_arrival_local": local[3],
+    }
+
+
+def _siri_trip_id(journey):
+    """GTFS trip_id of a SIRI vehicle journey (511 uses it as DatedVehicleJourneyRef), or None."""
+    ref = journey.get("FramedVehicleJourneyRef") or {}
+    trip_id = ref.get("DatedVehicleJourneyRef") if isinstance(ref, dict) else None
+    return (trip_id or journey.get("DatedVehicleJourneyRef") or "").strip() or None
+
+
+async def _get_next_trains_from_schedule(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
+    """
+    Scheduled departures from the static GTFS feed (fallback when real-time is empty); no 511
+    request once the feed is loaded, so it keeps answering through outages. Falls back to SIRI
+    Stop Timetable only while GTFS is unavailable. Returns a list of Departure.
+    """
+    schedule = await get_schedule(operator_id=operator_id)
+    if schedule is None:
+        return await _get_next_trains_from_stoptimetable(stop_id, operator_id=operator_id, limit=limit)
+    departures = schedule.departures(str(stop_id), int(time.time()) - 60, limit=limit)
+    return [_epoch_departure(d.ts, d.trip_id, d.route_id, d.headsign or d.route_id) for d in departures]
+
+
+async def _get_next_trains_from_stoptimetable(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
+    """
+    Scheduled departures from SIRI Stop Timetable (fallback while the GTFS schedule is unavailable).
+    Returns a list of Departure.
     """
     stop_str = str(stop_id)
     visits = []
     try:
-        data = _fetch_json(
-            "https://api.511.org/transit/stoptimetable",
+        data = await _fetch_json(
+            "stoptimetable",
             {"api_key": API_KEY, "operatorref": operator_id, "monitoringref": stop_str, "format": "json"},
         )
         sd = data.get("Siri", {}).get("ServiceDelivery", {})
@@ -205,55 +484,33 @@ def _get_next_trains_from_stoptimetable(stop_id, operator_id=CALTRAIN_OPERATOR_I
         stop_visits = stt.get("TimetabledStopVisit", [])
         if isinstance(stop_visits, dict):
             stop_visits = list(stop_visits.values()) if stop_visits else []
-        now = datetime.now(timezone.utc)
+        now = time.time()
         for v in stop_visits:
             if not isinstance(v, dict):
                 continue
             journey = v.get("TargetedVehicleJourney", {})
             call = journey.get("TargetedCall", {})
-            aimed = call.get("AimedDepartureTime") or call.get("AimedArrivalTime")
-            if not aimed:
-                continue
-            try:
-                dt = datetime.fromisoformat(aimed.replace("Z", "+00:00"))
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-                if (dt - now).total_seconds() < -300:
-                    continue
-                dt_utc = dt.astimezone(timezone.utc)
-                iso_str = dt_utc.strftime("%Y-%m-%dT%H:%M:%S+00:00")
-            except (ValueError, TypeError):
+            ts = _iso_to_epoch(call.get("AimedDepartureTime") or call.get("AimedArrivalTime"))
+            if ts is None or ts - now < -300:
                 continue
             line_ref = (journey.get("PublishedLineName") or journey.get("LineRef") or "").strip()
-            dest = (journey.get("DestinationName") or journey.get("VehicleJourneyName") or "").strip() or line_ref or "—"
-            visits.append({
-                "line_name": line_ref,
-                "line_ref": line_ref,
-                "destination": dest,
-                "expected_departure": iso_str,
-                "expected_arrival": iso_str,
-                "aimed_departure": iso_str,
-                "aimed_arrival": iso_str,
-                "expected_departure_local": _utc_to_local(iso_str),
-                "expected_arrival_local": _utc_to_local(iso_str),
-                "aimed_departure_local": _utc_to_local(iso_str),
-                "aimed_arrival_local": _utc_to_local(iso_str),
-            })
+            dest = (journey.get("DestinationName") or journey.get("VehicleJourneyName") or "").strip() or line_ref
+            visits.append(_epoch_departure(ts, _siri_trip_id(journey), line_ref, dest))
     except Exception:
         pass
     return visits
 
 
-def _get_next_trains_from_stopmonitoring(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
+async def _get_next_trains_from_stopmonitoring(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
     """
-    Live predictions from SIRI StopMonitoring (fallback when GTFS-RT and Stop Timetable are empty).
-    Returns list of dicts in same format as get_next_trains.
+    Live predictions from SIRI StopMonitoring (fallback when GTFS-RT and the schedule are empty).
+    Returns a list of Departure.
     """
     stop_str = str(stop_id)
     visits = []
     try:
-        data = _fetch_json(
-            "https://api.511.org/transit/StopMonitoring",
+        data = await _fetch_json(
+            "StopMonitoring",
             {"api_key": API_KEY, "agency": operator_id, "stopcode": stop_str, "format": "json"},
         )
         delivery = data.get("ServiceDelivery", {})
@@ -265,74 +522,147 @@ def _get_next_trains_from_stopmonitoring(stop_id, operator_id=CALTRAIN_OPERATOR_
         for v in raw:
             journey = v.get("MonitoredVehicleJourney", {})
             call = journey.get("MonitoredCall", {})
-            line = (journey.get("PublishedLineName") or "").strip()
-            line_ref = (journey.get("LineRef") or "").strip()
-            dest = (journey.get("DestinationName") or "").strip()
-            exp_dep = call.get("ExpectedDepartureTime")
-            exp_arr = call.get("ExpectedArrivalTime")
-            aimed_dep = call.get("AimedDepartureTime")
-            aimed_arr = call.get("AimedArrivalTime")
-            visits.append({
-                "line_name": line,
-                "line_ref": line_ref,
-                "destination": dest,
-                "expected_departure": exp_dep,
-                "expected_arrival": exp_arr,
-                "aimed_departure": aimed_dep,
-                "aimed_arrival": aimed_arr,
-                "expected_departure_local": _utc_to_local(exp_dep),
-                "expected_arrival_local": _utc_to_local(exp_arr),
-                "aimed_departure_local": _utc_to_local(aimed_dep),
-                "aimed_arrival_local": _utc_to_local(aimed_arr),
-            })
+            visits.append(Departure(
+                _siri_trip_id(journey),
+                (journey.get("PublishedLineName") or "").strip(),
+                (journey.get("LineRef") or "").strip(),
+                (journey.get("DestinationName") or "").strip(),
+                _iso_to_epoch(call.get("ExpectedDepartureTime")),
+                _iso_to_epoch(call.get("ExpectedArrivalTime")),
+                _iso_to_epoch(call.get("AimedDepartureTime")),
+                _iso_to_epoch(call.get("AimedArrivalTime")),
+            ))
     except (KeyError, TypeError, AttributeError, Exception):
         pass
     return visits
 
 
-def debug_data_sources(stop_id, operator_id=CALTRAIN_OPERATOR_ID):
+async def debug_data_sources(stop_id, operator_id=CALTRAIN_OPERATOR_ID):
     """
-    For debugging: return parsed visits from each source separately.
+    For debugging: return parsed visits from each source separately (fetched concurrently).
     Keys: priority_1_gtfs_realtime, priority_2_stop_timetable, priority_3_stop_monitoring
     """
+    rt, timetable, monitoring = await asyncio.gather(
+        _get_next_trains_from_gtfs_rt(stop_id, operator_id=operator_id),
+        _get_next_trains_from_schedule(stop_id, operator_id=operator_id),
+        _get_next_trains_from_stopmonitoring(stop_id, operator_id=operator_id),
+    )
     return {
-        "priority_1_gtfs_realtime": _get_next_trains_from_gtfs_rt(stop_id, operator_id=operator_id),
-        "priority_2_stop_timetable": _get_next_trains_from_stoptimetable(stop_id, operator_id=operator_id),
-        "priority_3_stop_monitoring": _get_next_trains_from_stopmonitoring(stop_id, operator_id=operator_id),
+        "priority_1_gtfs_realtime": [visit_dict(d) for d in rt],
+        "priority_2_stop_timetable": [visit_dict(d) for d in timetable],
+        "priority_3_stop_monitoring": [visit_dict(d) for d in monitoring],
     }
 
 
-def get_next_trains(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
-    """
-    Next train predictions at a stop (real-time from 511).
+async def _timed(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs); return (result, elapsed ms)."""
+    start = time.perf_counter()
+    result = await fn(*args, **kwargs)
+    return result, round((time.perf_counter() - start) * 1000, 1)
 
-    - stop_id: e.g. "70031" (use get_caltrain_stops() to find IDs).
-    - operator_id: agency, default Caltrain (CT).
-    - limit: max predictions to return; None = all.
 
-    Returns a list of dicts with line_name, destination, expected_*_local, etc.
+async def race_next_trains(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
     """
-    stop_str = str(stop_id)
-
-    visits = _get_next_trains_from_gtfs_rt(stop_id, operator_id=operator_id, limit=None)
-    source = "gtfs_realtime" if visits else None
-    if not visits:
-        visits = _get_next_trains_from_stoptimetable(stop_id, operator_id=operator_id)
-        source = "stop_timetable" if visits else None
-    if not visits:
-        visits = _get_next_trains_from_stopmonitoring(stop_id, operator_id=operator_id)
-        if visits:
-            source = "stop_monitoring"
-
-    def _sort_key(v):
-        t = v.get("expected_departure") or v.get("expected_arrival") or ""
-        return (t == "", t)
+    Like get_next_trains, but returns Departure records (see visit_dict) and metadata about the
+    source race: (departures, source, {"winner", "latency_ms": {source: ms or "cancelled"}, "budget_exceeded"}).
+
+    Sources in priority order: gtfs_realtime, stop_timetable (the GTFS schedule, see
+    _get_next_trains_from_schedule), stop_monitoring. The secondaries are
+    hedged (see NEXT_TRAINS_HEDGE_SEC); a source wins once it is non-empty and every higher-priority
+    source has finished empty. At NEXT_TRAINS_BUDGET_SEC the best finished result wins and the rest
+    are cancelled.
+    """
+    sources = [
+        ("gtfs_realtime", _get_next_trains_from_gtfs_rt, {"limit": limit}),
+        ("stop_timetable", _get_next_trains_from_schedule, {"limit": limit}),
+        ("stop_monitoring", _get_next_trains_from_stopmonitoring, {}),
+    ]
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = [None] * len(sources)
+
+    def launch(i):
+        name, fn, kwargs = sources[i]
+        tasks[i] = asyncio.ensure_future(_timed(fn, stop_id, operator_id=operator_id, **kwargs))
+
+    def outcome(i):
+        task = tasks[i]
+        if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    launch(0)
+    winner = None
+    budget_exceeded = False
+    try:
+        while winner is None:
+            # Decide in priority order: stop at the first source still pending or not launched
+            undecided = False
+            for i, task in enumerate(tasks):
+                if task is None or not task.done():
+                    undecided = True
+                    break
+                result = outcome(i)
+                if result and result[0]:
+                    winner = i
+                    break
+            if winner is not None or not undecided:
+                break
+            now = loop.time()
+            if tasks[1] is None and (tasks[0].done() or now - start >= NEXT_TRAINS_HEDGE_SEC):
+                for i in range(1, len(sources)):
+                    launch(i)
+                continue
+            if now - start >= NEXT_TRAINS_BUDGET_SEC:
+                budget_exceeded = True
+                winner = next((i for i in range(len(tasks)) if outcome(i) and outcome(i)[0]), None)
+                break
+            wake_at = start + (NEXT_TRAINS_HEDGE_SEC if tasks[1] is None else NEXT_TRAINS_BUDGET_SEC)
+            pending = [t for t in tasks if t is not None and not t.done()]
+            await asyncio.wait(pending, timeout=max(0.0, wake_at - now), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+
+    latency_ms = {}
+    for i, task in enumerate(tasks):
+        if task is None:
+            continue
+        result = outcome(i)
+        if result:
+            latency_ms[sources[i][0]] = result[1]
+        else:
+            latency_ms[sources[i][0]] = "error" if task.done() and not task.cancelled() else "cancelled"
+    source = sources[winner][0] if winner is not None else "none"
+    metrics.DEPARTURE_SOURCES.inc(source)
+    visits = list(tasks[winner].result()[0]) if winner is not None else []
+
+    def _sort_key(d):
+        ts = d.expected_departure or d.expected_arrival
+        return (ts is None, ts or 0)
 
     visits.sort(key=_sort_key)
 
     if limit is not None:
         visits = visits[:limit]
-    return visits, source or "none"
+    meta = {"winner": source, "latency_ms": latency_ms, "budget_exceeded": budget_exceeded}
+    return visits, source, meta
+
+
+async def get_next_trains(stop_id, operator_id=CALTRAIN_OPERATOR_ID, limit=None):
+    """
+    Next train predictions at a stop (real-time from 511).
+
+    - stop_id: e.g. "70031" (use get_caltrain_stops() to find IDs).
+    - operator_id: agency, default Caltrain (CT).
+    - limit: max predictions to return; None = all.
+
+    Returns (visits, source): a list of dicts with line_name, destination, expected_*_local, etc.,
+    and which source produced them. See race_next_trains for how sources are chosen.
+    """
+    departures, source, _ = await race_next_trains(stop_id, operator_id=operator_id, limit=limit)
+    return [visit_dict(d) for d in departures], source
 
 
 # Southbound line order (San Francisco to Tamien/Gilroy) for dropdown ordering
@@ -346,28 +676,12 @@ STATION_LINE_ORDER = [
 ]
 
 
-def _station_sort_key(stop):
-    """Order key for line order; stations not in list go at end."""
-    name = _stop_display_name(stop)
-    try:
-        return STATION_LINE_ORDER.index(name)
-    except ValueError:
-        return len(STATION_LINE_ORDER)
-
-
-def _stop_display_name(stop):
-    """Strip direction suffix for display (e.g. 'San Francisco')."""
-    name = (stop.get("Name") or "").replace(" Caltrain Station Northbound", "").replace(" Caltrain Station Southbound", "").strip()
-    return name
+_LINE_INDEX = {name.lower(): i for i, name in enumerate(STATION_LINE_ORDER)}
 
 
-def _stop_line_index(stop):
-    """Index of stop in STATION_LINE_ORDER; len(ORDER) if not found."""
-    name = _stop_display_name(stop)
-    try:
-        return STATION_LINE_ORDER.index(name)
-    except ValueError:
-        return len(STATION_LINE_ORDER)
+def _station_sort_key(stop):
+    """Order key for line order; stations not in list go at end."""
+    return _LINE_INDEX.get(display_name(stop).lower(), len(STATION_LINE_ORDER))
 
 
 def get_direction(from_station, to_station):
@@ -377,18 +691,8 @@ def get_direction(from_station, to_station):
     """
     if not from_station or not to_station:
         return None
-    from_name = str(from_station).strip()
-    to_name = str(to_station).strip()
-    if from_name.lower() == to_name.lower():
-        return None
-    from_idx = to_idx = None
-    for i, name in enumerate(STATION_LINE_ORDER):
-        if name and from_name.lower() == name.lower():
-            from_idx = i
-        if name and to_name.lower() == name.lower():
-            to_idx = i
-        if from_idx is not None and to_idx is not None:
-            break
+    from_idx = _LINE_INDEX.get(str(from_station).strip().lower())
+    to_idx = _LINE_INDEX.get(str(to_station).strip().lower())
     if from_idx is None or to_idx is None:
         return None
     if from_idx < to_idx:
@@ -398,177 +702,349 @@ def get_direction(from_station, to_station):
     return None
 
 
-def get_stops_in_direction(from_station, direction, operator_id=CALTRAIN_OPERATOR_ID):
+async def get_stops_in_direction(from_station, direction, operator_id=CALTRAIN_OPERATOR_ID):
     """
     Stops that are in the given direction from from_station (same format as get_caltrain_stops).
     from_station: station name or id. direction: 'northbound' or 'southbound'.
     Returns list of {id, Name} in line order, excluding the from station itself.
     """
-    from_id, from_name, msg = _resolve_stop(from_station, direction=direction)
+    from_id, from_name, msg = await _resolve_stop(from_station, direction=direction, operator_id=operator_id)
     if not from_id:
         return []
-    stops = get_caltrain_stops(operator_id=operator_id)
-    from_idx = None
-    for st in stops:
-        if st.get("id") == from_id:
-            from_idx = _stop_line_index(st)
-            break
-    if from_idx is None:
-        return []
-    want_south = direction and "south" in direction.lower()
-    result = []
-    seen_display_name = set()
-    for st in stops:
-        idx = _stop_line_index(st)
-        if st.get("id") == from_id:
-            continue
-        if want_south and idx > from_idx:
-            name = _stop_display_name(st)
-            if name not in seen_display_name:
-                seen_display_name.add(name)
-                result.append(st)
-        elif not want_south and idx < from_idx:
-            name = _stop_display_name(st)
-            if name not in seen_display_name:
-                seen_display_name.add(name)
-                result.append(st)
-    return result
+    model = await get_station_model(operator_id=operator_id)
+    want_south = bool(direction and "south" in direction.lower())
+    return list(model.downstream(from_id, want_south))
 
 
-def _gtfs_time_to_seconds(time_str):
-    """Convert GTFS time (HH:MM:SS or H:MM:SS, can be 25:00:00) to seconds since midnight."""
-    if not time_str:
-        return None
-    parts = (time_str or "").strip().split(":")
-    if len(parts) != 3:
-        return None
-    try:
-        h, m, s = int(parts[0]), int(parts[1]), int(parts[2])
-        return h * 3600 + m * 60 + s
-    except (ValueError, TypeError):
-        return None
+def _gtfs_static_bundle(operator_id):
+    bundle = _gtfs_static.get(operator_id)
+    if bundle is None:
+        bundle = _gtfs_static[operator_id] = GtfsStatic(operator_id, API_KEY)
+    return bundle
 
 
-def _build_travel_time_cache(operator_id=CALTRAIN_OPERATOR_ID):
-    """Fetch GTFS, parse stop_times.txt, build (from_id, to_id) -> median minutes. Cached 24h."""
-    global _travel_time_cache, _travel_time_cache_time
-    now = time.time()
-    if _travel_time_cache is not None and (now - _travel_time_cache_time) < TRAVEL_TIME_CACHE_TTL_SEC:
-        return
+async def _load_gtfs_static(operator_id, previous):
+    """
+    Current GtfsData: revalidated with 511 by the bundle, or with shared snapshots on a worker
+    that doesn't poll 511 the compiled feed published in the cache file, memory-mapped.
+    """
+    if shared_snapshot.feed_source() == "upstream":
+        return await _gtfs_static_bundle(operator_id).refresh()
+    shared_snapshot.mark_seen(gtfs_cache.cache_path(operator_id))
+    cached = await asyncio.to_thread(gtfs_cache.load, operator_id, True)
+    if cached is None:
+        raise LookupError(f"no shared GTFS for {operator_id}")
+    data, travel_times, header = cached
+    if previous is not None and previous.version == data.version:
+        return previous
+    _gtfs_static_bundle(operator_id).install(data, header.get("etag"), header.get("last_modified"), header["saved_at"])
+    if travel_times is not None:
+        _travel_times_cache(operator_id).install(TravelTimes(data.version, travel_times))
+    return data
+
+
+def _gtfs_static_cache(operator_id):
+    return _operator_cache("gtfs_static", operator_id, lambda: Cache(
+        f"gtfs_static:{operator_id}",
+        lambda previous: _load_gtfs_static(operator_id, previous),
+        ttl=operator_ttl("gtfs_static", operator_id, GTFS_STATIC_TTL_SEC),
+        # The bundle holds the same GtfsData; drop it too so eviction frees the memory
+        on_evict=lambda: _gtfs_static.pop(operator_id, None),
+    ))
+
+
+def _gtfs_version(operator_id):
+    """Version of the GtfsData currently cached for operator_id (None if not loaded)."""
+    data = _gtfs_static_cache(operator_id).peek()
+    return data.version if data is not None else None
+
+
+async def get_gtfs_static(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Current GtfsData for operator_id (stops, trips, stop_times, calendar), shared by stops,
+    coordinates and travel times. Revalidated with 511 in the background once older than
+    GTFS_STATIC_TTL_SEC; concurrent callers share one download. Raises if it has never been
+    loaded and 511 is unreachable.
+    """
+    return await _gtfs_static_cache(operator_id).get()
+
+
+async def load_gtfs_cache(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Adopt the compiled GTFS (and travel times) from the on-disk cache, if present.
+    Call at startup; then refresh_gtfs_static() in the background to pick up a newer feed.
+    Returns True if a cache file was loaded. The file is read off the event loop; the caches
+    are only touched on it (installing may evict other caches).
+    """
+    # Workers sharing snapshots map the file, so they share its timetable columns
+    cached = await asyncio.to_thread(gtfs_cache.load, operator_id, shared_snapshot.SHARED_SNAPSHOTS)
+    if cached is None:
+        return False
+    shared_snapshot.mark_seen(gtfs_cache.cache_path(operator_id))
+    data, travel_times, header = cached
+    _gtfs_static_bundle(operator_id).install(data, header.get("etag"), header.get("last_modified"), header["saved_at"])
+    _gtfs_static_cache(operator_id).install(data, fetched_at=header["saved_at"])
+    if travel_times is not None:
+        _travel_times_cache(operator_id).install(TravelTimes(data.version, travel_times))
+    return True
+
+
+async def refresh_gtfs_static(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Revalidate the GTFS bundle with 511 now (conditional GET) and rebuild derived data if the
+    feed changed; a changed feed is also written to the on-disk cache.
+    """
     try:
-        r = requests.get(
-            "https://api.511.org/transit/datafeeds",
-            params={"api_key": API_KEY, "operator_id": operator_id},
-        )
-        r.raise_for_status()
-        r.encoding = "utf-8-sig"
+        await _gtfs_static_cache(operator_id).refresh()
+        travel = _travel_times_cache(operator_id)
+        if not travel.is_fresh():
+            await travel.refresh()
     except Exception:
+        pass
+
+
+async def sync_shared_gtfs(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    On a worker that doesn't poll 511 (see shared_snapshot.py), adopt a static GTFS published
+    since the last check: pulled from SNAPSHOT_SOURCE_URL, or written by this host's leader.
+    """
+    source = shared_snapshot.feed_source()
+    if source == "upstream":
         return
-    pairs_minutes = {}  # (from_id, to_id) -> list of minutes
-    with zipfile.ZipFile(io.BytesIO(r.content), "r") as zf:
-        stop_times_file = next((n for n in zf.namelist() if n.lower() == "stop_times.txt"), None)
-        if not stop_times_file:
-            return
-        with zf.open(stop_times_file) as f:
-            reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8"))
-            rows = [row for row in reader]
-    # Group by trip_id, sort by stop_sequence
-    by_trip = {}
-    for row in rows:
-        trip_id = (row.get("trip_id") or "").strip()
-        stop_id = (row.get("stop_id") or "").strip()
-        arr = _gtfs_time_to_seconds(row.get("arrival_time"))
-        dep = _gtfs_time_to_seconds(row.get("departure_time"))
-        seq = (row.get("stop_sequence") or "").strip()
-        try:
-            seq = int(seq)
-        except (ValueError, TypeError):
-            continue
-        if not trip_id or not stop_id or dep is None:
+    if source == "remote":
+        await shared_snapshot.pull(operator_id, "static")
+    if shared_snapshot.changed(gtfs_cache.cache_path(operator_id)):
+        await refresh_gtfs_static(operator_id)
+
+
+def _histogram_median(counts, n):
+    """Median of n values given counts[v] = occurrences of v (same rounding as the sorted-list median)."""
+    def nth(rank):
+        seen = 0
+        for v, c in enumerate(counts):
+            seen += c
+            if seen > rank:
+                return v
+
+    mid = n // 2
+    return nth(mid) if n % 2 else (nth(mid - 1) + nth(mid)) // 2
+
+
+def _travel_times_from_stop_times(stop_times):
+    """
+    Build (from_id, to_id) -> median minutes from GtfsData.stop_times (StopTimes columns).
+    Trips with identical stops and timing offsets, which is most of a timetable, are counted
+    once with a weight. Per-pair minutes go into small integer histograms rather than lists.
+    """
+    st = stop_times
+    offsets = st.trip_offsets
+    patterns = {}  # (stop indexes, departure offsets, arrival offsets) -> number of trips
+    for t in range(len(st.trip_ids)):
+        a, b = offsets[t], offsets[t + 1]
+        if b - a < 2:
             continue
-        by_trip.setdefault(trip_id, []).append((seq, stop_id, dep, arr))
-    for trip_id, stop_list in by_trip.items():
-        stop_list.sort(key=lambda x: x[0])
-        for i in range(len(stop_list)):
-            _, from_id, dep_i, _ = stop_list[i]
-            for j in range(i + 1, len(stop_list)):
-                _, to_id, dep_j, arr_j = stop_list[j]
-                to_time = arr_j if arr_j is not None else dep_j
-                if to_time is None:
+        t0 = st.dep[a]
+        deps = st.dep[a:b]
+        key = (
+            tuple(st.stop[a:b]),
+            tuple(d - t0 for d in deps),
+            tuple((r if r >= 0 else d) - t0 for r, d in zip(st.arr[a:b], deps)),
+        )
+        patterns[key] = patterns.get(key, 0) + 1
+
+    n_stops = len(st.stop_ids)
+    hist = {}  # from_index * n_stops + to_index -> array of counts indexed by minutes
+    for (stops, deps, arrs), weight in patterns.items():
+        for i in range(len(stops)):
+            base = stops[i] * n_stops
+            dep_i = deps[i]
+            for j in range(i + 1, len(stops)):
+                minutes = (arrs[j] - dep_i) // 60
+                if minutes < 0:
                     continue
-                minutes = (to_time - dep_i) // 60
-                if minutes >= 0:
-                    key = (from_id, to_id)
-                    pairs_minutes.setdefault(key, []).append(minutes)
+                counts = hist.get(base + stops[j])
+                if counts is None:
+                    counts = hist[base + stops[j]] = array("I")
+                if minutes >= len(counts):
+                    counts.extend([0] * (minutes + 1 - len(counts)))
+                counts[minutes] += weight
     # Median per pair
-    _travel_time_cache = {}
-    for (from_id, to_id), mins_list in pairs_minutes.items():
-        if mins_list:
-            mins_list.sort()
-            mid = len(mins_list) // 2
-            median = mins_list[mid] if len(mins_list) % 2 else (mins_list[mid - 1] + mins_list[mid]) // 2
-            _travel_time_cache[(from_id, to_id)] = median
-    _travel_time_cache_time = now
+    travel_times = {}
+    for key, counts in hist.items():
+        from_i, to_i = divmod(key, n_stops)
+        travel_times[(st.stop_ids[from_i], st.stop_ids[to_i])] = _histogram_median(counts, sum(counts))
+    return travel_times
+
+
+async def _load_travel_times(operator_id):
+    """Build TravelTimes from the shared GTFS bundle and persist the compiled feed with it."""
+    data = await get_gtfs_static(operator_id=operator_id)
+    table = await asyncio.to_thread(
+        metrics.timed, metrics.GTFS_BUILD_SECONDS, "travel_times", _travel_times_from_stop_times, data.stop_times,
+    )
+    # Persist the compiled feed so the next restart skips the download and build (and, with shared
+    # snapshots, so the other workers adopt it); only a worker that polls 511 writes it
+    bundle = _gtfs_static_bundle(operator_id)
+    try:
+        if shared_snapshot.feed_source() == "upstream":
+            await asyncio.to_thread(gtfs_cache.save, operator_id, data, table, bundle.etag, bundle.last_modified)
+    except OSError:
+        pass
+    return TravelTimes(data.version, table)
+
+
+def _travel_times_cache(operator_id):
+    return _operator_cache("travel_times", operator_id, lambda: Cache(
+        f"travel_times:{operator_id}",
+        lambda previous: _load_travel_times(operator_id),
+        is_current=lambda value: value.version == _gtfs_version(operator_id),
+    ))
 
 
-def get_travel_minutes(from_stop_id, to_stop_id, operator_id=CALTRAIN_OPERATOR_ID):
+async def get_travel_minutes(from_stop_id, to_stop_id, operator_id=CALTRAIN_OPERATOR_ID):
     """
     Typical travel time in minutes from from_stop_id to to_stop_id (from GTFS stop_times).
     Returns int or None if not available.
     """
     if not from_stop_id or not to_stop_id or from_stop_id == to_stop_id:
         return None
-    _build_travel_time_cache(operator_id=operator_id)
-    if _travel_time_cache is None:
+    try:
+        travel = await _travel_times_cache(operator_id).get()
+    except Exception:
         return None
-    return _travel_time_cache.get((str(from_stop_id), str(to_stop_id)))
+    return travel.table.get((str(from_stop_id), str(to_stop_id)))
 
 
-def _fetch_stops_from_gtfs(operator_id=CALTRAIN_OPERATOR_ID, include_coords=False):
+def _trip_timetable_from_stop_times(stop_times):
     """
-    Fetch stop list from 511 GTFS feed (stops.txt). Primary source for stops.
-    If include_coords=True, adds lat/lon when available (for nearest-station lookup).
+    trip_id -> {stop_id: row index into stop_times}, so a trip's times at any stop are two dict
+    lookups plus array reads. A trip that visits a stop twice keeps its first visit.
     """
-    r = requests.get(
-        "https://api.511.org/transit/datafeeds",
-        params={"api_key": API_KEY, "operator_id": operator_id},
+    st = stop_times
+    offsets, stop, stop_ids = st.trip_offsets, st.stop, st.stop_ids
+    timetable = {}
+    for t, trip_id in enumerate(st.trip_ids):
+        rows = {}
+        for k in range(offsets[t], offsets[t + 1]):
+            rows.setdefault(stop_ids[stop[k]], k)
+        timetable[trip_id] = rows
+    return timetable
+
+
+async def _load_trip_timetable(operator_id):
+    data = await get_gtfs_static(operator_id=operator_id)
+    rows = await asyncio.to_thread(
+        metrics.timed, metrics.GTFS_BUILD_SECONDS, "trip_timetable", _trip_timetable_from_stop_times, data.stop_times,
     )
-    r.raise_for_status()
-    r.encoding = "utf-8-sig"
-    stops = []
-    with zipfile.ZipFile(io.BytesIO(r.content), "r") as zf:
-        stop_file = next((n for n in zf.namelist() if n.lower() == "stops.txt"), None)
-        if not stop_file:
-            return stops
-        with zf.open(stop_file) as f:
-            reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8"))
-            for row in reader:
-                location_type = (row.get("location_type") or "").strip()
-                if location_type == "1":
-                    continue
-                stop_id = (row.get("stop_id") or "").strip()
-                stop_name = (row.get("stop_name") or "").strip()
-                if stop_id and stop_name:
-                    s = {"id": stop_id, "Name": stop_name}
-                    if include_coords:
-                        try:
-                            lat = float((row.get("stop_lat") or "").strip())
-                            lon = float((row.get("stop_lon") or "").strip())
-                            s["lat"] = lat
-                            s["lon"] = lon
-                        except (ValueError, TypeError):
-                            pass
-                    stops.append(s)
-    return stops
+    return TripTimetable(data.version, data.stop_times, rows)
 
 
-def _fetch_stops_from_netex(operator_id=CALTRAIN_OPERATOR_ID):
+def _trip_timetable_cache(operator_id):
+    return _operator_cache("trip_timetable", operator_id, lambda: Cache(
+        f"trip_timetable:{operator_id}",
+        lambda previous: _load_trip_timetable(operator_id),
+        is_current=lambda value: value.version == _gtfs_version(operator_id),
+    ))
+
+
+async def get_trip_timetable(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    (StopTimes, trip timetable) for the current GTFS bundle; the timetable is rebuilt when the
+    feed changes. Returns None if GTFS is unavailable.
+    """
+    try:
+        timetable = await _trip_timetable_cache(operator_id).get()
+    except Exception:
+        return None
+    return timetable.stop_times, timetable.rows
+
+
+def _trip_schedule(stop_times, timetable, trip_id, from_id, to_id):
+    """
+    Scheduled (departure at from_id, arrival at to_id, departure at to_id) for trip_id, in seconds
+    since service-day midnight. None if the trip is unknown or doesn't run from_id -> to_id.
+    """
+    rows = timetable.get(trip_id)
+    if rows is None:
+        return None
+    k_from, k_to = rows.get(from_id), rows.get(to_id)
+    if k_from is None or k_to is None or k_to <= k_from:
+        return None
+    dep_to = stop_times.dep[k_to]
+    arr_to = stop_times.arr[k_to]
+    return stop_times.dep[k_from], arr_to if arr_to >= 0 else dep_to, dep_to
+
+
+async def _load_schedule(operator_id):
+    data = await get_gtfs_static(operator_id=operator_id)
+    return await asyncio.to_thread(metrics.timed, metrics.GTFS_BUILD_SECONDS, "schedule", Schedule, data, PACIFIC)
+
+
+def _schedule_cache(operator_id):
+    return _operator_cache("schedule", operator_id, lambda: Cache(
+        f"schedule:{operator_id}",
+        lambda previous: _load_schedule(operator_id),
+        is_current=lambda value: value.version == _gtfs_version(operator_id),
+    ))
+
+
+async def get_schedule(operator_id=CALTRAIN_OPERATOR_ID):
+    """Schedule (per-stop scheduled departures) for the current GTFS bundle, or None if GTFS is unavailable."""
+    try:
+        return await _schedule_cache(operator_id).get()
+    except Exception:
+        return None
+
+
+async def _load_connections(operator_id):
+    data = await get_gtfs_static(operator_id=operator_id)
+    schedules = _schedule_cache(operator_id)
+    schedule = await schedules.get()
+    if schedule.version != data.version:
+        schedule = await schedules.refresh()
+    return await asyncio.to_thread(
+        metrics.timed, metrics.GTFS_BUILD_SECONDS, "connections", ConnectionTimetable, data, schedule,
+    )
+
+
+def _connections_cache(operator_id):
+    return _operator_cache("connections", operator_id, lambda: Cache(
+        f"connections:{operator_id}",
+        lambda previous: _load_connections(operator_id),
+        is_current=lambda value: value.version == _gtfs_version(operator_id),
+    ))
+
+
+@functools.lru_cache(maxsize=16)
+def _service_day_start(date):
+    return service_day_start(date, PACIFIC)
+
+
+def _service_day_base(offset_sec, ts):
+    """Start of the service day (yesterday, today or tomorrow) that puts GTFS time offset_sec closest to ts."""
+    today = datetime.fromtimestamp(ts, tz=PACIFIC).date()
+    bases = [_service_day_start(today + timedelta(days=d)) for d in (-1, 0, 1)]
+    return min(bases, key=lambda base: abs(base + offset_sec - ts))
+
+
+async def _fetch_stops_from_gtfs(operator_id=CALTRAIN_OPERATOR_ID, include_coords=False):
+    """
+    Stop list from the 511 GTFS feed (stops.txt, via the shared bundle). Primary source for stops.
+    If include_coords=True, adds lat/lon when available (for nearest-station lookup).
+    """
+    data = await get_gtfs_static(operator_id=operator_id)
+    if include_coords:
+        return [dict(s) for s in data.stops]
+    return [{"id": s["id"], "Name": s["Name"]} for s in data.stops]
+
+
+async def _fetch_stops_from_netex(operator_id=CALTRAIN_OPERATOR_ID):
     """
     Try 511 NeTEx /transit/stops API. Fallback if GTFS fails or format changes.
     Handles both legacy (ScheduledStopPoint list) and other list shapes.
     """
-    data = _fetch_json(
-        "https://api.511.org/transit/stops",
+    data = await _fetch_json(
+        "stops",
         {"api_key": API_KEY, "operator_id": operator_id, "format": "json"},
     )
     objs = data.get("Contents", {}).get("dataObjects", {})
@@ -596,80 +1072,107 @@ def _filter_stops_for_display(stops):
     ]
 
 
-def get_caltrain_stops(operator_id=CALTRAIN_OPERATOR_ID):
+async def _load_stops(operator_id, previous):
     """
-    List of Caltrain stops (id + name) in line order. Use id with get_next_trains().
-    Excludes elevator, shuttle, and Stanford stops. Future-proof: tries GTFS first,
-    then NeTEx, then cache, then embedded list. Cached 24 hours.
+    StationModel for the stops cache. Tries GTFS, then NeTEx; if both fail, raises so the
+    previous list keeps being served, or on first load falls back to the embedded list.
     """
-    global _stops_cache, _stops_cache_time
-    now = time.time()
-    if _stops_cache is not None and (now - _stops_cache_time) < STOPS_CACHE_TTL_SEC:
-        return _stops_cache
-
     stops = []
     # 1. Primary: GTFS feed (most reliable)
     try:
-        stops = _fetch_stops_from_gtfs(operator_id=operator_id)
+        stops = await _fetch_stops_from_gtfs(operator_id=operator_id)
     except Exception:
         pass
     # 2. Fallback: NeTEx /transit/stops (in case 511 restores or changes format)
     if not stops:
         try:
-            stops = _fetch_stops_from_netex(operator_id=operator_id)
+            stops = await _fetch_stops_from_netex(operator_id=operator_id)
         except Exception:
             pass
-    # 3. Use cache if we have it (e.g. API temporarily down)
-    if not stops and _stops_cache is not None:
-        return _stops_cache
+    # 3. Keep serving the previous list (e.g. API temporarily down)
+    if not stops and previous is not None:
+        raise RuntimeError("no stop source available")
     # 4. Last resort: embedded list so dropdown is never empty
     if not stops:
         stops = list(EMBEDDED_STOPS)
 
     stops = _filter_stops_for_display(stops)
     stops.sort(key=_station_sort_key)
-    _stops_cache = stops
-    _stops_cache_time = now
-    return stops
+    return StationModel(stops, STATION_LINE_ORDER)
 
 
-def _haversine_miles(lat1, lon1, lat2, lon2):
-    """Distance in miles between two (lat, lon) points."""
-    R = 3959  # Earth radius in miles
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlam = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlam / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+def _stops_cache(operator_id):
+    return _operator_cache("stops", operator_id, lambda: Cache(
+        f"stops:{operator_id}",
+        lambda previous: _load_stops(operator_id, previous),
+        ttl=operator_ttl("stops", operator_id, STOPS_CACHE_TTL_SEC),
+    ))
 
 
-def get_caltrain_stops_with_coords(operator_id=CALTRAIN_OPERATOR_ID):
-    """Stops with lat/lon from GTFS (for nearest-station lookup). Cached 24 hours."""
-    global _stops_coords_cache, _stops_coords_cache_time
-    now = time.time()
-    if _stops_coords_cache is not None and (now - _stops_coords_cache_time) < STOPS_CACHE_TTL_SEC:
-        return _stops_coords_cache
-    stops = []
+async def get_station_model(operator_id=CALTRAIN_OPERATOR_ID):
+    """StationModel over the current stop list (rebuilt whenever the list is refreshed)."""
+    return await _stops_cache(operator_id).get()
+
+
+async def get_caltrain_stops(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Caltrain stops (id + name) in line order, as a tuple. Use id with get_next_trains().
+    Excludes elevator, shuttle, and Stanford stops. Future-proof: tries GTFS first,
+    then NeTEx, then cache, then embedded list. Cached 24 hours.
+    """
+    model = await get_station_model(operator_id=operator_id)
+    return model.stops
+
+
+async def search_stations(query, limit=10, operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Autocomplete: stations whose name (or a word in it) starts with query, then close spellings.
+    Returns [{"station", "platforms": [{"direction", "stop_id"}]}] in match order.
+    """
+    model = await get_station_model(operator_id=operator_id)
+    return [
+        {"station": st.name, "platforms": [{"direction": d, "stop_id": s.get("id")} for d, s in st.platforms]}
+        for st in model.search(query, limit=limit)
+    ]
+
+
+async def _load_stops_coords(operator_id):
+    stops = await _fetch_stops_from_gtfs(operator_id=operator_id, include_coords=True)
+    stops = [s for s in stops if "lat" in s and "lon" in s]
+    return StopIndex(_filter_stops_for_display(stops))
+
+
+def _stops_coords_cache(operator_id):
+    return _operator_cache("stops_coords", operator_id, lambda: Cache(
+        f"stops_coords:{operator_id}",
+        lambda previous: _load_stops_coords(operator_id),
+        ttl=operator_ttl("stops_coords", operator_id, STOPS_CACHE_TTL_SEC),
+    ))
+
+
+async def get_stops_spatial_index(operator_id=CALTRAIN_OPERATOR_ID):
+    """StopIndex over the stops that have coordinates (from GTFS), or None if GTFS is unavailable. Cached 24 hours."""
     try:
-        stops = _fetch_stops_from_gtfs(operator_id=operator_id, include_coords=True)
+        return await _stops_coords_cache(operator_id).get()
     except Exception:
-        pass
-    stops = [s for s in stops if "lat" in s and "lon" in s]
-    stops = _filter_stops_for_display(stops)
-    _stops_coords_cache = stops
-    _stops_coords_cache_time = now
-    return stops
+        return None
 
 
-def _display_name_from_stop(stop):
-    """Strip 'Caltrain Station Northbound/Southbound' for display name."""
-    name = (stop.get("Name") or "").strip()
-    return re.sub(r"\s+Caltrain Station (Northbound|Southbound)$", "", name, flags=re.I).strip()
+async def get_caltrain_stops_with_coords(operator_id=CALTRAIN_OPERATOR_ID):
+    """Stops with lat/lon from GTFS (for nearest-station lookup), as a tuple. Cached 24 hours."""
+    index = await get_stops_spatial_index(operator_id=operator_id)
+    return index.stops if index is not None else ()
 
 
-def get_nearest_station(lat, lon, max_miles=10, operator_id=CALTRAIN_OPERATOR_ID):
+def _station_result(stop, miles=None):
+    """{"station", "direction", "stop_id"} for a stop (plus "miles" when given)."""
+    result = {"station": display_name(stop), "direction": stop_direction(stop), "stop_id": stop.get("id")}
+    if miles is not None:
+        result["miles"] = round(miles, 2)
+    return result
+
+
+async def get_nearest_station(lat, lon, max_miles=10, operator_id=CALTRAIN_OPERATOR_ID):
     """
     Find the closest Caltrain station to (lat, lon).
     Returns {"station": display_name, "direction": "northbound"|"southbound"|None} or None if none within max_miles.
@@ -679,27 +1182,30 @@ def get_nearest_station(lat, lon, max_miles=10, operator_id=CALTRAIN_OPERATOR_ID
         lon_f = float(lon)
     except (TypeError, ValueError):
         return None
-    stops = get_caltrain_stops_with_coords(operator_id=operator_id)
-    if not stops:
+    if not valid_point(lat_f, lon_f):
         return None
-    best = None
-    best_mi = float("inf")
-    for s in stops:
-        d = _haversine_miles(lat_f, lon_f, s["lat"], s["lon"])
-        if d <= max_miles and d < best_mi:
-            best_mi = d
-            direction = None
-            name = s.get("Name") or ""
-            if "Northbound" in name:
-                direction = "northbound"
-            elif "Southbound" in name:
-                direction = "southbound"
-            best = {
-                "station": _display_name_from_stop(s),
-                "direction": direction,
-                "stop_id": s.get("id"),
-            }
-    return best
+    index = await get_stops_spatial_index(operator_id=operator_id)
+    hit = index.nearest(lat_f, lon_f, max_miles) if index is not None else None
+    return _station_result(hit[0]) if hit else None
+
+
+async def nearest_stations_batch(points, max_miles=10, radius_miles=None, operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Nearest station and (if radius_miles is given) all stations within radius_miles, for many
+    (lat, lon) points in one vectorised query.
+    Returns [{"nearest": station dict with "miles", or None, "within": [station dicts, nearest first]}] in point order.
+    """
+    index = await get_stops_spatial_index(operator_id=operator_id)
+    if not points or index is None:
+        return [{"nearest": None, "within": []} for _ in points]
+    lats, lons = zip(*points)
+    radius = max(max_miles, radius_miles or 0)
+    results = []
+    for hits in index.query(lats, lons, radius):
+        nearest = hits[0] if hits and hits[0][1] <= max_miles else None
+        within = [_station_result(s, m) for s, m in hits if m <= radius_miles] if radius_miles else []
+        results.append({"nearest": _station_result(*nearest) if nearest else None, "within": within})
+    return results
 
 
 def _normalize_direction(direction):
@@ -714,41 +1220,19 @@ def _normalize_direction(direction):
     return None
 
 
-def _resolve_stop(stop_id_or_name, direction=None):
+async def _resolve_stop(stop_id_or_name, direction=None, operator_id=CALTRAIN_OPERATOR_ID):
     """
-    Resolve stop ID or name to (stop_id, stop_name).
+    Resolve stop ID or name to (stop_id, stop_name) among operator_id's stations.
     direction: "northbound"/"north" or "southbound"/"south" when name matches multiple platforms.
     Returns (stop_id, stop_name, message). message is set when ambiguous (no direction given).
     """
     if not stop_id_or_name:
         return None, None, None
-    s = str(stop_id_or_name).strip()
-    # If it looks like an ID (all digits), use it
-    if s.isdigit():
-        stops = get_caltrain_stops()
-        for st in stops:
-            if st.get("id") == s:
-                return s, st.get("Name"), None
-        return s, None, None
-    # Search by name (case-insensitive substring)
-    stops = get_caltrain_stops()
-    name_lower = s.lower()
-    matches = [st for st in stops if name_lower in (st.get("Name") or "").lower()]
-    if not matches:
-        return None, None, None
-    if len(matches) == 1:
-        st = matches[0]
-        return st.get("id"), st.get("Name"), None
-    # Multiple matches (e.g. Northbound + Southbound) — filter by direction
-    want_dir = _normalize_direction(direction)
-    if want_dir:
-        for st in matches:
-            if want_dir in (st.get("Name") or ""):
-                return st.get("id"), st.get("Name"), None
-        return None, None, None
-    return None, None, "Multiple stops match. Specify direction: Northbound or Southbound."
+    model = await get_station_model(operator_id=operator_id)
+    return model.resolve(stop_id_or_name, direction=_normalize_direction(direction))
 
 
+@functools.lru_cache(maxsize=256)
 def _service_tag(line_ref):
     """Derive short service tag from 511 LineRef (e.g. 'Local Weekday' -> 'Local')."""
     if not line_ref:
@@ -767,52 +1251,255 @@ def _service_tag(line_ref):
     return line_ref.strip() or None
 
 
-def _minutes_until(iso_utc_str):
-    """Minutes from now until the given UTC ISO time; None if unparseable."""
-    if not iso_utc_str:
+def next_trains_data_version(operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Versions of the cached data a GTFS-Realtime next_trains answer is computed from (realtime
+    snapshot, GTFS feed, stop list), without loading anything. None if any is not cached.
+    """
+    snap = _gtfs_rt_cache(operator_id).peek()
+    model = _stops_cache(operator_id).peek()
+    if snap is None or model is None:
         return None
-    try:
-        dt = datetime.fromisoformat(iso_utc_str.replace("Z", "+00:00"))
-        now = datetime.now(timezone.utc)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        delta = dt - now
-        return int(delta.total_seconds() / 60)
-    except (ValueError, TypeError):
+    return snap.version, _gtfs_version(operator_id), model.version
+
+
+def _trip_arrival(trip_timetable, rt_trips, trip_id, from_id, to_id, dep_ts):
+    """
+    (travel_minutes, scheduled_arrival, arrival) at to_id for one train, or None if its trip isn't
+    in the timetable. arrival is the GTFS-RT prediction at to_id when the feed has one (less the
+    scheduled dwell, since predictions are departures), else the train's departure plus its
+    scheduled running time.
+    """
+    if trip_timetable is None or not trip_id or dep_ts is None:
+        return None
+    schedule = _trip_schedule(*trip_timetable, trip_id, from_id, to_id)
+    if schedule is None:
         return None
+    sched_dep, sched_arr, sched_dep_to = schedule
+    arrival_ts = dep_ts + sched_arr - sched_dep
+    rt = rt_trips.get(trip_id, {}).get(to_id)
+    if rt is not None and rt.ts - (sched_dep_to - sched_arr) >= dep_ts:
+        arrival_ts = rt.ts - (sched_dep_to - sched_arr)
+    scheduled_ts = _service_day_base(sched_dep, dep_ts) + sched_arr
+    return (arrival_ts - dep_ts) // 60, _epoch_to_local(scheduled_ts), _epoch_to_local(arrival_ts)
 
 
-def next_trains(stop_id_or_name, limit=5, direction=None, to_stop=None):
+async def next_trains(stop_id_or_name, limit=5, direction=None, to_stop=None, operator_id=CALTRAIN_OPERATOR_ID):
     """
-    Next trains at a stop. Pass stop by ID (e.g. "70031") or name (e.g. "San Francisco").
+    Next trains at one of operator_id's stops (default Caltrain). Pass stop by ID (e.g. "70031") or name
+    (e.g. "San Francisco").
     For names that match two platforms, pass direction: "northbound" or "southbound".
     If to_stop (name or id) is given, each train includes travel_minutes from this stop to to_stop.
+    Trains found in the GTFS timetable (by trip_id) also get scheduled_arrival and arrival (realtime-adjusted)
+    at to_stop and their own travel_minutes; other trains get the median travel time for the pair.
 
-    Returns dict: {"stop_id", "stop_name", "trains": [{"service", "destination", "time", "minutes_until", "travel_minutes"?}, ...], "message"}.
+    Returns dict: {"stop_id", "stop_name", "trains": [{"service", "destination", "time", "minutes_until",
+    "travel_minutes"?, "arrival"?, "scheduled_arrival"?}, ...], "message"}.
     """
-    stop_id, stop_name, message = _resolve_stop(stop_id_or_name, direction=direction)
+    stop_id, stop_name, message = await _resolve_stop(stop_id_or_name, direction=direction, operator_id=operator_id)
     if not stop_id:
         return {"stop_id": None, "stop_name": None, "trains": [], "message": message}
     to_id = None
     if to_stop:
-        to_id, _, _ = _resolve_stop(to_stop, direction=direction)
-    travel_min = get_travel_minutes(stop_id, to_id) if to_id else None
-    raw, source = get_next_trains(stop_id, limit=limit)
+        to_id, _, _ = await _resolve_stop(to_stop, direction=direction, operator_id=operator_id)
+    travel_min = await get_travel_minutes(stop_id, to_id, operator_id=operator_id) if to_id else None
+    trip_timetable = await get_trip_timetable(operator_id=operator_id) if to_id else None
+    raw, source, source_meta = await race_next_trains(stop_id, operator_id=operator_id, limit=limit)
+    snap = _gtfs_rt_cache(operator_id).peek()
+    rt_trips = snap.trips if snap is not None else {}
+    return {
+        "stop_id": stop_id,
+        "stop_name": stop_name,
+        "trains": _format_trains(raw, stop_id, to_id, travel_min, trip_timetable, rt_trips, time.time()),
+        "message": None,
+        "data_source": source,
+        "data_source_meta": source_meta,
+    }
+
+
+def _format_trains(raw, stop_id, to_id, travel_min, trip_timetable, rt_trips, now):
+    """
+    next_trains "trains" entries for Departure records from any source (see next_trains).
+    now (epoch seconds) is captured once per response, so every train counts minutes from the same instant.
+    """
     trains = []
     for t in raw:
-        line_ref = t.get("line_ref") or ""
-        service = _service_tag(line_ref) or (t.get("line_name") or "").strip() or "—"
-        dest = (t.get("destination") or "").strip() or "—"
-        exp_dep = t.get("expected_departure") or t.get("expected_arrival")
-        time_str = t.get("expected_departure_local") or t.get("expected_arrival_local") or "—"
-        minutes_until = _minutes_until(exp_dep) if exp_dep else None
+        service = _service_tag(t.line_ref) or (t.line_name or "").strip() or "—"
+        dest = (t.destination or "").strip() or "—"
+        dep_ts = t.expected_departure or t.expected_arrival
         train = {
             "service": service,
             "destination": dest,
-            "time": time_str,
-            "minutes_until": minutes_until,
+            "time": _epoch_to_local(dep_ts) if dep_ts is not None else "—",
+            "minutes_until": int((dep_ts - now) / 60) if dep_ts is not None else None,
         }
-        if travel_min is not None:
-            train["travel_minutes"] = travel_min
+        if to_id:
+            arrival = _trip_arrival(trip_timetable, rt_trips, t.trip_id, stop_id, to_id, dep_ts)
+            if arrival is not None:
+                train["travel_minutes"], train["scheduled_arrival"], train["arrival"] = arrival
+            elif travel_min is not None:
+                train["travel_minutes"] = travel_min
         trains.append(train)
-    return {"stop_id": stop_id, "stop_name": stop_name, "trains": trains, "message": None, "data_source": source}
+    return trains
+
+
+async def next_trains_batch(queries, operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    next_trains for several of operator_id's stops at once, all answered from one GTFS-Realtime snapshot.
+    queries: list of {"stop", "direction"?, "to"?, "limit"?} (as the next_trains arguments).
+    The snapshot, stop list and GTFS timetable are fetched once, so each query costs only its
+    index lookups; a query with no realtime departures falls back to race_next_trains on its own
+    (those run concurrently).
+
+    Returns {"data_source", "feed_timestamp", "fetched_at", "results": [next_trains result, ...]}.
+    data_source is "gtfs_realtime" when a snapshot was available (else None) and feed_timestamp
+    its header timestamp; a result's own data_source differs only when it fell back.
+    """
+    snap = await _get_gtfs_rt_snapshot(operator_id=operator_id)
+    model = await get_station_model(operator_id=operator_id)
+    resolved = []
+    for q in queries:
+        direction = _normalize_direction(q.get("direction"))
+        stop_id, stop_name, message = model.resolve(q["stop"], direction) if q.get("stop") else (None, None, None)
+        to_id = model.resolve(q["to"], direction)[0] if stop_id and q.get("to") else None
+        resolved.append((stop_id, stop_name, message, to_id, q.get("limit", 5)))
+    needs_to = any(r[3] for r in resolved)
+    trip_timetable = await get_trip_timetable(operator_id=operator_id) if needs_to else None
+    rt_trips = snap.trips if snap is not None else {}
+    now = time.time()
+
+    async def answer(stop_id, stop_name, message, to_id, limit):
+        if not stop_id:
+            return {"stop_id": None, "stop_name": None, "trains": [], "message": message}
+        travel_min = await get_travel_minutes(stop_id, to_id, operator_id=operator_id) if to_id else None
+        raw = _gtfs_rt_visits(snap, stop_id, limit=limit) if snap is not None else []
+        source, source_meta = "gtfs_realtime", None
+        if raw:
+            metrics.DEPARTURE_SOURCES.inc(source)
+        else:
+            raw, source, source_meta = await race_next_trains(stop_id, operator_id=operator_id, limit=limit)
+        return {
+            "stop_id": stop_id,
+            "stop_name": stop_name,
+            "trains": _format_trains(raw, stop_id, to_id, travel_min, trip_timetable, rt_trips, now),
+            "message": None,
+            "data_source": source,
+            "data_source_meta": source_meta,
+        }
+
+    results = await asyncio.gather(*(answer(*r) for r in resolved))
+    return {
+        "data_source": "gtfs_realtime" if snap is not None else None,
+        "feed_timestamp": (snap.feed.header.timestamp or None) if snap is not None else None,
+        "fetched_at": round(snap.fetched_at, 3) if snap is not None else None,
+        "results": list(results),
+    }
+
+
+# Furthest from now a journey may be planned (beyond it, timestamps stop being plausible)
+DEPART_AT_WINDOW_SEC = 366 * 86400
+
+
+def parse_depart_at(value):
+    """
+    Departure time for plan_journey -> epoch seconds, or None if unparseable or more than
+    DEPART_AT_WINDOW_SEC from now. Accepts epoch seconds, ISO 8601 (Pacific if no offset) or
+    "HH:MM" (today, Pacific).
+    """
+    value = (value or "").strip()
+    try:
+        if value.isdigit():
+            ts = int(value)
+        else:
+            if len(value) <= 5 and ":" in value:
+                h, m = (int(x) for x in value.split(":"))
+                dt = datetime.now(PACIFIC).replace(hour=h, minute=m, second=0, microsecond=0)
+            else:
+                dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                if dt.tzinfo is None:
+                    dt = dt.replace(tzinfo=PACIFIC)
+            ts = int(dt.timestamp())
+    except (ValueError, TypeError, OverflowError, OSError):
+        return None
+    if abs(ts - time.time()) > DEPART_AT_WINDOW_SEC:
+        return None
+    return ts
+
+
+def _journey_leg(model, leg):
+    def station_name(stop_id):
+        st = model.station_of(stop_id)
+        return st.name if st is not None else stop_id
+
+    return {
+        "trip_id": leg.trip_id,
+        "service": _service_tag(leg.route_id) or leg.route_id or "—",
+        "destination": leg.headsign or "—",
+        "from_stop_id": leg.from_stop,
+        "from": station_name(leg.from_stop),
+        "to_stop_id": leg.to_stop,
+        "to": station_name(leg.to_stop),
+        "departure": _epoch_to_local(leg.departure),
+        "arrival": _epoch_to_local(leg.arrival),
+        "minutes": (leg.arrival - leg.departure) // 60,
+    }
+
+
+async def plan_journey(from_station, to_station, depart_ts=None, max_transfers=MAX_LEGS - 1,
+                       operator_id=CALTRAIN_OPERATOR_ID):
+    """
+    Itineraries between two stations (IDs or names; any platform) leaving at or after depart_ts
+    (epoch seconds, default now), from the GTFS timetable shifted by GTFS-Realtime delays: the
+    earliest arrival with no transfer, then each strictly earlier arrival with one more transfer.
+
+    Returns dict: {"from", "to", "depart_at", "realtime", "itineraries": [{"departure", "arrival",
+    "minutes_until", "duration_minutes", "transfers", "legs": [...]}], "message"}.
+    """
+    model = await get_station_model(operator_id)
+    origin, dest = model.find_station(from_station), model.find_station(to_station)
+    result = {
+        "from": origin.name if origin else None,
+        "to": dest.name if dest else None,
+        "depart_at": None,
+        "realtime": False,
+        "itineraries": [],
+        "message": None,
+    }
+    if origin is None or dest is None:
+        result["message"] = f"Unknown station: {from_station if origin is None else to_station}"
+        return result
+    if origin == dest:
+        result["message"] = "From and To are the same station."
+        return result
+    try:
+        timetable = await _connections_cache(operator_id).get()
+    except Exception:
+        result["message"] = "Timetable unavailable."
+        return result
+    snap = await _get_gtfs_rt_snapshot(operator_id=operator_id)
+    now = int(time.time())
+    depart_ts = now if depart_ts is None else int(depart_ts)
+    itineraries = timetable.plan(
+        [p["id"] for _, p in origin.platforms],
+        [p["id"] for _, p in dest.platforms],
+        depart_ts,
+        rt_trips=snap.trips if snap is not None else None,
+        rt_version=snap.version if snap is not None else None,
+        max_legs=max(0, max_transfers) + 1,
+    )
+    result["depart_at"] = _epoch_to_local(depart_ts)
+    result["realtime"] = snap is not None
+    result["itineraries"] = [
+        {
+            "departure": _epoch_to_local(it.departure),
+            "arrival": _epoch_to_local(it.arrival),
+            "minutes_until": (it.departure - now) // 60,
+            "duration_minutes": (it.arrival - it.departure) // 60,
+            "transfers": it.transfers,
+            "legs": [_journey_leg(model, leg) for leg in it.legs],
+        }
+        for it in itineraries
+    ]
+    if not itineraries:
+        result["message"] = "No trains found."
+    return result
@@ -0,0 +1,165 @@
+"""
+On-disk cache of compiled static GTFS, so a restarted container serves stops, coordinates,
+travel times and the timetable in milliseconds instead of re-downloading the zip.
+
+File layout (one file per operator):
+  MAGIC | u32 FORMAT_VERSION | u32 header length | JSON header | column bytes
+The JSON header holds the small tables (stops, trips, calendar) and the column directory;
+stop_times and the travel-time matrix are stored as typed integer arrays. The header
+records the feed's sha1 (GtfsData.version) so a stale cache is detected by comparing it
+with the feed 511 currently serves.
+
+load(use_mmap=True) maps the file instead of reading it: the stop_times columns are then
+read-only memoryviews over the mapping, so every worker process of a host shares one copy of
+the timetable through the page cache (see shared_snapshot.py). save() replaces the file
+atomically, and a mapping keeps the old file alive until its views are gone.
+"""
+
+import contextlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+
+try:
+    from backend.gtfs_static import GtfsData, StopTimes, Trip
+except ModuleNotFoundError:
+    from gtfs_static import GtfsData, StopTimes, Trip
+
+MAGIC = b"CTGTFS\0"
+FORMAT_VERSION = 2
+
+GTFS_CACHE_DIR = Path(os.getenv("GTFS_CACHE_DIR") or Path(__file__).resolve().parent / ".gtfs_cache")
+
+
+def cache_path(operator_id):
+    return GTFS_CACHE_DIR / f"gtfs_{operator_id}.bin"
+
+
+def _columns(data, travel_times):
+    """StopTimes columns as-is, plus the travel-time matrix as arrays over the same stop IDs."""
+    st = data.stop_times
+    stop_ids = list(st.stop_ids)
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    def intern(stop_id):
+        i = stop_index.get(stop_id)
+        if i is None:
+            i = stop_index[stop_id] = len(stop_ids)
+            stop_ids.append(stop_id)
+        return i
+
+    cols = {
+        "trip_offsets": st.trip_offsets, "st_stop": st.stop, "st_seq": st.seq, "st_dep": st.dep, "st_arr": st.arr,
+        "tt_from": array("I"), "tt_to": array("I"), "tt_minutes": array("i"),
+    }
+    for (from_id, to_id), minutes in (travel_times or {}).items():
+        cols["tt_from"].append(intern(from_id))
+        cols["tt_to"].append(intern(to_id))
+        cols["tt_minutes"].append(minutes)
+    return stop_ids, list(st.trip_ids), cols
+
+
+def save(operator_id, data, travel_times, etag=None, last_modified=None):
+    """Write data (+ its travel-time matrix) to the operator's cache file atomically."""
+    stop_ids, trip_ids, cols = _columns(data, travel_times)
+    header = {
+        "version": data.version,
+        "etag": etag,
+        "last_modified": last_modified,
+        "saved_at": time.time(),
+        "byteorder": sys.byteorder,
+        "stops": data.stops,
+        "trips": {k: list(v) for k, v in data.trips.items()},
+        "calendar": data.calendar,
+        "calendar_dates": data.calendar_dates,
+        "stop_ids": stop_ids,
+        "trip_ids": trip_ids,
+        "has_travel_times": travel_times is not None,
+        # array.array typecode, or the format of a memoryview column (data loaded with use_mmap)
+        "columns": [[name, getattr(col, "typecode", None) or col.format, len(col)] for name, col in cols.items()],
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    path = cache_path(operator_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A temp file of its own per writer: several workers may save the same feed at once
+    fd, tmp = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<II", FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for col in cols.values():
+                f.write(col)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def load(operator_id, use_mmap=False):
+    """
+    Read the operator's cache file. Returns (GtfsData, travel_times or None, header) or None
+    if the file is missing, from another format version, truncated or unreadable. With use_mmap the
+    stop_times columns are views of the mapped file rather than copies.
+    """
+    try:
+        with open(cache_path(operator_id), "rb") as f:
+            raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else f.read()
+        if raw[:len(MAGIC)] != MAGIC:
+            return None
+        pos = len(MAGIC)
+        fmt, header_len = struct.unpack_from("<II", raw, pos)
+        if fmt != FORMAT_VERSION:
+            return None
+        pos += 8
+        header = json.loads(raw[pos:pos + header_len])
+        pos += header_len
+        cols = {}
+        swap = header["byteorder"] != sys.byteorder
+        for name, code, length in header["columns"]:
+            col = array(code)
+            end = pos + length * col.itemsize
+            if end > len(raw):
+                return None
+            if use_mmap and not swap:
+                col = memoryview(raw)[pos:end].cast(code)
+            else:
+                col.frombytes(raw[pos:end])
+                if swap:
+                    col.byteswap()
+            cols[name] = col
+            pos = end
+        if pos != len(raw):
+            return None
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+    stop_ids = header["stop_ids"]
+    # Travel-time stop IDs are appended after the stop_times ones; StopTimes only indexes the latter
+    stop_times = StopTimes(
+        stop_ids, header["trip_ids"], cols["trip_offsets"],
+        cols["st_stop"], cols["st_seq"], cols["st_dep"], cols["st_arr"],
+    )
+    travel_times = None
+    if header["has_travel_times"]:
+        travel_times = {
+            (stop_ids[f], stop_ids[t]): m for f, t, m in zip(cols["tt_from"], cols["tt_to"], cols["tt_minutes"])
+        }
+    calendar = {k: dict(v, days=tuple(v["days"])) for k, v in header["calendar"].items()}
+    calendar_dates = {k: [tuple(d) for d in v] for k, v in header["calendar_dates"].items()}
+    data = GtfsData(
+        version=header["version"],
+        stops=header["stops"],
+        trips={k: Trip(*v) for k, v in header["trips"].items()},
+        stop_times=stop_times,
+        calendar=calendar,
+        calendar_dates=calendar_dates,
+    )
+    return data, travel_times, header
@@ -0,0 +1,272 @@
+"""
+Static GTFS bundle from 511 /transit/datafeeds, shared by stops, coordinates and travel times.
+
+GtfsStatic downloads an operator's GTFS zip once and parses stops, stop_times, trips,
+calendar and calendar_dates into one immutable GtfsData. Refreshes are conditional GETs
+(If-None-Match / If-Modified-Since), so an unchanged feed is not downloaded again.
+"""
+
+import asyncio
+import csv
+import hashlib
+import io
+import time
+import zipfile
+from array import array
+from collections import namedtuple
+
+# Support both: run from repo root (backend.upstream) and from app root (upstream, e.g. Docker)
+try:
+    from backend import metrics, upstream
+except ModuleNotFoundError:
+    import metrics
+    import upstream
+
+# version: sha1 of the zip, so derived caches can tell whether the feed changed.
+# stops: [{"id", "Name", "lat"?, "lon"?}] excluding parent stations (location_type 1)
+# trips: trip_id -> Trip
+# stop_times: StopTimes (columnar, grouped by trip, ordered by stop_sequence)
+# calendar: service_id -> {"days": (mon..sun bools), "start_date": "YYYYMMDD", "end_date": "YYYYMMDD"}
+# calendar_dates: service_id -> [("YYYYMMDD", exception_type)]
+GtfsData = namedtuple("GtfsData", "version stops trips stop_times calendar calendar_dates")
+Trip = namedtuple("Trip", "route_id service_id headsign direction_id")
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def gtfs_time_to_seconds(time_str):
+    """Convert GTFS time (HH:MM:SS or H:MM:SS, can be 25:00:00) to seconds since midnight."""
+    if not time_str:
+        return None
+    parts = (time_str or "").strip().split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        h, m, s = int(parts[0]), int(parts[1]), int(parts[2])
+        return h * 3600 + m * 60 + s
+    except (ValueError, TypeError):
+        return None
+
+
+class StopTimes:
+    """
+    stop_times.txt as compact integer columns, grouped by trip and ordered by stop_sequence.
+    Rows of trip t are trip_offsets[t]:trip_offsets[t + 1]; stop[k] indexes stop_ids;
+    dep/arr are seconds since service-day midnight (arr is -1 when the feed omits it).
+    """
+
+    __slots__ = ("stop_ids", "trip_ids", "trip_offsets", "stop", "seq", "dep", "arr", "_trip_index")
+
+    def __init__(self, stop_ids, trip_ids, trip_offsets, stop, seq, dep, arr):
+        self.stop_ids = stop_ids
+        self.trip_ids = trip_ids
+        self.trip_offsets = trip_offsets
+        self.stop = stop
+        self.seq = seq
+        self.dep = dep
+        self.arr = arr
+        self._trip_index = {trip_id: t for t, trip_id in enumerate(trip_ids)}
+
+    def __len__(self):
+        return len(self.stop)
+
+    def trip_range(self, trip_id):
+        """range of row indexes for trip_id (empty if unknown)."""
+        t = self._trip_index.get(trip_id)
+        if t is None:
+            return range(0)
+        return range(self.trip_offsets[t], self.trip_offsets[t + 1])
+
+    def rows(self, trip_id):
+        """[(stop_sequence, stop_id, departure_sec, arrival_sec or None)] for one trip."""
+        return [
+            (self.seq[k], self.stop_ids[self.stop[k]], self.dep[k], self.arr[k] if self.arr[k] >= 0 else None)
+            for k in self.trip_range(trip_id)
+        ]
+
+
+def _read_csv(zf, filename):
+    """Yield rows of filename (case-insensitive) from the zip as dicts; nothing if the file is absent."""
+    name = next((n for n in zf.namelist() if n.lower() == filename), None)
+    if not name:
+        return
+    with zf.open(name) as f:
+        yield from csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
+
+
+def _parse_stops(zf):
+    stops = []
+    for row in _read_csv(zf, "stops.txt"):
+        if (row.get("location_type") or "").strip() == "1":
+            continue
+        stop_id = (row.get("stop_id") or "").strip()
+        stop_name = (row.get("stop_name") or "").strip()
+        if not stop_id or not stop_name:
+            continue
+        s = {"id": stop_id, "Name": stop_name}
+        try:
+            s["lat"] = float((row.get("stop_lat") or "").strip())
+            s["lon"] = float((row.get("stop_lon") or "").strip())
+        except (ValueError, TypeError):
+            s.pop("lat", None)
+        stops.append(s)
+    return stops
+
+
+def _parse_trips(zf):
+    trips = {}
+    for row in _read_csv(zf, "trips.txt"):
+        trip_id = (row.get("trip_id") or "").strip()
+        if trip_id:
+            trips[trip_id] = Trip(
+                (row.get("route_id") or "").strip(),
+                (row.get("service_id") or "").strip(),
+                (row.get("trip_headsign") or "").strip(),
+                (row.get("direction_id") or "").strip(),
+            )
+    return trips
+
+
+def _parse_stop_times(zf):
+    """
+    Stream stop_times.txt row by row into StopTimes columns (no per-row dicts or tuples kept).
+    Rows are re-ordered by (trip, stop_sequence) only if the file isn't already grouped that way.
+    """
+    stop_ids, stop_index = [], {}
+    trip_ids, trip_index = [], {}
+    trip, stop, seq, dep, arr = array("I"), array("I"), array("i"), array("i"), array("i")
+    name = next((n for n in zf.namelist() if n.lower() == "stop_times.txt"), None)
+    if name:
+        with zf.open(name) as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding="utf-8-sig"))
+            header = [h.strip() for h in next(reader, [])]
+            try:
+                i_trip, i_stop, i_seq = header.index("trip_id"), header.index("stop_id"), header.index("stop_sequence")
+                i_arr, i_dep = header.index("arrival_time"), header.index("departure_time")
+            except ValueError:
+                header = None
+            for row in reader if header else ():
+                try:
+                    trip_id, stop_id = row[i_trip].strip(), row[i_stop].strip()
+                    seq_n = int(row[i_seq].strip())
+                except (IndexError, ValueError):
+                    continue
+                dep_s = gtfs_time_to_seconds(row[i_dep])
+                if not trip_id or not stop_id or dep_s is None:
+                    continue
+                arr_s = gtfs_time_to_seconds(row[i_arr])
+                t = trip_index.get(trip_id)
+                if t is None:
+                    t = trip_index[trip_id] = len(trip_ids)
+                    trip_ids.append(trip_id)
+                st = stop_index.get(stop_id)
+                if st is None:
+                    st = stop_index[stop_id] = len(stop_ids)
+                    stop_ids.append(stop_id)
+                trip.append(t)
+                stop.append(st)
+                seq.append(seq_n)
+                dep.append(dep_s)
+                arr.append(-1 if arr_s is None else arr_s)
+    n = len(trip)
+    if any(trip[k] > trip[k + 1] or (trip[k] == trip[k + 1] and seq[k] > seq[k + 1]) for k in range(n - 1)):
+        order = sorted(range(n), key=lambda k: (trip[k], seq[k]))
+        trip, stop, seq, dep, arr = (array(col.typecode, (col[k] for k in order)) for col in (trip, stop, seq, dep, arr))
+    offsets = array("I", [0] * (len(trip_ids) + 1))
+    for t in trip:
+        offsets[t + 1] += 1
+    for t in range(len(trip_ids)):
+        offsets[t + 1] += offsets[t]
+    return StopTimes(stop_ids, trip_ids, offsets, stop, seq, dep, arr)
+
+
+def _parse_calendar(zf):
+    calendar = {}
+    for row in _read_csv(zf, "calendar.txt"):
+        service_id = (row.get("service_id") or "").strip()
+        if service_id:
+            calendar[service_id] = {
+                "days": tuple((row.get(d) or "").strip() == "1" for d in WEEKDAYS),
+                "start_date": (row.get("start_date") or "").strip(),
+                "end_date": (row.get("end_date") or "").strip(),
+            }
+    return calendar
+
+
+def _parse_calendar_dates(zf):
+    dates = {}
+    for row in _read_csv(zf, "calendar_dates.txt"):
+        service_id = (row.get("service_id") or "").strip()
+        date = (row.get("date") or "").strip()
+        try:
+            exception_type = int((row.get("exception_type") or "").strip())
+        except (ValueError, TypeError):
+            continue
+        if service_id and date:
+            dates.setdefault(service_id, []).append((date, exception_type))
+    return dates
+
+
+def parse_gtfs_zip(content):
+    """Parse a GTFS zip (bytes) into GtfsData. CPU-bound; run it off the event loop."""
+    with zipfile.ZipFile(io.BytesIO(content), "r") as zf:
+        return GtfsData(
+            version=hashlib.sha1(content).hexdigest(),
+            stops=_parse_stops(zf),
+            trips=_parse_trips(zf),
+            stop_times=_parse_stop_times(zf),
+            calendar=_parse_calendar(zf),
+            calendar_dates=_parse_calendar_dates(zf),
+        )
+
+
+class GtfsStatic:
+    """
+    One operator's static GTFS feed. `data` is the current GtfsData (None until first load)
+    and is replaced as a whole on refresh, so readers never see a half-updated bundle.
+    """
+
+    def __init__(self, operator_id, api_key):
+        self.operator_id = operator_id
+        self.api_key = api_key
+        self.data = None
+        self.checked_at = 0
+        self.etag = None
+        self.last_modified = None
+
+    def install(self, data, etag=None, last_modified=None, checked_at=0):
+        """Adopt previously compiled data (e.g. from the on-disk cache) with its HTTP validators."""
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+
+    async def refresh(self):
+        """
+        Revalidate with 511 and re-parse only if the zip changed. Returns the current GtfsData.
+        Raises if the download fails and nothing was loaded before.
+        """
+        headers = {}
+        if self.data is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        try:
+            r = await upstream.fetch_response(
+                "datafeeds", {"api_key": self.api_key, "operator_id": self.operator_id}, headers=headers,
+            )
+        except Exception:
+            if self.data is None:
+                raise
+            return self.data
+        if r.status_code != 304:
+            data = await asyncio.to_thread(
+                metrics.timed, metrics.GTFS_BUILD_SECONDS, "parse_zip", parse_gtfs_zip, r.content,
+            )
+            if self.data is None or data.version != self.data.version:
+                self.data = data
+            self.etag = r.headers.get("ETag")
+            self.last_modified = r.headers.get("Last-Modified")
+        self.checked_at = time.time()
+        return self.data
@@ -0,0 +1,128 @@
+"""
+In-memory health of the 511 endpoints the app depends on.
+
+Every upstream request (see upstream.fetch_response) records its outcome and latency here,
+and the background prober in server.py fills in endpoints that real traffic hasn't touched
+recently. /api/health only reads this state; it never calls 511 itself.
+"""
+
+import time
+from bisect import bisect_left
+
+# Endpoints reported by /api/health (paths under /transit)
+ENDPOINTS = ("tripupdates", "stoptimetable", "StopMonitoring", "datafeeds")
+
+# Latency histogram upper bounds in ms (the last bucket is everything slower)
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Consecutive failures before an endpoint is reported "down" rather than "degraded"
+DOWN_AFTER_FAILURES = 3
+
+
+class EndpointHealth:
+    """Outcome counters, latency histogram and last success/failure for one endpoint."""
+
+    __slots__ = ("requests", "failures", "consecutive_failures", "buckets", "latency_sum_ms",
+                 "last_latency_ms", "last_success", "last_failure", "last_error")
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+        self.last_latency_ms = None
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+
+    def record(self, ok, latency_ms, error=None, now=None):
+        now = time.time() if now is None else now
+        self.requests += 1
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.latency_sum_ms += latency_ms
+        self.last_latency_ms = latency_ms
+        if ok:
+            self.consecutive_failures = 0
+            self.last_success = now
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = now
+            self.last_error = error
+
+    def last_seen(self):
+        """Time of the most recent request, success or not (None if never)."""
+        return max(self.last_success or 0, self.last_failure or 0) or None
+
+    def status(self):
+        """"unknown" (never requested), "ok", "degraded" (last request failed) or "down"."""
+        if self.requests == 0:
+            return "unknown"
+        if self.consecutive_failures >= DOWN_AFTER_FAILURES:
+            return "down"
+        if self.consecutive_failures:
+            return "degraded"
+        return "ok"
+
+    def to_dict(self):
+        return {
+            "status": self.status(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error,
+            "last_latency_ms": self.last_latency_ms,
+            "latency_ms": {
+                "buckets": {
+                    **{str(le): n for le, n in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                    "+Inf": self.buckets[-1],
+                },
+                "sum": round(self.latency_sum_ms, 1),
+                "count": self.requests,
+            },
+        }
+
+
+_endpoints = {name: EndpointHealth() for name in ENDPOINTS}
+
+
+def record(endpoint, ok, latency_ms, error=None):
+    """Record one upstream request. Endpoints outside ENDPOINTS are tracked but not reported."""
+    get(endpoint).record(ok, latency_ms, error)
+
+
+def get(endpoint):
+    """EndpointHealth for endpoint (created empty if never recorded)."""
+    h = _endpoints.get(endpoint)
+    if h is None:
+        h = _endpoints[endpoint] = EndpointHealth()
+    return h
+
+
+def overall():
+    """
+    Over the endpoints requested so far: "healthy" if all are ok, "unreachable" if all are down,
+    else "degraded"; "unknown" before any request was recorded.
+    """
+    statuses = [s for s in (_endpoints[name].status() for name in ENDPOINTS) if s != "unknown"]
+    if not statuses:
+        return "unknown"
+    if all(s == "ok" for s in statuses):
+        return "healthy"
+    if all(s == "down" for s in statuses):
+        return "unreachable"
+    return "degraded"
+
+
+def snapshot():
+    """Current health as a JSON-ready dict (what /api/health returns)."""
+    api = overall()
+    return {
+        "status": "ok" if api == "healthy" else "degraded",
+        "511_api": api,
+        "checked_at": max((h.last_seen() or 0 for h in _endpoints.values()), default=0) or None,
+        "endpoints": {name: _endpoints[name].to_dict() for name in ENDPOINTS},
+    }
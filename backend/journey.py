@@ -0,0 +1,249 @@
+"""
+Journey planning over the GTFS timetable with a connection scan (CSA).
+
+ConnectionTimetable turns stop_times into elementary connections (a train running from one
+stop to its next), kept as numpy columns. For a service date it materialises the connections
+running around that date in epoch seconds, sorted by departure; with a GTFS-Realtime snapshot
+those times are shifted by the feed's delays and re-sorted. Both are cached, so a query is a
+single pass over the connections after the departure time. The pass keeps an earliest-arrival
+label per stop for each number of trains used (at most MAX_LEGS), which gives the Pareto set
+of itineraries (arrival time vs transfers) at the end of the same pass.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Support both: run from repo root (backend.*) and from app root (e.g. Docker)
+try:
+    from backend.schedule import service_day_start
+    from backend.stations import display_name
+except ModuleNotFoundError:
+    from schedule import service_day_start
+    from stations import display_name
+
+# Most trains in one itinerary (MAX_LEGS - 1 transfers)
+MAX_LEGS = 4
+# Minimum time to change trains on the same platform, and to another platform of the same station
+TRANSFER_SEC = 60
+PLATFORM_CHANGE_SEC = 180
+# A prediction further than this from a trip's scheduled time belongs to another day's run
+MAX_RT_SHIFT_SEC = 3 * 3600
+# Stop scanning this long after the departure time (unreachable destination)
+SEARCH_WINDOW_SEC = 6 * 3600
+# Service dates whose connection lists are kept
+_DAY_CACHE_SIZE = 4
+
+# departure / arrival: epoch seconds; from_stop / to_stop: GTFS stop IDs
+Leg = namedtuple("Leg", "trip_id route_id headsign from_stop to_stop departure arrival")
+Itinerary = namedtuple("Itinerary", "departure arrival transfers legs")
+
+# Connections running around one service date, sorted by departure, as Python lists for the scan.
+# instance is trip * 3 + day offset + 1, so a trip's runs on consecutive days are different trains;
+# conn indexes the static connection.
+DayConnections = namedtuple("DayConnections", "dep arr dep_stop arr_stop instance conn")
+
+
+class ConnectionTimetable:
+    """
+    Connections of one GtfsData. schedule (a Schedule over the same feed) says which services
+    run on a date. Platforms with the same display name are one station: changing between
+    them takes PLATFORM_CHANGE_SEC.
+    """
+
+    def __init__(self, data, schedule):
+        self.version = data.version
+        self.schedule = schedule
+        self.tz = schedule.tz
+        st = data.stop_times
+        self.stop_ids = st.stop_ids
+        self.trip_ids = st.trip_ids
+        self._stop_index = {stop_id: k for k, stop_id in enumerate(st.stop_ids)}
+        self._trip_index = {trip_id: t for t, trip_id in enumerate(st.trip_ids)}
+
+        offsets = np.asarray(st.trip_offsets, dtype=np.int64)
+        row_trip = np.repeat(np.arange(len(st.trip_ids)), np.diff(offsets))
+        has_next = np.ones(len(st), dtype=bool)
+        if len(st):
+            has_next[offsets[1:] - 1] = False
+        k = np.flatnonzero(has_next)
+        stop = np.asarray(st.stop, dtype=np.int64)
+        dep = np.asarray(st.dep, dtype=np.int64)
+        arr = np.asarray(st.arr, dtype=np.int64)
+        self._dep_stop = stop[k]
+        self._arr_stop = stop[k + 1]
+        self._dep = dep[k]
+        self._arr = np.where(arr[k + 1] >= 0, arr[k + 1], dep[k + 1])
+        self._trip = row_trip[k]
+        self._service = schedule.trip_service[self._trip]
+
+        # Other platforms of each stop's station
+        names = {s["id"]: display_name(s) for s in data.stops}
+        by_station = {}
+        for i, stop_id in enumerate(st.stop_ids):
+            by_station.setdefault(names.get(stop_id, stop_id), []).append(i)
+        self._siblings = [[]] * len(st.stop_ids)
+        for group in by_station.values():
+            for i in group:
+                self._siblings[i] = [j for j in group if j != i]
+
+        self._days = {}
+        self._realtime = None  # ((date, rt version), DayConnections)
+
+    def _day_arrays(self, date):
+        """(dep, arr, conn, day offset) numpy columns of connections running on date -1 .. +1, by departure."""
+        parts = []
+        for offset in (-1, 0, 1):
+            day = date + timedelta(days=offset)
+            idx = np.flatnonzero(self.schedule.active_services(day)[self._service])
+            base = service_day_start(day, self.tz)
+            parts.append((base + self._dep[idx], base + self._arr[idx], idx, np.full(len(idx), offset)))
+        dep, arr, conn, day_offset = (np.concatenate(cols) for cols in zip(*parts))
+        order = np.argsort(dep, kind="stable")
+        return dep[order], arr[order], conn[order], day_offset[order]
+
+    def _as_lists(self, dep, arr, conn, day_offset):
+        return DayConnections(
+            dep.tolist(), arr.tolist(), self._dep_stop[conn].tolist(), self._arr_stop[conn].tolist(),
+            (self._trip[conn] * 3 + day_offset + 1).tolist(), conn.tolist(),
+        )
+
+    def connections(self, date, rt_trips=None, rt_version=None):
+        """
+        DayConnections for service date. rt_trips (GtfsRtSnapshot.trips) shifts each predicted
+        trip by its delays; rt_version identifies the snapshot the result is cached for.
+        """
+        entry = self._days.get(date)
+        if entry is None:
+            if len(self._days) >= _DAY_CACHE_SIZE:
+                self._days.clear()
+            arrays = self._day_arrays(date)
+            entry = self._days[date] = (arrays, self._as_lists(*arrays))
+        if not rt_trips:
+            return entry[1]
+        key = (date, rt_version)
+        if self._realtime is None or self._realtime[0] != key:
+            self._realtime = (key, self._as_lists(*self._apply_realtime(*entry[0], rt_trips)))
+        return self._realtime[1]
+
+    def _apply_realtime(self, dep, arr, conn, day_offset, rt_trips):
+        """
+        Copy of the day's columns with predicted trips shifted. A trip's delay at each stop is its
+        predicted departure minus the scheduled one, carried forward to stops without a
+        prediction (and back to stops before the first one). Arrivals take the delay of the stop arrived at.
+        """
+        dep, arr = dep.copy(), arr.copy()
+        trips = {t: rt_trips[trip_id] for trip_id in rt_trips if (t := self._trip_index.get(trip_id)) is not None}
+        if not trips:
+            return dep, arr, conn, day_offset
+        trip = self._trip[conn]
+        runs = {}
+        for r in np.flatnonzero(np.isin(trip, list(trips))).tolist():
+            runs.setdefault((int(trip[r]), int(day_offset[r])), []).append(r)
+        stop_ids = self.stop_ids
+        for (t, _), rows in runs.items():
+            predictions = trips[t]
+            # delays[i]: at the departure stop of rows[i]; delays[-1]: at the last arrival stop
+            delays = []
+            for r in rows:
+                p = predictions.get(stop_ids[self._dep_stop[conn[r]]])
+                delays.append(p.ts - int(dep[r]) if p is not None and abs(p.ts - int(dep[r])) <= MAX_RT_SHIFT_SEC else None)
+            p = predictions.get(stop_ids[self._arr_stop[conn[rows[-1]]]])
+            last = int(arr[rows[-1]])
+            delays.append(p.ts - last if p is not None and abs(p.ts - last) <= MAX_RT_SHIFT_SEC else None)
+            known = next((d for d in delays if d is not None), None)
+            if known is None:
+                continue
+            for i, d in enumerate(delays):
+                if d is None:
+                    delays[i] = known
+                else:
+                    known = d
+            for i, r in enumerate(rows):
+                dep[r] += delays[i]
+                arr[r] = max(arr[r] + delays[i + 1], dep[r])
+        order = np.argsort(dep, kind="stable")
+        return dep[order], arr[order], conn[order], day_offset[order]
+
+    def plan(self, from_stop_ids, to_stop_ids, depart_ts, rt_trips=None, rt_version=None, max_legs=MAX_LEGS):
+        """
+        Pareto-optimal itineraries from any of from_stop_ids to any of to_stop_ids leaving at or
+        after depart_ts: the earliest arrival with one train, then each strictly earlier arrival
+        with one more transfer, up to max_legs trains. Returns [Itinerary], fewest transfers first.
+        """
+        origins = [self._stop_index[s] for s in from_stop_ids if s in self._stop_index]
+        targets = {self._stop_index[s] for s in to_stop_ids if s in self._stop_index}
+        if not origins or not targets or targets & set(origins):
+            return []
+        day = datetime.fromtimestamp(depart_ts, self.tz).date()
+        c = self.connections(day, rt_trips, rt_version)
+        dep, arr, dep_stop, arr_stop, instance = c.dep, c.arr, c.dep_stop, c.arr_stop, c.instance
+
+        never = float("inf")
+        n_stops = len(self.stop_ids)
+        # labels[m][s]: earliest arrival at s using at most m trains; via[m][s]: (boarding row, alighting row, trains)
+        labels = [[never] * n_stops for _ in range(max_legs + 1)]
+        via = [[None] * n_stops for _ in range(max_legs + 1)]
+        for s in origins:
+            labels[0][s] = depart_ts
+        riding = {}  # instance -> fewest trains used when on it
+        boarded = {}  # (instance, trains) -> boarding row
+        # Earliest arrival at the destination on a single train: the latest of the Pareto labels,
+        # so nothing departing after it can improve any of them
+        direct = never
+        end = depart_ts + SEARCH_WINDOW_SEC
+        siblings = self._siblings
+        for r in range(bisect_left(dep, depart_ts), len(dep)):
+            d = dep[r]
+            if d > direct or d > end:
+                break
+            inst = instance[r]
+            on = riding.get(inst, max_legs + 1)
+            s = dep_stop[r]
+            for m in range(on - 1):
+                if labels[m][s] + (TRANSFER_SEC if m else 0) <= d:
+                    on = riding[inst] = m + 1
+                    boarded[(inst, on)] = r
+                    break
+            if on > max_legs:
+                continue
+            a, t = arr[r], arr_stop[r]
+            step = (boarded[(inst, on)], r, on)
+            for m in range(on, max_legs + 1):
+                if a >= labels[m][t]:
+                    break
+                labels[m][t] = a
+                via[m][t] = step
+                for sib in siblings[t]:
+                    if a + PLATFORM_CHANGE_SEC - TRANSFER_SEC < labels[m][sib]:
+                        labels[m][sib] = a + PLATFORM_CHANGE_SEC - TRANSFER_SEC
+                        via[m][sib] = step
+            if on == 1 and t in targets and a < direct:
+                direct = a
+
+        itineraries = []
+        previous = never
+        for m in range(1, max_legs + 1):
+            t = min(targets, key=lambda s: labels[m][s])
+            if labels[m][t] >= previous:
+                continue
+            previous = labels[m][t]
+            legs = []
+            k = m
+            while k > 0:
+                board, alight, trains = via[k][t]
+                legs.append(self._leg(c, board, alight))
+                t, k = dep_stop[board], trains - 1
+            legs.reverse()
+            itineraries.append(Itinerary(legs[0].departure, legs[-1].arrival, len(legs) - 1, legs))
+        return itineraries
+
+    def _leg(self, c, board, alight):
+        t = c.instance[board] // 3
+        trip = self.schedule.trip(t)
+        return Leg(
+            self.trip_ids[t], trip.route_id if trip else "", trip.headsign if trip else "",
+            self.stop_ids[c.dep_stop[board]], self.stop_ids[c.arr_stop[alight]], c.dep[board], c.arr[alight],
+        )
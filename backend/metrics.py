@@ -0,0 +1,200 @@
+"""
+In-process metrics in the Prometheus text exposition format (what /api/metrics returns).
+
+Histograms and counters here are plain per-worker counters keyed by label values: recording is
+a dict lookup, a bisect and a few additions, so instrumentation stays on permanently. Numbers
+other modules already keep are not counted twice: render() reads upstream request outcomes and
+latency from health and cache hit/miss/refresh counters from cache when scraped.
+
+Recording from asyncio.to_thread workers is fine; a rare lost increment under contention is
+accepted rather than taking a lock on every observation.
+"""
+
+import time
+from bisect import bisect_left
+
+# Support both: run from repo root (backend.*) and from app root (e.g. Docker)
+try:
+    from backend import cache, health
+except ModuleNotFoundError:
+    import cache
+    import health
+
+PREFIX = "caltrain"
+
+# Bucket upper bounds in seconds (the +Inf bucket is implicit)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+BUILD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304)
+
+_METRICS = []  # in registration (and exposition) order
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label-value tuple."""
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        _METRICS.append(self)
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for label_values, series in self._series.items():
+            labels = list(zip(self.labels, label_values))
+            cumulative = 0
+            for le, n in zip(self.buckets + ("+Inf",), series):
+                cumulative += n
+                yield "_bucket", labels + [("le", _format_value(le))], cumulative
+            yield "_sum", labels, series[-1]
+            yield "_count", labels, cumulative
+
+    def render(self):
+        return _family(self.name, "histogram", self.help, self.samples())
+
+
+class Counter:
+    """Monotonic counter per label-value tuple."""
+
+    def __init__(self, name, help, labels=()):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        _METRICS.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        samples = (("", list(zip(self.labels, lv)), n) for lv, n in self._series.items())
+        return _family(self.name, "counter", self.help, samples)
+
+
+def timed(histogram, label, fn, *args):
+    """fn(*args), with its duration observed in histogram under label."""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        histogram.observe(time.perf_counter() - start, label)
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "API request latency by route template (time to response headers).",
+    labels=("route", "method"),
+)
+HTTP_RESPONSES = Counter("http_responses_total", "API responses by route template and status code.",
+                         labels=("route", "status"))
+GTFS_RT_PARSE_SECONDS = Histogram(
+    "gtfs_rt_parse_duration_seconds", "GTFS-Realtime tripupdates parse time: protobuf decode, then indexing.",
+    labels=("stage",), buckets=PARSE_BUCKETS,
+)
+GTFS_RT_PAYLOAD_BYTES = Histogram(
+    "gtfs_rt_payload_bytes", "Size of each tripupdates protobuf parsed.", buckets=SIZE_BUCKETS,
+)
+GTFS_BUILD_SECONDS = Histogram(
+    "gtfs_build_duration_seconds", "Static GTFS build time per stage (zip parse and each derived table).",
+    labels=("stage",), buckets=BUILD_BUCKETS,
+)
+DEPARTURE_SOURCES = Counter(
+    "departure_source_total", "Departure answers by the source that served them (none: every source empty).",
+    labels=("source",),
+)
+
+
+def _format_value(v):
+    if isinstance(v, str):
+        return v
+    if isinstance(v, float) and not v.is_integer():
+        return repr(v)
+    return str(int(v))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _family(name, kind, help, samples):
+    """Exposition lines for one metric family; samples are (name suffix, [(label, value)], number)."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        lines.append(f"{name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                     else f"{name}{suffix} {_format_value(value)}")
+    return lines
+
+
+def _upstream_families():
+    """Upstream request counters and latency from health (kept there in ms, exposed in seconds)."""
+    endpoints = {name: health.get(name) for name in health.ENDPOINTS}
+    bounds = tuple(ms / 1000 for ms in health.LATENCY_BUCKETS_MS) + ("+Inf",)
+
+    def latency():
+        for name, h in endpoints.items():
+            cumulative = 0
+            for le, n in zip(bounds, h.buckets):
+                cumulative += n
+                yield "_bucket", [("endpoint", name), ("le", _format_value(le))], cumulative
+            yield "_sum", [("endpoint", name)], round(h.latency_sum_ms / 1000, 6)
+            yield "_count", [("endpoint", name)], h.requests
+
+    return (
+        _family(f"{PREFIX}_upstream_request_duration_seconds", "histogram",
+                "511 API request latency by endpoint (failures included).", latency())
+        + _family(f"{PREFIX}_upstream_requests_total", "counter", "511 API requests by endpoint.",
+                  (("", [("endpoint", n)], h.requests) for n, h in endpoints.items()))
+        + _family(f"{PREFIX}_upstream_failures_total", "counter", "Failed 511 API requests by endpoint.",
+                  (("", [("endpoint", n)], h.failures) for n, h in endpoints.items()))
+    )
+
+
+# cache.Cache.stats() key -> (metric name, type, help)
+_CACHE_FIELDS = (
+    ("hits", "cache_hits_total", "counter", "Cache reads served fresh."),
+    ("stale_hits", "cache_stale_hits_total", "counter", "Cache reads served stale while refreshing."),
+    ("misses", "cache_misses_total", "counter", "Cache reads that waited for a load."),
+    ("refreshes", "cache_refreshes_total", "counter", "Cache loads that succeeded."),
+    ("refresh_errors", "cache_refresh_errors_total", "counter", "Cache loads that failed."),
+    ("age_sec", "cache_age_seconds", "gauge", "Seconds since the cached value was loaded."),
+    ("size_bytes", "cache_size_bytes", "gauge", "Estimated memory held by the cached value."),
+    ("evictions", "cache_evictions_total", "counter", "Values dropped to stay within the cache memory budget."),
+)
+
+
+def _cache_families(extra_caches):
+    stats = {**cache.stats(), **extra_caches}
+    lines = []
+    for key, name, kind, help in _CACHE_FIELDS:
+        samples = [("", [("cache", c)], s[key]) for c, s in stats.items() if s.get(key) is not None]
+        if samples:
+            lines += _family(f"{PREFIX}_{name}", kind, help, samples)
+    return lines
+
+
+def render(extra_caches=None):
+    """
+    All metrics as exposition text. extra_caches: {name: {"hits", "misses", ...}} for caches
+    that aren't cache.Cache instances (e.g. the server's prepared responses).
+    """
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    lines += _upstream_families()
+    lines += _cache_families(extra_caches or {})
+    memory = cache.memory_stats()
+    lines += _family(f"{PREFIX}_cache_memory_budget_bytes", "gauge", "Memory budget shared by all caches.",
+                     [("", [], memory["budget_bytes"])])
+    lines += _family(f"{PREFIX}_cache_memory_used_bytes", "gauge", "Estimated memory held by all caches.",
+                     [("", [], memory["used_bytes"])])
+    return "\n".join(lines) + "\n"
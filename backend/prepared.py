@@ -0,0 +1,115 @@
+"""
+Pre-serialised JSON bodies for hot read-only endpoints.
+
+A PreparedBody is a payload encoded once (orjson when installed, else json) together with its
+gzip and, when the brotli package is installed, brotli variants. PreparedCache keeps one per key
+for as long as its version (e.g. the ETag of the snapshots it was built from) stays current, so
+repeated requests are a dict lookup plus writing bytes that already exist. A payload that
+won't be reused goes through encode() instead, which only builds the variant the request gets.
+"""
+
+import gzip
+import json
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed (headers would eat the saving)
+MIN_COMPRESS_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(content):
+    """Compact UTF-8 JSON bytes (same output as JSONResponse, faster with orjson)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _accepts(accept_encoding, coding):
+    """True if the Accept-Encoding header allows coding (a q=0 entry refuses it)."""
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def encode(content, accept_encoding):
+    """
+    (body, content-coding or None) for a one-off payload: the same choice PreparedBody.negotiate
+    makes, but only the chosen variant is encoded.
+    """
+    identity = dumps(content)
+    if accept_encoding and len(identity) >= MIN_COMPRESS_BYTES:
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            return brotli.compress(identity, quality=BROTLI_QUALITY), "br"
+        if _accepts(accept_encoding, "gzip"):
+            return gzip.compress(identity, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+    return identity, None
+
+
+class PreparedBody:
+    """One payload's encoded bytes: identity, gzip and brotli (None when not worth it or unavailable)."""
+
+    __slots__ = ("identity", "gzip", "br")
+
+    def __init__(self, content):
+        self.identity = dumps(content)
+        self.gzip = self.br = None
+        if len(self.identity) >= MIN_COMPRESS_BYTES:
+            self.gzip = gzip.compress(self.identity, compresslevel=GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.br = brotli.compress(self.identity, quality=BROTLI_QUALITY)
+
+    def negotiate(self, accept_encoding):
+        """(body, content-coding or None) for a request's Accept-Encoding header."""
+        if accept_encoding:
+            if self.br is not None and _accepts(accept_encoding, "br"):
+                return self.br, "br"
+            if self.gzip is not None and _accepts(accept_encoding, "gzip"):
+                return self.gzip, "gzip"
+        return self.identity, None
+
+
+class PreparedCache:
+    """
+    key -> (version, PreparedBody), least recently used dropped beyond max_entries. A body is only
+    returned for the version it was built for, so bumping the version is the invalidation.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, content):
+        """Encode content for (key, version) and return the PreparedBody."""
+        body = PreparedBody(content)
+        self._entries[key] = (version, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return body
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
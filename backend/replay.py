@@ -0,0 +1,239 @@
+"""
+Record / replay archive of 511 responses, so an incident can be reproduced offline.
+
+upstream.py appends every response to an ArchiveWriter when UPSTREAM_RECORD is set, and
+answers every request from a Replayer when UPSTREAM_REPLAY is set (scripts/stub_511.py --archive
+serves one over HTTP for tools that call 511 directly).
+
+File layout (append-only, so a recording cut short keeps every complete record):
+  MAGIC | u32 FORMAT_VERSION | record*
+  record: u32 header length | u32 body length | JSON header | zlib-compressed body
+The header holds the request time, endpoint, params (without api_key), status, latency, the
+ETag / Last-Modified / Content-Type headers, the body's sha1, and for a request that got no
+response the exception name. A body already in the file (an unchanged feed polled again) is
+not stored twice: its record has body length 0 and refers to the first copy by sha1.
+"""
+
+import bisect
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from google.transit import gtfs_realtime_pb2
+
+MAGIC = b"CT511R\0"
+FORMAT_VERSION = 1
+COMPRESS_LEVEL = 6
+
+# Response headers worth keeping (validators for conditional GETs, and the body type)
+KEPT_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+
+# t: epoch seconds when the request was sent; status 0 with error set when there was no response
+Record = namedtuple("Record", "t endpoint params status latency_ms headers sha1 error")
+
+# SIRI JSON endpoints whose ISO timestamps are shifted on replay (see Replayer)
+_SIRI_ENDPOINTS = ("StopMonitoring", "stoptimetable")
+_ISO_TIME = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:\d{2})?$")
+
+
+def params_key(params):
+    """Canonical query string of a request's params, without the api_key."""
+    return "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()) if k != "api_key")
+
+
+class ArchiveWriter:
+    """Appends records to path (created if missing). append() may be called from any thread."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stored = set()
+        if self.path.exists() and self.path.stat().st_size > 0:
+            self._stored.update(read_archive(self.path)[1])
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<I", FORMAT_VERSION))
+
+    def append(self, t, endpoint, params, status, latency_ms, headers=None, body=b"", error=None):
+        sha1 = hashlib.sha1(body).hexdigest() if body else None
+        header = {
+            "t": round(t, 3), "endpoint": endpoint, "params": params_key(params), "status": status,
+            "latency_ms": round(latency_ms, 1), "headers": {k: v for k, v in (headers or {}).items() if v},
+            "sha1": sha1, "error": error,
+        }
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            stored = b""
+            if sha1 is not None and sha1 not in self._stored:
+                stored = zlib.compress(body, COMPRESS_LEVEL)
+                self._stored.add(sha1)
+            with open(self.path, "ab") as f:
+                f.write(struct.pack("<II", len(header_bytes), len(stored)))
+                f.write(header_bytes)
+                f.write(stored)
+
+
+def read_archive(path):
+    """([Record] in request-time order, {sha1: compressed body}). Stops at a truncated last record."""
+    raw = Path(path).read_bytes()
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path} is not a 511 archive")
+    pos = len(MAGIC)
+    (fmt,) = struct.unpack_from("<I", raw, pos)
+    if fmt != FORMAT_VERSION:
+        raise ValueError(f"{path} has archive format {fmt}, expected {FORMAT_VERSION}")
+    pos += 4
+    records, bodies = [], {}
+    while pos + 8 <= len(raw):
+        header_len, body_len = struct.unpack_from("<II", raw, pos)
+        end = pos + 8 + header_len + body_len
+        if end > len(raw):
+            break
+        h = json.loads(raw[pos + 8:pos + 8 + header_len])
+        if body_len:
+            bodies[h["sha1"]] = raw[end - body_len:end]
+        records.append(Record(h["t"], h["endpoint"], h["params"], h["status"], h["latency_ms"],
+                              h["headers"], h["sha1"], h["error"]))
+        pos = end
+    records.sort(key=lambda r: r.t)
+    return records, bodies
+
+
+class Replayer:
+    """
+    Answers requests from an archive on a replay clock that starts at the first record and runs
+    speed times faster than real time. A request gets the latest response recorded for the same
+    endpoint and params at or before the replay time (the first one before it was recorded);
+    None if that request was never recorded.
+
+    With shift_times, GTFS-Realtime and SIRI timestamps are moved by the difference between
+    now and the replay time, so recorded departures are in the future again as they were then
+    (the static GTFS zip is served as recorded).
+    """
+
+    def __init__(self, path, speed=1.0, shift_times=True, clock=time.time):
+        records, self._bodies = read_archive(path)
+        if not records:
+            raise ValueError(f"{path} has no records")
+        self.speed = speed
+        self.shift_times = shift_times
+        self.clock = clock
+        self.start = records[0].t
+        self.end = records[-1].t
+        self._started = clock()
+        self._by_request = {}  # (endpoint, params key) -> ([t], [Record])
+        for r in records:
+            times, recs = self._by_request.setdefault((r.endpoint, r.params), ([], []))
+            times.append(r.t)
+            recs.append(r)
+        self._body_cache = {}  # sha1 -> decompressed body, for the most recent few
+
+    def replay_time(self):
+        return self.start + (self.clock() - self._started) * self.speed
+
+    def lookup(self, endpoint, params):
+        """
+        Record answering a request now. A recorded 304 stands for the response it revalidated,
+        so the latest record with a body is used instead (a client replaying from scratch has no copy).
+        """
+        entry = self._by_request.get((endpoint, params_key(params)))
+        if entry is None:
+            return None
+        times, recs = entry
+        i = max(0, bisect.bisect_right(times, self.replay_time()) - 1)
+        if recs[i].status == 304:
+            full = [r for r in recs[:i] if r.status != 304] or [r for r in recs[i:] if r.status != 304]
+            if full:
+                return full[-1] if full[-1].t <= recs[i].t else full[0]
+        return recs[i]
+
+    def body(self, sha1):
+        if sha1 is None:
+            return b""
+        body = self._body_cache.get(sha1)
+        if body is None:
+            if len(self._body_cache) >= 8:
+                self._body_cache.clear()
+            body = self._body_cache[sha1] = zlib.decompress(self._bodies[sha1])
+        return body
+
+    def respond(self, endpoint, params, request_headers=None):
+        """
+        (Record, status, headers, body) for a request, or None if it was never recorded. A
+        conditional request whose If-None-Match matches the recorded ETag gets 304.
+        """
+        record = self.lookup(endpoint, params)
+        if record is None:
+            return None
+        headers = dict(record.headers)
+        etag = headers.get("ETag")
+        if etag and (request_headers or {}).get("If-None-Match") == etag and record.status == 200:
+            return record, 304, headers, b""
+        body = self.body(record.sha1)
+        if self.shift_times and body and record.status == 200:
+            offset = int(self.clock() - self.replay_time())
+            if endpoint == "tripupdates":
+                body = shift_feed(body, offset)
+            elif endpoint in _SIRI_ENDPOINTS:
+                body = shift_siri(body, offset)
+        return record, record.status, headers, body
+
+
+def shift_feed(content, offset):
+    """GTFS-Realtime protobuf with header and trip update times moved by offset seconds."""
+    if not offset:
+        return content
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    if feed.header.timestamp:
+        feed.header.timestamp += offset
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        tu = entity.trip_update
+        if tu.timestamp:
+            tu.timestamp += offset
+        for stu in tu.stop_time_update:
+            for event in (stu.arrival, stu.departure):
+                if event.time:
+                    event.time += offset
+    return feed.SerializeToString()
+
+
+def _shift_iso(value, offset):
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    shifted = (dt + timedelta(seconds=offset)).isoformat()
+    return shifted.replace("+00:00", "Z") if value.endswith("Z") else shifted
+
+
+def _shift_json(obj, offset):
+    if isinstance(obj, dict):
+        return {k: _shift_json(v, offset) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_shift_json(v, offset) for v in obj]
+    if isinstance(obj, str) and _ISO_TIME.match(obj):
+        return _shift_iso(obj, offset)
+    return obj
+
+
+def shift_siri(content, offset):
+    """511 SIRI JSON (with its BOM) with every ISO timestamp moved by offset seconds."""
+    if not offset:
+        return content
+    try:
+        data = json.loads(content.decode("utf-8-sig"))
+    except ValueError:
+        return content
+    return json.dumps(_shift_json(data, offset)).encode("utf-8-sig")
@@ -0,0 +1,126 @@
+"""
+Scheduled departures from the static GTFS feed, answered locally (no 511 round-trip).
+
+Schedule indexes stop_times by stop: each stop's departures are one contiguous run of numpy
+arrays sorted by departure time (seconds since service-day midnight), with the trip and
+service of every row. Which services run on a date comes from calendar.txt and
+calendar_dates.txt as a boolean mask over services, computed once per date. "Next N
+departures after t" is then a binary search into the stop's run plus a mask lookup, per
+service day that can still have trains after t. Built once per feed version; read-only afterwards.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# ts: departure, epoch seconds; route_id / headsign from trips.txt
+ScheduledDeparture = namedtuple("ScheduledDeparture", "ts trip_id route_id headsign")
+
+# Service dates whose active-service masks are kept (today, yesterday, tomorrow and a few more)
+_ACTIVE_CACHE_SIZE = 8
+
+
+def service_day_start(date, tz):
+    """Epoch of GTFS time 00:00:00 on a service date: noon minus 12 h (per the spec, so DST days work)."""
+    noon = datetime(date.year, date.month, date.day, 12, tzinfo=tz)
+    return int(noon.timestamp()) - 43200
+
+
+class Schedule:
+    """
+    Per-stop departure index over one GtfsData. The departures at stop k are rows
+    _start[k]:_start[k + 1] of _dep / _trip / _service. A trip's last stop is left out
+    (nobody boards there). Trips missing from trips.txt, or whose service has no calendar
+    entry, never run. trip_service[t] is trip t's index into active_services masks.
+    """
+
+    def __init__(self, data, tz):
+        self.version = data.version
+        self.tz = tz
+        st = data.stop_times
+        trips = data.trips
+        self._calendar = data.calendar
+        self._dates = {}  # "YYYYMMDD" -> [(service index, exception_type)]
+        services = sorted({t.service_id for t in trips.values()} | set(data.calendar) | set(data.calendar_dates))
+        self._service_index = {s: i for i, s in enumerate(services)}
+        for service_id, exceptions in data.calendar_dates.items():
+            for date, exception_type in exceptions:
+                self._dates.setdefault(date, []).append((self._service_index[service_id], exception_type))
+        self._n_services = len(services)
+        self._active = {}
+
+        self.trip_ids = st.trip_ids
+        self._trips = [trips.get(trip_id) for trip_id in st.trip_ids]
+        unknown = self._n_services  # mask slot that is never set
+        self.trip_service = np.array(
+            [self._service_index[t.service_id] if t is not None else unknown for t in self._trips], dtype=np.int32,
+        )
+        offsets = np.asarray(st.trip_offsets, dtype=np.int64)
+        row_trip = np.repeat(np.arange(len(st.trip_ids)), np.diff(offsets))
+        boardable = np.arange(len(st)) != offsets[1:][row_trip] - 1
+        stop = np.asarray(st.stop, dtype=np.int64)[boardable]
+        dep = np.asarray(st.dep, dtype=np.int64)[boardable]
+        trip = row_trip[boardable]
+        order = np.lexsort((dep, stop))
+        self._stop_index = {stop_id: k for k, stop_id in enumerate(st.stop_ids)}
+        self._start = np.searchsorted(stop[order], np.arange(len(st.stop_ids) + 1))
+        self._dep = dep[order]
+        self._trip = trip[order]
+        self._service = self.trip_service[self._trip]
+        # Service days before today that can still have departures now (trips past 24:00:00)
+        self._days_back = int(dep.max()) // 86400 if len(dep) else 0
+
+    def active_services(self, date):
+        """Boolean mask over service indexes (plus a never-active slot) for one service date."""
+        mask = self._active.get(date)
+        if mask is not None:
+            return mask
+        ymd = date.strftime("%Y%m%d")
+        weekday = date.weekday()
+        mask = np.zeros(self._n_services + 1, dtype=bool)
+        for service_id, cal in self._calendar.items():
+            if cal["days"][weekday] and cal["start_date"] <= ymd <= cal["end_date"]:
+                mask[self._service_index[service_id]] = True
+        for i, exception_type in self._dates.get(ymd, ()):
+            mask[i] = exception_type == 1
+        if len(self._active) >= _ACTIVE_CACHE_SIZE:
+            self._active.clear()
+        self._active[date] = mask
+        return mask
+
+    def departures(self, stop_id, after_ts, limit=None):
+        """
+        Scheduled departures at stop_id from after_ts (epoch seconds) on, soonest first, as
+        ScheduledDeparture. Covers every service day still running at after_ts, and tomorrow's
+        when that gives fewer than limit (limit None: no cap).
+        """
+        k = self._stop_index.get(stop_id)
+        if k is None:
+            return []
+        a, b = int(self._start[k]), int(self._start[k + 1])
+        deps = self._dep[a:b]
+        today = datetime.fromtimestamp(after_ts, self.tz).date()
+        found = []
+        for day_offset in range(-self._days_back, 2):
+            if day_offset == 1 and limit is not None and len(found) >= limit:
+                break
+            day = today + timedelta(days=day_offset)
+            base = service_day_start(day, self.tz)
+            i = int(np.searchsorted(deps, after_ts - base))
+            rows = a + i + np.flatnonzero(self.active_services(day)[self._service[a + i:b]])
+            if limit is not None:
+                rows = rows[:limit]
+            found.extend(zip((base + self._dep[rows]).tolist(), self._trip[rows].tolist()))
+        found.sort()
+        if limit is not None:
+            found = found[:limit]
+        result = []
+        for ts, t in found:
+            trip = self._trips[t]
+            result.append(ScheduledDeparture(ts, self.trip_ids[t], trip.route_id, trip.headsign))
+        return result
+
+    def trip(self, t):
+        """gtfs_static.Trip for trip index t (None if not in trips.txt)."""
+        return self._trips[t]
@@ -5,34 +5,277 @@ Run from repo root: uvicorn backend.server:app --reload
 Then open http://127.0.0.1:8000/ (frontend) or .../api/stops (API).
 """
 
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import APIRouter, FastAPI, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, FastAPI, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field
 from starlette.middleware.base import BaseHTTPMiddleware
 
 # Support both: run from repo root (uvicorn backend.server:app) and from app root (uvicorn server:app, e.g. Docker/Render)
 try:
     from backend.caltrain import (
-        check_511_api_health,
-        get_caltrain_stops,
+        CALTRAIN_OPERATOR_ID,
+        PINNED_OPERATORS,
+        STATION_LINE_ORDER,
         get_direction,
         get_nearest_station,
-        get_next_trains,
+        get_station_model,
         get_stops_in_direction,
+        load_gtfs_cache,
+        nearest_stations_batch,
         next_trains,
+        next_trains_batch,
+        next_trains_data_version,
+        operator_ttl,
+        parse_depart_at,
+        plan_journey,
+        probe_511_endpoints,
+        race_next_trains,
+        refresh_gtfs_rt_snapshot,
+        refresh_gtfs_static,
+        search_stations,
+        sync_shared_gtfs,
+        visit_dict,
     )
+    from backend import cache, health, metrics, shared_snapshot, upstream
+    from backend.prepared import PreparedCache, encode
 except ModuleNotFoundError:
     from caltrain import (
-        check_511_api_health,
-        get_caltrain_stops,
+        CALTRAIN_OPERATOR_ID,
+        PINNED_OPERATORS,
+        STATION_LINE_ORDER,
         get_direction,
         get_nearest_station,
-        get_next_trains,
+        get_station_model,
         get_stops_in_direction,
+        load_gtfs_cache,
+        nearest_stations_batch,
         next_trains,
+        next_trains_batch,
+        next_trains_data_version,
+        operator_ttl,
+        parse_depart_at,
+        plan_journey,
+        probe_511_endpoints,
+        race_next_trains,
+        refresh_gtfs_rt_snapshot,
+        refresh_gtfs_static,
+        search_stations,
+        sync_shared_gtfs,
+        visit_dict,
     )
+    import cache
+    import health
+    import metrics
+    import shared_snapshot
+    import upstream
+    from prepared import PreparedCache, encode
+
+# Background realtime poller: refreshes the GTFS-RT snapshot on a fixed cadence and pushes
+# changed next_trains results to /api/stream/next_trains subscribers (one upstream poll for all).
+# Every pinned operator gets one, on its OPERATOR_CACHE_TTL gtfs_rt override if it has one.
+# Workers that adopt shared snapshots instead of polling 511 check every SHARED_SNAPSHOT_CHECK_SEC.
+GTFS_RT_POLL_SEC = float(os.getenv("GTFS_RT_POLL_SEC", "15"))
+SSE_KEEPALIVE_SEC = 15
+
+# Operators next_trains answers for: Caltrain and the pinned ones (polled, never evicted)
+SERVED_OPERATORS = tuple(dict.fromkeys((CALTRAIN_OPERATOR_ID,) + PINNED_OPERATORS))
+
+# Background health prober: every HEALTH_PROBE_SEC, probes the 511 endpoints that real traffic
+# hasn't exercised in that long; /api/health only reads the recorded state.
+HEALTH_PROBE_SEC = float(os.getenv("HEALTH_PROBE_SEC", "60"))
+
+# Most points accepted by one POST /api/nearest_stations request
+NEAREST_BATCH_MAX_POINTS = 1000
+
+# Most trains one next_trains query may ask for (every train endpoint, the stream and the batch)
+NEXT_TRAINS_MAX_LIMIT = 50
+
+# Most queries accepted by one POST /api/next_trains/batch request
+NEXT_TRAINS_BATCH_MAX_QUERIES = 50
+
+# HTTP caching. Station data changes at most daily; next_trains at feed cadence. ETags come from
+# the versions of the snapshots a response is built from, so browsers and nginx (see nginx/*.conf)
+# can revalidate with If-None-Match and get a 304 without the response being recomputed.
+STATIONS_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+NEXT_TRAINS_MAX_AGE_SEC = int(os.getenv("NEXT_TRAINS_MAX_AGE_SEC", "5"))
+NEXT_TRAINS_CACHE_CONTROL = f"public, max-age={NEXT_TRAINS_MAX_AGE_SEC}"
+
+# Encoded bodies (identity / gzip / brotli) of the cacheable endpoints, per query and ETag, so a
+# repeat request is served from bytes built once per snapshot version (see prepared.py)
+PREPARED_MAX_ENTRIES = int(os.getenv("PREPARED_MAX_ENTRIES", "2048"))
+_prepared = PreparedCache(max_entries=PREPARED_MAX_ENTRIES)
+
+
+def _etag(*parts):
+    """Weak ETag from version parts (weak: equal data, not necessarily byte-identical JSON)."""
+    return 'W/"%s"' % hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:24]
+
+
+def _etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or etag[2:] in tags
+
+
+def _not_modified(etag, cache_control):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def _body_response(request, body, etag, cache_control):
+    """A PreparedBody in the best encoding the client accepts, with validators."""
+    return _encoded_response(*body.negotiate(request.headers.get("accept-encoding", "")), etag, cache_control)
+
+
+def _encoded_response(data, coding, etag, cache_control):
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(data, media_type="application/json", headers=headers)
+
+
+def _cached_response(request, key, etag, cache_control):
+    """304 if the client has etag, else the prepared body for (key, etag); None if it must be built."""
+    if _etag_matches(request, etag):
+        return _not_modified(etag, cache_control)
+    body = _prepared.get(key, etag)
+    return _body_response(request, body, etag, cache_control) if body is not None else None
+
+
+def _prepare_response(request, key, etag, cache_control, content):
+    """Encode content once for (key, etag) and serve it."""
+    return _body_response(request, _prepared.put(key, etag, content), etag, cache_control)
+
+
+_LINE_ORDER_ETAG = _etag("line_order", *STATION_LINE_ORDER)
+
+
+class NextTrainsHub:
+    """Subscribers grouped by query; each group gets the latest changed payload, computed once per poll."""
+
+    def __init__(self):
+        self._subscribers = {}  # (stop, direction, to, limit) -> set of asyncio.Queue
+        self._last = {}  # same key -> last SSE message sent
+        self._fingerprints = {}  # same key -> last payload without per-poll metadata
+
+    def subscribe(self, key):
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(key, set()).add(queue)
+        if key in self._last:
+            queue.put_nowait(self._last[key])
+        return queue
+
+    def unsubscribe(self, key, queue):
+        subs = self._subscribers.get(key)
+        if subs is None:
+            return
+        subs.discard(queue)
+        if not subs:
+            del self._subscribers[key]
+            self._last.pop(key, None)
+            self._fingerprints.pop(key, None)
+
+    async def publish(self, key):
+        """Recompute next_trains for key; if changed, hand the message to every subscriber."""
+        stop, direction, to, limit = key
+        result = await next_trains(stop, limit=limit, direction=direction, to_stop=to)
+        # Source latencies differ on every poll; only push when the trains themselves change
+        meta = result.pop("data_source_meta", None)
+        fingerprint = json.dumps(result, separators=(",", ":"))
+        if self._fingerprints.get(key) == fingerprint or key not in self._subscribers:
+            return
+        self._fingerprints[key] = fingerprint
+        result["data_source_meta"] = meta
+        message = f"data: {json.dumps(result, separators=(',', ':'))}\n\n"
+        self._last[key] = message
+        for queue in self._subscribers[key]:
+            # Slow clients only need the latest state: replace anything still queued
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def publish_all(self):
+        for key in list(self._subscribers):
+            try:
+                await self.publish(key)
+            except Exception:
+                pass
+
+
+hub = NextTrainsHub()
+
+
+async def _poll_realtime(operator_id):
+    """
+    Refresh operator_id's realtime snapshot on its poll interval (and adopt shared static GTFS);
+    Caltrain's are pushed to subscribers when the snapshot changed, or every poll interval.
+    """
+    interval = operator_ttl("gtfs_rt", operator_id, GTFS_RT_POLL_SEC)
+    published, published_at = None, 0.0
+    while True:
+        try:
+            snap = await refresh_gtfs_rt_snapshot(operator_id)
+            await sync_shared_gtfs(operator_id)
+            if operator_id == CALTRAIN_OPERATOR_ID and (
+                snap is not published or time.monotonic() - published_at >= interval
+            ):
+                await hub.publish_all()
+                published, published_at = snap, time.monotonic()
+        except Exception:
+            pass
+        if shared_snapshot.feed_source() == "upstream":
+            await asyncio.sleep(interval)
+        else:
+            await asyncio.sleep(min(interval, shared_snapshot.SHARED_SNAPSHOT_CHECK_SEC))
+
+
+async def _probe_health():
+    """Keep health.py's per-endpoint state current (see probe_511_endpoints); only workers that poll 511."""
+    while True:
+        try:
+            if shared_snapshot.feed_source() == "upstream":
+                await probe_511_endpoints(CALTRAIN_OPERATOR_ID, max_age=HEALTH_PROBE_SEC)
+        except Exception:
+            pass
+        await asyncio.sleep(HEALTH_PROBE_SEC)
+
+
+async def _contend_for_leader():
+    """With shared snapshots, take over polling 511 once the leader worker exits (freeing its lock)."""
+    while not shared_snapshot.try_lead():
+        await asyncio.sleep(shared_snapshot.SHARED_SNAPSHOT_CHECK_SEC)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Settle this worker's role before loading, so only a leader (or an unshared worker) polls 511
+    shared_snapshot.try_lead()
+    # Warm start from the on-disk GTFS cache, then check 511 for a newer feed in the background
+    tasks = []
+    for operator_id in SERVED_OPERATORS:
+        await load_gtfs_cache(operator_id)
+        tasks.append(asyncio.create_task(refresh_gtfs_static(operator_id)))
+        tasks.append(asyncio.create_task(_poll_realtime(operator_id)))
+    tasks.append(asyncio.create_task(_probe_health()))
+    if shared_snapshot.SHARED_SNAPSHOTS:
+        tasks.append(asyncio.create_task(_contend_for_leader()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await upstream.aclose()
+    await shared_snapshot.aclose()
+
 
 app = FastAPI(
     title="Caltrain API",
@@ -41,6 +284,7 @@ app = FastAPI(
     docs_url="/api/docs",
     redoc_url="/api/redoc",
     openapi_url="/api/openapi.json",
+    lifespan=lifespan,
 )
 
 
@@ -56,7 +300,21 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Request latency and status per route template (/api/metrics); unmatched paths share one label."""
+
+    async def dispatch(self, request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, path, request.method)
+        metrics.HTTP_RESPONSES.inc(path, str(response.status_code))
+        return response
+
+
 app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Serve frontend at / for local dev (frontend/ is sibling of backend/)
 _frontend_dir = Path(__file__).resolve().parent.parent / "frontend"
@@ -77,21 +335,64 @@ api_router = APIRouter(prefix="/api", tags=["api"])
 
 
 @api_router.get("/health")
-def health():
-    """Check if the 511 API is reachable and healthy."""
-    ok = check_511_api_health()
-    return {"status": "ok" if ok else "degraded", "511_api": "healthy" if ok else "unreachable"}
+async def health_endpoint():
+    """
+    511 API health as last observed by real requests and the background prober (no upstream call).
+    511_api is "healthy", "degraded", "unreachable" or "unknown"; endpoints has per-endpoint detail,
+    caches the hit/miss/refresh counters and estimated size of each data cache, cache_memory
+    their total against the memory budget, snapshots where this worker gets its feeds.
+    """
+    return {**health.snapshot(), "caches": cache.stats(), "prepared_responses": _prepared.stats(),
+            "cache_memory": cache.memory_stats(), "snapshots": shared_snapshot.stats()}
+
+
+@api_router.get("/internal/snapshot/{operator_id}/{kind}", include_in_schema=False)
+async def internal_snapshot(request: Request, operator_id: str, kind: str):
+    """
+    This host's realtime or static snapshot file, gzip-compressed, for replicas pulling it
+    (see shared_snapshot.py). Not found unless SNAPSHOT_EXPORT_TOKEN is set and sent as a bearer token.
+    """
+    token = shared_snapshot.SNAPSHOT_EXPORT_TOKEN
+    # Compared as bytes: compare_digest rejects non-ASCII str, and the header is client input
+    sent = request.headers.get("Authorization", "").encode("utf-8", "surrogateescape")
+    if not token or not hmac.compare_digest(sent, f"Bearer {token}".encode("utf-8")):
+        return Response(status_code=404)
+    exported = await asyncio.to_thread(shared_snapshot.export, operator_id, kind)
+    if exported is None:
+        return Response(status_code=404)
+    etag, body = exported
+    headers = {"ETag": etag, "Cache-Control": "no-store"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/gzip", headers=headers)
+
+
+@api_router.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus text exposition of this worker: request latency per route, 511 latency per
+    endpoint, GTFS-Realtime parse and GTFS build times, cache counters and departure sources.
+    """
+    return Response(
+        metrics.render({"prepared_responses": _prepared.stats()}),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 @api_router.get("/direction")
-def direction(from_station: str = Query(..., alias="from"), to_station: str = Query(..., alias="to")):
+async def direction(
+    request: Request, from_station: str = Query(..., alias="from"), to_station: str = Query(..., alias="to"),
+):
     """Infer direction (northbound/southbound) from From + To station names."""
-    d = get_direction(from_station, to_station)
-    return {"direction": d}
+    key = ("direction", from_station, to_station)
+    return _cached_response(request, key, _LINE_ORDER_ETAG, STATIONS_CACHE_CONTROL) or _prepare_response(
+        request, key, _LINE_ORDER_ETAG, STATIONS_CACHE_CONTROL, {"direction": get_direction(from_station, to_station)},
+    )
 
 
 @api_router.get("/nearest_station")
-def nearest_station(
+async def nearest_station(
     lat: str = Query(..., description="Latitude"),
     lon: str = Query(..., description="Longitude"),
     max_miles: float = Query(10, ge=0.1, le=50),
@@ -102,36 +403,195 @@ def nearest_station(
         lon_f = float(lon.replace(",", "."))
     except (ValueError, TypeError):
         return {"station": None, "direction": None, "stop_id": None}
-    result = get_nearest_station(lat_f, lon_f, max_miles=max_miles)
+    result = await get_nearest_station(lat_f, lon_f, max_miles=max_miles)
     return result or {"station": None, "direction": None, "stop_id": None}
 
 
+class GeoPoint(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+
+class NearestStationsRequest(BaseModel):
+    points: list[GeoPoint] = Field(..., min_length=1, max_length=NEAREST_BATCH_MAX_POINTS)
+    max_miles: float = Field(10, ge=0.1, le=50)
+    radius_miles: float | None = Field(None, ge=0.1, le=50)
+
+
+@api_router.post("/nearest_stations")
+async def nearest_stations(body: NearestStationsRequest):
+    """
+    Batch nearest-station lookup for up to NEAREST_BATCH_MAX_POINTS points in one query.
+    Each result has "nearest" (station + direction + stop_id + miles, or null beyond max_miles)
+    and, if radius_miles is given, "within": every station within radius_miles, nearest first.
+    """
+    points = [(p.lat, p.lon) for p in body.points]
+    results = await nearest_stations_batch(points, max_miles=body.max_miles, radius_miles=body.radius_miles)
+    return {"results": results}
+
+
 @api_router.get("/stops")
-def stops():
+async def stops(request: Request):
     """List all Caltrain stops (id + name)."""
-    return get_caltrain_stops()
+    model = await get_station_model()
+    etag = _etag("stops", model.version)
+    return _cached_response(request, "stops", etag, STATIONS_CACHE_CONTROL) or _prepare_response(
+        request, "stops", etag, STATIONS_CACHE_CONTROL, model.stops,
+    )
+
+
+@api_router.get("/stops/search")
+async def stops_search(
+    request: Request, q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50),
+):
+    """Station autocomplete: name and word prefixes, then close spellings. Each station lists its platform stop IDs."""
+    model = await get_station_model()
+    etag = _etag("stops_search", model.version)
+    key = ("stops_search", q, limit)
+    response = _cached_response(request, key, etag, STATIONS_CACHE_CONTROL)
+    if response is not None:
+        return response
+    results = await search_stations(q, limit=limit)
+    return _prepare_response(request, key, etag, STATIONS_CACHE_CONTROL, {"query": q, "results": results})
 
 
 @api_router.get("/stops/{stop_id}/trains")
-def trains(stop_id: str, limit: int | None = 10):
+async def trains(stop_id: str, limit: int = Query(10, ge=1, le=NEXT_TRAINS_MAX_LIMIT)):
     """Next train predictions at a stop. Optional query: limit (default 10)."""
-    visits, source = get_next_trains(stop_id, limit=limit)
-    return {"visits": visits, "data_source": source}
+    departures, source, meta = await race_next_trains(stop_id, limit=limit)
+    return {"visits": [visit_dict(d) for d in departures], "data_source": source, "data_source_meta": meta}
 
 
 @api_router.get("/stops_in_direction")
-def stops_in_direction(
+async def stops_in_direction(
+    request: Request,
     from_station: str = Query(..., alias="from"),
     direction: str = ...,
 ):
     """Stations in the given direction from from_station (northbound or southbound)."""
-    return get_stops_in_direction(from_station, direction)
+    model = await get_station_model()
+    etag = _etag("stops_in_direction", model.version)
+    key = ("stops_in_direction", from_station, direction)
+    response = _cached_response(request, key, etag, STATIONS_CACHE_CONTROL)
+    if response is not None:
+        return response
+    stops_list = await get_stops_in_direction(from_station, direction)
+    return _prepare_response(request, key, etag, STATIONS_CACHE_CONTROL, stops_list)
+
+
+def _unknown_operator(operator):
+    return {"stop_id": None, "stop_name": None, "trains": [],
+            "message": f"Unknown operator {operator!r}; served: {', '.join(SERVED_OPERATORS)}."}
 
 
 @api_router.get("/next_trains")
-def next_trains_endpoint(stop: str, limit: int = 5, direction: str | None = None, to: str | None = None):
-    """Next trains at a stop. Pass stop by ID or name; use direction when name has two platforms. Optional to= for trip time to that station."""
-    return next_trains(stop, limit=limit, direction=direction, to_stop=to)
+async def next_trains_endpoint(
+    request: Request, stop: str, limit: int = Query(5, ge=1, le=NEXT_TRAINS_MAX_LIMIT),
+    direction: str | None = None, to: str | None = None, operator: str = CALTRAIN_OPERATOR_ID,
+):
+    """
+    Next trains at a stop. Pass stop by ID or name; use direction when name has two platforms. Optional to= for trip time to that station.
+    operator picks the agency (default Caltrain, CT); one of SERVED_OPERATORS.
+    GTFS-Realtime answers carry an ETag from the snapshot versions and the current minute (minutes_until
+    changes with it), so a revalidation while nothing changed is answered 304 before any work, and
+    a repeat of the same query is served from the body encoded for the first one.
+    """
+    if operator not in SERVED_OPERATORS:
+        return _unknown_operator(operator)
+    minute = int(time.time() // 60)
+    key = ("next_trains", operator, stop, limit, direction, to)
+    version = next_trains_data_version(operator)
+    if version is not None:
+        response = _cached_response(request, key, _etag("next_trains", *version, minute), NEXT_TRAINS_CACHE_CONTROL)
+        if response is not None:
+            return response
+    result = await next_trains(stop, limit=limit, direction=direction, to_stop=to, operator_id=operator)
+    version = next_trains_data_version(operator)
+    if result.get("data_source") == "gtfs_realtime" and version is not None:
+        etag = _etag("next_trains", *version, minute)
+        return _prepare_response(request, key, etag, NEXT_TRAINS_CACHE_CONTROL, result)
+    # Timetable / StopMonitoring answers aren't snapshotted; version them by content, don't keep them
+    content = {k: v for k, v in result.items() if k != "data_source_meta"}
+    etag = _etag("next_trains", json.dumps(content, sort_keys=True), minute)
+    if _etag_matches(request, etag):
+        return _not_modified(etag, NEXT_TRAINS_CACHE_CONTROL)
+    # Not kept, so only the encoding this client negotiated is built
+    data, coding = encode(result, request.headers.get("accept-encoding", ""))
+    return _encoded_response(data, coding, etag, NEXT_TRAINS_CACHE_CONTROL)
+
+
+@api_router.get("/journey")
+async def journey(
+    from_station: str = Query(..., alias="from", min_length=1, max_length=100),
+    to_station: str = Query(..., alias="to", min_length=1, max_length=100),
+    depart_at: str | None = Query(None, description="Epoch seconds, ISO 8601 or HH:MM (Pacific); default now"),
+    max_transfers: int = Query(2, ge=0, le=3),
+):
+    """
+    Earliest-arrival itineraries between two stations, with transfers (e.g. Local to Limited at
+    Redwood City). One per transfer count, each arriving strictly earlier than the one before.
+    """
+    depart_ts = parse_depart_at(depart_at) if depart_at else None
+    if depart_at and depart_ts is None:
+        return {"from": None, "to": None, "depart_at": None, "realtime": False, "itineraries": [],
+                "message": "depart_at must be epoch seconds, ISO 8601 or HH:MM, within a year of now."}
+    return await plan_journey(from_station, to_station, depart_ts=depart_ts, max_transfers=max_transfers)
+
+
+class NextTrainsQuery(BaseModel):
+    stop: str = Field(..., min_length=1, max_length=100)
+    direction: str | None = None
+    to: str | None = Field(None, max_length=100)
+    limit: int = Field(5, ge=1, le=NEXT_TRAINS_MAX_LIMIT)
+
+
+class NextTrainsBatchRequest(BaseModel):
+    queries: list[NextTrainsQuery] = Field(..., min_length=1, max_length=NEXT_TRAINS_BATCH_MAX_QUERIES)
+    operator: str = CALTRAIN_OPERATOR_ID
+
+
+@api_router.post("/next_trains/batch")
+async def next_trains_batch_endpoint(body: NextTrainsBatchRequest):
+    """
+    Next trains for up to NEXT_TRAINS_BATCH_MAX_QUERIES stops (departure boards), all from one
+    GTFS-Realtime snapshot. Results are in query order, each shaped like /api/next_trains;
+    data_source and feed_timestamp describe the shared snapshot. operator as for /api/next_trains.
+    """
+    if body.operator not in SERVED_OPERATORS:
+        return {"data_source": None, "feed_timestamp": None, "fetched_at": None,
+                "results": [_unknown_operator(body.operator) for _ in body.queries]}
+    return await next_trains_batch([q.model_dump() for q in body.queries], operator_id=body.operator)
+
+
+@api_router.get("/stream/next_trains")
+async def stream_next_trains(
+    request: Request,
+    stop: str,
+    limit: int = Query(5, ge=1, le=NEXT_TRAINS_MAX_LIMIT),
+    direction: str | None = None,
+    to: str | None = None,
+):
+    """Server-Sent Events: same payload as /next_trains, pushed whenever the background poll changes it."""
+    key = (stop, direction, to, limit)
+    queue = hub.subscribe(key)
+
+    async def events():
+        try:
+            if queue.empty():
+                await hub.publish(key)
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            hub.unsubscribe(key, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 app.include_router(api_router)
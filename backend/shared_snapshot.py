@@ -0,0 +1,224 @@
+"""
+Feed snapshots shared by the worker processes of a host, and pulled by replicas from another host.
+
+With SHARED_SNAPSHOTS=1 the workers elect a leader through an exclusive flock on leader.lock in
+GTFS_CACHE_DIR. Only the leader polls 511. Each realtime feed it fetches is written to
+rt_<operator>.bin beside the compiled static GTFS it already saves there (gtfs_cache.py), always
+to a temporary file renamed over the old one: a reader sees the previous version or the new one,
+never half of either. The other workers (followers) adopt those files instead of calling 511.
+The static timetable is memory-mapped, so its columns are shared through the page cache rather
+than copied per worker. The realtime feed is mapped and parsed only when its version changes.
+The lock dies with its process, so when the leader exits the next worker to retry try_lead()
+takes over (the server retries every SHARED_SNAPSHOT_CHECK_SEC; feed_source() only reads the
+role, so it is cheap and has no side effects).
+
+Realtime file layout:
+  MAGIC | f64 fetched_at | 40-byte sha1 hex of the feed (GtfsRtSnapshot.version) | tripupdates protobuf
+
+SNAPSHOT_EXPORT_TOKEN enables GET /api/internal/snapshot/{operator}/{kind} (kind "realtime" or
+"static"), which serves these files gzip-compressed to requests bearing that token. A replica
+with SNAPSHOT_SOURCE_URL (and SNAPSHOT_SOURCE_TOKEN) set pulls them from there (conditional on
+ETag) instead of polling 511, so a fleet makes one set of 511 calls.
+"""
+
+import asyncio
+import fcntl
+import gzip
+import hashlib
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+import httpx
+
+try:
+    from backend import gtfs_cache
+except ModuleNotFoundError:
+    import gtfs_cache
+
+SHARED_SNAPSHOTS = os.getenv("SHARED_SNAPSHOTS", "0") == "1"
+SNAPSHOT_SOURCE_URL = os.getenv("SNAPSHOT_SOURCE_URL", "").rstrip("/")
+SNAPSHOT_SOURCE_TOKEN = os.getenv("SNAPSHOT_SOURCE_TOKEN")
+SNAPSHOT_EXPORT_TOKEN = os.getenv("SNAPSHOT_EXPORT_TOKEN")
+# Seconds between checks for a new shared snapshot by workers that don't poll 511 themselves
+SHARED_SNAPSHOT_CHECK_SEC = float(os.getenv("SHARED_SNAPSHOT_CHECK_SEC", "2"))
+SNAPSHOT_PULL_TIMEOUT_SEC = 60
+
+MAGIC = b"CTRT\0"
+KINDS = ("realtime", "static")
+_HEADER = struct.Struct("<d40s")
+
+# content is a memoryview of the mapped file
+RealtimeFile = namedtuple("RealtimeFile", "fetched_at version content")
+
+_lock_file = None
+_seen = {}  # path -> (inode, mtime) when last adopted
+_exports = {}  # path -> ((inode, mtime), ETag, gzip body)
+_pulled = {}  # (operator_id, kind) -> ETag of the copy pulled last
+_client = None
+_loop = None
+
+
+def try_lead():
+    """
+    Take the leader lock if sharing is on and the lock is free. True if this process holds it.
+    Does file I/O: call it at startup and on a timer, not on every read of the role.
+    """
+    global _lock_file
+    if _lock_file is not None:
+        return True
+    if not SHARED_SNAPSHOTS:
+        return False
+    path = gtfs_cache.GTFS_CACHE_DIR / "leader.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(path, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    f.seek(0)
+    f.truncate()
+    f.write(f"{os.getpid()}\n")
+    f.flush()
+    _lock_file = f
+    return True
+
+
+def feed_source():
+    """
+    Where this process gets feeds from now: "upstream" (polls 511), "local" (a follower: adopts
+    the files this host's leader writes) or "remote" (pulls them from SNAPSHOT_SOURCE_URL).
+    """
+    if SHARED_SNAPSHOTS and _lock_file is None:
+        return "local"
+    return "remote" if SNAPSHOT_SOURCE_URL else "upstream"
+
+
+def stats():
+    """Snapshot sharing settings and this worker's role, for /api/health."""
+    return {
+        "shared": SHARED_SNAPSHOTS,
+        "source": feed_source(),
+        "source_url": SNAPSHOT_SOURCE_URL or None,
+        "export": bool(SNAPSHOT_EXPORT_TOKEN),
+        "pid": os.getpid(),
+    }
+
+
+def path(operator_id, kind):
+    if kind == "static":
+        return gtfs_cache.cache_path(operator_id)
+    return gtfs_cache.GTFS_CACHE_DIR / f"rt_{operator_id}.bin"
+
+
+def _signature(p):
+    try:
+        st = os.stat(p)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def changed(p):
+    """True if the file at p was replaced since mark_seen(p) (and exists)."""
+    signature = _signature(p)
+    return signature is not None and signature != _seen.get(p)
+
+
+def mark_seen(p):
+    _seen[p] = _signature(p)
+
+
+def _write_atomic(p, chunks):
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, p)
+
+
+def write_realtime(operator_id, content, fetched_at=None):
+    """Publish a tripupdates protobuf for followers (atomic replace)."""
+    version = hashlib.sha1(content).hexdigest().encode("ascii")
+    header = _HEADER.pack(time.time() if fetched_at is None else fetched_at, version)
+    _write_atomic(path(operator_id, "realtime"), (MAGIC, header, content))
+
+
+def read_realtime(operator_id):
+    """The published RealtimeFile for operator_id, or None if there is none (or it is unreadable)."""
+    p = path(operator_id, "realtime")
+    try:
+        with open(p, "rb") as f:
+            raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mark_seen(p)
+        if raw[:len(MAGIC)] != MAGIC:
+            return None
+        fetched_at, version = _HEADER.unpack_from(raw, len(MAGIC))
+    except (OSError, ValueError, struct.error):
+        return None
+    return RealtimeFile(fetched_at, version.decode("ascii"), memoryview(raw)[len(MAGIC) + _HEADER.size:])
+
+
+def export(operator_id, kind):
+    """
+    (ETag, gzip-compressed file) of operator_id's kind snapshot on this host, or None if there
+    is none. Compressed once per version of the file.
+    """
+    if kind not in KINDS or not operator_id.isalnum():
+        return None
+    p = path(operator_id, kind)
+    signature = _signature(p)
+    if signature is None:
+        return None
+    cached = _exports.get(p)
+    if cached is not None and cached[0] == signature:
+        return cached[1:]
+    try:
+        body = gzip.compress(p.read_bytes(), compresslevel=6)
+    except OSError:
+        return None
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    _exports[p] = (signature, etag, body)
+    return etag, body
+
+
+def _get_client():
+    global _client, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        headers = {"Authorization": f"Bearer {SNAPSHOT_SOURCE_TOKEN}"} if SNAPSHOT_SOURCE_TOKEN else None
+        _client = httpx.AsyncClient(base_url=SNAPSHOT_SOURCE_URL, headers=headers, timeout=SNAPSHOT_PULL_TIMEOUT_SEC)
+        _loop = loop
+    return _client
+
+
+async def pull(operator_id, kind):
+    """
+    Copy operator_id's kind snapshot from SNAPSHOT_SOURCE_URL into the local file if it changed
+    since the last pull. Returns True if it did; raises on failure.
+    """
+    headers = {}
+    etag = _pulled.get((operator_id, kind))
+    if etag:
+        headers["If-None-Match"] = etag
+    r = await _get_client().get(f"/api/internal/snapshot/{operator_id}/{kind}", headers=headers)
+    if r.status_code == 304:
+        return False
+    r.raise_for_status()
+    content = await asyncio.to_thread(gzip.decompress, r.content)
+    await asyncio.to_thread(_write_atomic, path(operator_id, kind), (content,))
+    _pulled[(operator_id, kind)] = r.headers.get("ETag")
+    return True
+
+
+async def aclose():
+    """Close the pull client (call on app shutdown)."""
+    global _client, _loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _loop = None
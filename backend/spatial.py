@@ -0,0 +1,115 @@
+"""
+Spatial index over stop coordinates for nearest-station and radius lookups.
+
+StopIndex buckets stops into a lat/lon grid held in numpy arrays. A query (one point or
+thousands) picks candidate cells for every point at once, then refines all candidates with
+one vectorised haversine. Built once per stop-list refresh; read-only afterwards.
+Longitudes are not wrapped at +/-180, which is fine for a regional network.
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3959
+MILES_PER_DEG_LAT = 69.05
+
+# Grid cell size in degrees (~7 miles north-south); a few stops per cell on Caltrain
+GRID_CELL_DEG = 0.1
+
+
+def valid_point(lat, lon):
+    """True if (lat, lon) are finite degrees within +/-90 and +/-180."""
+    return math.isfinite(lat) and math.isfinite(lon) and abs(lat) <= 90 and abs(lon) <= 180
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles; arguments in degrees, scalars or numpy arrays (broadcast)."""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StopIndex:
+    """
+    Grid index over stops that have "lat" and "lon". Cells are stored CSR-style: the stops of
+    cell k are order[start[k]:start[k] + count[k]], and (cell_y[k], cell_x[k]) is its grid position.
+    """
+
+    def __init__(self, stops, cell_deg=GRID_CELL_DEG):
+        self.stops = tuple(s for s in stops if "lat" in s and "lon" in s)
+        self.cell_deg = cell_deg
+        self.lat = np.array([s["lat"] for s in self.stops], dtype=np.float64)
+        self.lon = np.array([s["lon"] for s in self.stops], dtype=np.float64)
+        cells = np.stack([np.floor(self.lat / cell_deg), np.floor(self.lon / cell_deg)], axis=1).astype(np.int64)
+        uniq, inverse, counts = np.unique(cells.reshape(-1, 2), axis=0, return_inverse=True, return_counts=True)
+        self._cell_y = uniq[:, 0]
+        self._cell_x = uniq[:, 1]
+        self._count = counts
+        self._start = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        self._order = np.argsort(inverse.ravel(), kind="stable")
+
+    def __len__(self):
+        return len(self.stops)
+
+    def query(self, lats, lons, radius_miles):
+        """
+        Stops within radius_miles of each point. Returns one list per point of (stop, miles),
+        nearest first; empty for points that aren't valid coordinates (see valid_point).
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        n_points = len(lats)
+        if not self.stops or n_points == 0:
+            return [[] for _ in range(n_points)]
+        valid = np.isfinite(lats) & np.isfinite(lons) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+        if not valid.all():
+            results = [[] for _ in range(n_points)]
+            for p, hits in zip(np.flatnonzero(valid).tolist(), self.query(lats[valid], lons[valid], radius_miles)):
+                results[p] = hits
+            return results
+        # Candidate cells: every occupied cell overlapping each point's radius box (points x cells)
+        reach_y = np.ceil(radius_miles / MILES_PER_DEG_LAT / self.cell_deg)
+        cos_lat = np.maximum(np.cos(np.radians(lats)), 0.01)
+        reach_x = np.ceil(radius_miles / (MILES_PER_DEG_LAT * cos_lat) / self.cell_deg)
+        point_y = np.floor(lats / self.cell_deg)
+        point_x = np.floor(lons / self.cell_deg)
+        hit = (np.abs(point_y[:, None] - self._cell_y[None, :]) <= reach_y) & (
+            np.abs(point_x[:, None] - self._cell_x[None, :]) <= reach_x[:, None]
+        )
+        point_i, cell_k = np.nonzero(hit)
+        # Expand (point, cell) pairs into (point, stop) candidate pairs
+        counts = self._count[cell_k]
+        total = int(counts.sum())
+        pair_point = np.repeat(point_i, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_stop = self._order[np.repeat(self._start[cell_k], counts) + offsets]
+        # Refine all candidates at once
+        miles = haversine_miles(lats[pair_point], lons[pair_point], self.lat[pair_stop], self.lon[pair_stop])
+        keep = miles <= radius_miles
+        pair_point, pair_stop, miles = pair_point[keep], pair_stop[keep], miles[keep]
+        order = np.lexsort((miles, pair_point))
+        pair_point, pair_stop, miles = pair_point[order], pair_stop[order], miles[order]
+        bounds = np.searchsorted(pair_point, np.arange(n_points + 1))
+        stop_list, mile_list = pair_stop.tolist(), miles.tolist()
+        return [
+            [(self.stops[stop_list[j]], mile_list[j]) for j in range(bounds[p], bounds[p + 1])]
+            for p in range(n_points)
+        ]
+
+    def nearest(self, lat, lon, max_miles):
+        """(stop, miles) of the closest stop within max_miles of one point, or None (also for invalid points)."""
+        if not self.stops or not valid_point(lat, lon):
+            return None
+        reach_y = math.ceil(max_miles / MILES_PER_DEG_LAT / self.cell_deg)
+        reach_x = math.ceil(max_miles / (MILES_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01)) / self.cell_deg)
+        point_y, point_x = math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+        cells = np.flatnonzero((np.abs(self._cell_y - point_y) <= reach_y) & (np.abs(self._cell_x - point_x) <= reach_x))
+        if not len(cells):
+            return None
+        cand = np.concatenate([self._order[self._start[k]:self._start[k] + self._count[k]] for k in cells.tolist()])
+        miles = haversine_miles(lat, lon, self.lat[cand], self.lon[cand])
+        j = int(np.argmin(miles))
+        if miles[j] > max_miles:
+            return None
+        return self.stops[cand[j]], float(miles[j])
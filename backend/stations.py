@@ -0,0 +1,183 @@
+"""
+Immutable station model built once per stop-list refresh.
+
+Groups platform stops ("San Mateo Caltrain Station Northbound" / "... Southbound") into
+stations in line order, and precomputes everything request handlers used to derive by
+scanning the stop list: ID and name lookups, line indexes, the stops downstream of each
+station in each direction, and a prefix index for autocomplete.
+"""
+
+import bisect
+import difflib
+import hashlib
+import re
+from collections import namedtuple
+
+# name: display name ("San Mateo"); line_index: position in the line order (len(order) if unknown);
+# platforms: (("northbound", stop), ("southbound", stop)) for the platforms that exist
+Station = namedtuple("Station", "name line_index platforms")
+
+_DIRECTION_SUFFIX = re.compile(r"\s+Caltrain Station (Northbound|Southbound)$", re.I)
+
+
+def display_name(stop):
+    """Station name without the platform suffix (e.g. 'San Mateo')."""
+    return _DIRECTION_SUFFIX.sub("", (stop.get("Name") or "").strip()).strip()
+
+
+def stop_direction(stop):
+    """'northbound' / 'southbound' from the stop name, or None."""
+    name = stop.get("Name") or ""
+    if "Northbound" in name:
+        return "northbound"
+    if "Southbound" in name:
+        return "southbound"
+    return None
+
+
+class StationModel:
+    """
+    Lookups over one stop list (a tuple of {"id", "Name"} dicts, already in line order).
+    Treat it as read-only; a refreshed stop list gets a new model. version is a hash of the
+    stop IDs and names, so it only changes when the list does (same value in every worker).
+    """
+
+    def __init__(self, stops, line_order):
+        self.stops = tuple(stops)
+        self.version = hashlib.sha1(
+            "\n".join(f"{s.get('id')}\t{s.get('Name')}" for s in self.stops).encode("utf-8")
+        ).hexdigest()
+        self.line_order = {name.lower(): i for i, name in enumerate(line_order)}
+        unknown = len(line_order)
+        self.by_id = {}
+        self.by_name = {}  # lowercased full stop name -> stop
+        self._stop_station = {}  # stop id -> Station
+        stations = {}  # display name -> [line index, {direction: stop}]
+        for s in self.stops:
+            stop_id = s.get("id")
+            self.by_id.setdefault(stop_id, s)
+            self.by_name.setdefault((s.get("Name") or "").lower(), s)
+            name = display_name(s)
+            entry = stations.setdefault(name, [self.line_order.get(name.lower(), unknown), {}])
+            entry[1].setdefault(stop_direction(s), s)
+        self.stations = tuple(
+            Station(name, line_index, tuple(platforms.items()))
+            for name, (line_index, platforms) in stations.items()
+        )
+        self.by_station_name = {st.name.lower(): st for st in self.stations}
+        by_display = {st.name: st for st in self.stations}
+        for s in self.stops:
+            self._stop_station.setdefault(s.get("id"), by_display[display_name(s)])
+        self._downstream = self._build_downstream()
+        self._prefix_keys, self._prefix_stations = self._build_prefix_index()
+
+    def station_of(self, stop_id):
+        """Station that stop_id belongs to, or None."""
+        return self._stop_station.get(stop_id)
+
+    def line_index(self, stop_id):
+        st = self._stop_station.get(stop_id)
+        return st.line_index if st is not None else len(self.line_order)
+
+    def _build_downstream(self):
+        """(line index, southbound?) -> stops past that point, one per station, in line order."""
+        downstream = {}
+        indexes = {st.line_index for st in self.stations}
+        for from_idx in indexes:
+            for south in (True, False):
+                result, seen = [], set()
+                for s in self.stops:
+                    st = self._stop_station[s.get("id")]
+                    if (st.line_index > from_idx if south else st.line_index < from_idx) and st.name not in seen:
+                        seen.add(st.name)
+                        result.append(s)
+                downstream[(from_idx, south)] = tuple(result)
+        return downstream
+
+    def downstream(self, stop_id, southbound):
+        """Stops after stop_id's station in the given direction (one platform per station), in line order."""
+        st = self._stop_station.get(stop_id)
+        if st is None:
+            return ()
+        return self._downstream[(st.line_index, bool(southbound))]
+
+    def resolve(self, query, direction=None):
+        """
+        Stop ID or name -> (stop_id, stop_name, message), like caltrain._resolve_stop.
+        IDs and exact station or stop names are dict lookups; other text falls back to a
+        case-insensitive substring match over stop names. direction is "Northbound"/"Southbound"
+        or None; message is set when the name matches several platforms and no direction is given.
+        """
+        s = str(query).strip()
+        if s.isdigit():
+            stop = self.by_id.get(s)
+            return s, stop.get("Name") if stop else None, None
+        key = s.lower()
+        stop = self.by_name.get(key)
+        if stop is not None:
+            return stop.get("id"), stop.get("Name"), None
+        st = self.by_station_name.get(key)
+        matches = [p for _, p in st.platforms] if st is not None else [
+            p for p in self.stops if key in (p.get("Name") or "").lower()
+        ]
+        if not matches:
+            return None, None, None
+        if len(matches) == 1:
+            return matches[0].get("id"), matches[0].get("Name"), None
+        if direction:
+            for p in matches:
+                if direction in (p.get("Name") or ""):
+                    return p.get("id"), p.get("Name"), None
+            return None, None, None
+        return None, None, "Multiple stops match. Specify direction: Northbound or Southbound."
+
+    def find_station(self, query):
+        """
+        Station for a stop ID, station name or platform name; otherwise the best autocomplete
+        match (see search). None if nothing matches.
+        """
+        s = str(query or "").strip()
+        key = s.lower()
+        if s.isdigit():
+            return self.station_of(s)
+        if key in self.by_station_name:
+            return self.by_station_name[key]
+        stop = self.by_name.get(key)
+        if stop is not None:
+            return self.station_of(stop.get("id"))
+        found = self.search(s, limit=1)
+        return found[0] if found else None
+
+    def _build_prefix_index(self):
+        """Sorted (key, station) pairs where key is the lowercased name from each word onward."""
+        entries = []
+        for st in self.stations:
+            words = st.name.lower().split()
+            for i in range(len(words)):
+                entries.append((" ".join(words[i:]), i, st.line_index, st.name))
+        entries.sort()
+        return [e[0] for e in entries], [(e[1], e[2], e[3]) for e in entries]
+
+    def search(self, query, limit=10):
+        """
+        Stations matching query for autocomplete: name prefixes, then word prefixes ("jose"
+        finds "San Jose Diridon"), each in line order; then close spellings, best first.
+        """
+        q = " ".join(str(query or "").lower().split())
+        if not q or limit <= 0:
+            return []
+        lo = bisect.bisect_left(self._prefix_keys, q)
+        hi = bisect.bisect_left(self._prefix_keys, q + "\uffff")
+        # (word position, line index) ranks whole-name prefixes before word prefixes
+        best = {}
+        for word_pos, line_index, name in self._prefix_stations[lo:hi]:
+            rank = (min(word_pos, 1), line_index)
+            if name not in best or rank < best[name]:
+                best[name] = rank
+        names = sorted(best, key=best.get)
+        if len(names) < limit:
+            by_lower = {st.name.lower(): st.name for st in self.stations}
+            for close in difflib.get_close_matches(q, list(by_lower), n=limit, cutoff=0.6):
+                if by_lower[close] not in best:
+                    names.append(by_lower[close])
+        return [self.by_station_name[name.lower()] for name in names[:limit]]
@@ -0,0 +1,185 @@
+"""
+Async HTTP client for the 511 SF Bay API.
+
+One pooled httpx.AsyncClient per event loop: keep-alive connections, HTTP/2 when the
+h2 package is installed, per-endpoint timeouts, and a semaphore bounding concurrent
+upstream requests. Every request's outcome and latency is recorded in health.py.
+Set API_BASE_URL to send requests to a local stub instead of
+api.511.org (see scripts/stub_511.py).
+
+UPSTREAM_RECORD=<file> appends every response (or failure) to a replay archive;
+UPSTREAM_REPLAY=<file> answers every request from one instead of the network, with the
+recorded status and latency, on a clock running UPSTREAM_REPLAY_SPEED times real time
+(see replay.py). A request the archive never saw fails like a connection error.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+# Support both: run from repo root (backend.health) and from app root (health, e.g. Docker)
+try:
+    from backend import health, replay
+except ModuleNotFoundError:
+    import health
+    import replay
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+API_BASE_URL = os.getenv("API_BASE_URL", "https://api.511.org").rstrip("/")
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))
+
+# Seconds per endpoint (path under /transit). The GTFS zip is several MB, so it gets longer.
+ENDPOINT_TIMEOUTS = {
+    "tripupdates": 10,
+    "stoptimetable": 10,
+    "StopMonitoring": 10,
+    "stops": 10,
+    "datafeeds": 60,
+}
+DEFAULT_TIMEOUT = 10
+
+UPSTREAM_RECORD = os.getenv("UPSTREAM_RECORD")
+UPSTREAM_REPLAY = os.getenv("UPSTREAM_REPLAY")
+UPSTREAM_REPLAY_SPEED = float(os.getenv("UPSTREAM_REPLAY_SPEED", "1"))
+# Move recorded GTFS-RT / SIRI times to the present on replay (0 to serve them as recorded)
+UPSTREAM_REPLAY_SHIFT_TIMES = os.getenv("UPSTREAM_REPLAY_SHIFT_TIMES", "1") != "0"
+
+_client = None
+_semaphore = None
+_loop = None
+_recorder = None
+_replayer = None
+
+
+def _get_client():
+    """Client and semaphore for the running loop (recreated if called from a new loop, e.g. CLI asyncio.run)."""
+    global _client, _semaphore, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        _client = httpx.AsyncClient(
+            base_url=API_BASE_URL,
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONCURRENCY,
+                max_keepalive_connections=UPSTREAM_MAX_CONCURRENCY,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+        _loop = loop
+    return _client, _semaphore
+
+
+async def aclose():
+    """Close pooled connections (call on app shutdown)."""
+    global _client, _loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _loop = None
+
+
+def _get_recorder():
+    global _recorder
+    if _recorder is None:
+        _recorder = replay.ArchiveWriter(UPSTREAM_RECORD)
+    return _recorder
+
+
+def _get_replayer():
+    global _replayer
+    if _replayer is None:
+        _replayer = replay.Replayer(
+            UPSTREAM_REPLAY, speed=UPSTREAM_REPLAY_SPEED, shift_times=UPSTREAM_REPLAY_SHIFT_TIMES,
+        )
+    return _replayer
+
+
+async def _replay_get(endpoint, params, headers):
+    """The archived answer to a request as an httpx.Response, after its recorded latency."""
+    url = f"{API_BASE_URL}/transit/{endpoint}"
+    request = httpx.Request("GET", url, params={k: v for k, v in params.items() if k != "api_key"})
+    answer = _get_replayer().respond(endpoint, params, headers)
+    if answer is None:
+        raise httpx.ConnectError(f"{endpoint} request not in the replay archive", request=request)
+    record, status, response_headers, body = answer
+    await asyncio.sleep(record.latency_ms / 1000 / UPSTREAM_REPLAY_SPEED)
+    if status == 0:
+        error = getattr(httpx, record.error or "", None)
+        if not (isinstance(error, type) and issubclass(error, httpx.RequestError)):
+            error = httpx.ConnectError
+        raise error(f"replayed {record.error}", request=request)
+    return httpx.Response(status, headers=response_headers, content=body, request=request)
+
+
+async def _recorded_get(client, endpoint, params, headers, timeout):
+    """client.get, with the response (or the exception's name) appended to the archive."""
+    sent = time.time()
+    start = time.perf_counter()
+    try:
+        r = await client.get(f"/transit/{endpoint}", params=params, headers=headers, timeout=timeout)
+    except Exception as e:
+        await asyncio.to_thread(
+            _get_recorder().append, sent, endpoint, params, 0, (time.perf_counter() - start) * 1000,
+            error=type(e).__name__,
+        )
+        raise
+    await asyncio.to_thread(
+        _get_recorder().append, sent, endpoint, params, r.status_code, (time.perf_counter() - start) * 1000,
+        headers={k: r.headers.get(k) for k in replay.KEPT_HEADERS}, body=r.content,
+    )
+    return r
+
+
+async def fetch_response(endpoint, params, headers=None, timeout=None):
+    """
+    GET /transit/<endpoint> and return the httpx.Response (body read).
+    Raises on network error or non-2xx status, except 304 Not Modified for conditional requests.
+    """
+    client, semaphore = _get_client()
+    if timeout is None:
+        timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            if UPSTREAM_REPLAY:
+                r = await _replay_get(endpoint, params, headers)
+            elif UPSTREAM_RECORD:
+                r = await _recorded_get(client, endpoint, params, headers, timeout)
+            else:
+                r = await client.get(f"/transit/{endpoint}", params=params, headers=headers, timeout=timeout)
+            if r.status_code != 304:
+                r.raise_for_status()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            health.record(endpoint, False, (time.perf_counter() - start) * 1000, error=_describe_error(e))
+            raise
+    health.record(endpoint, True, (time.perf_counter() - start) * 1000)
+    return r
+
+
+def _describe_error(e):
+    """Short, key-free description of a failed request for /api/health (never the URL: it has the api_key)."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP {e.response.status_code}"
+    return type(e).__name__
+
+
+async def fetch_bytes(endpoint, params, timeout=None):
+    """GET /transit/<endpoint> and return the body. Raises on network error or non-2xx status."""
+    r = await fetch_response(endpoint, params, timeout=timeout)
+    return r.content
+
+
+async def fetch_json(endpoint, params, timeout=None):
+    """GET /transit/<endpoint> as JSON; handles the UTF-8 BOM 511 puts in front of its JSON."""
+    content = await fetch_bytes(endpoint, params, timeout=timeout)
+    return json.loads(content.decode("utf-8-sig"))
@@ -1,6 +1,7 @@
 (function () {
   var STORAGE_KEY = "caltrain_default";
   var TRAINS_CACHE_TTL_MS = 5 * 60 * 1000; // 5 minutes
+  var MAX_TRAINS = 50; // the API's limit cap (see /api/next_trains)
   var trainsCache = {};
 
   function el(id) {
@@ -217,6 +218,9 @@
     travelEl.className = "travel-minutes";
     if (t.travel_minutes != null && t.travel_minutes >= 0) {
       travelEl.textContent = t.travel_minutes + " min";
+      if (t.arrival) {
+        travelEl.title = "Arrives " + t.arrival + (t.scheduled_arrival && t.scheduled_arrival !== t.arrival ? " (scheduled " + t.scheduled_arrival + ")" : "");
+      }
     } else if (isFirstRow && !hasToStation) {
       travelEl.textContent = "pick a To station above";
       travelEl.classList.add("travel-minutes--hint");
@@ -295,11 +299,11 @@
       sourceEl.style.display = label ? "" : "none";
     }
     if (seeMore) {
-      seeMore.style.display = trains.length >= limit ? "" : "none";
+      seeMore.style.display = trains.length >= limit && limit < MAX_TRAINS ? "" : "none";
       seeMore.onclick = function () {
         var listEl = el("train-list");
         var currentCount = listEl ? listEl.children.length : 0;
-        fetchTrains(currentCount + 5, { append: true });
+        fetchTrains(Math.min(currentCount + 5, MAX_TRAINS), { append: true });
       };
     }
     var dirLabel = el("direction-label");
@@ -321,6 +325,7 @@
     var limit = limitOverride != null ? limitOverride : 5;
 
     if (!station || !toStation) {
+      closeTrainStream();
       show(el("error"), true);
       el("error").textContent = "Choose From and To stations.";
       show(el("message"), false);
@@ -335,9 +340,11 @@
       var cached = getCachedTrains(station, direction, limit, toStation);
       if (cached) {
         applyTrainResults(cached, false, limit);
-        return;
+        // Without streaming, the cached result is all we show; with it, keep subscribing for updates
+        if (!window.EventSource) return;
+      } else {
+        show(el("loading"), true);
       }
-      show(el("loading"), true);
     }
 
     var stopIdOverride = el("stop-id-override") && el("stop-id-override").value;
@@ -346,18 +353,55 @@
     if (direction) params += "&direction=" + encodeURIComponent(direction);
     if (toStation) params += "&to=" + encodeURIComponent(toStation);
 
+    function onTrains(data, append) {
+      if (!appendOnly) show(el("loading"), false);
+      setCachedTrains(station, direction, limit, toStation, data);
+      applyTrainResults(data, append, limit);
+    }
+
+    function onTrainsError(err) {
+      show(el("loading"), false);
+      el("error").textContent = (err && err.message) || "Something went wrong.";
+      show(el("error"), true);
+    }
+
+    if (window.EventSource) {
+      subscribeTrains(params, onTrains, onTrainsError, appendOnly);
+      return;
+    }
     fetch("/api/next_trains?" + params)
       .then(function (r) { return safeJson(r, {}); })
-      .then(function (data) {
-        if (!appendOnly) show(el("loading"), false);
-        setCachedTrains(station, direction, limit, toStation, data);
-        applyTrainResults(data, appendOnly, limit);
-      })
-      .catch(function (err) {
-        show(el("loading"), false);
-        el("error").textContent = err.message || "Something went wrong.";
-        show(el("error"), true);
-      });
+      .then(function (data) { onTrains(data, appendOnly); })
+      .catch(onTrainsError);
+  }
+
+  // Server pushes next_trains updates (one backend poll shared by all clients) instead of us re-polling.
+  var trainStream = null;
+
+  function closeTrainStream() {
+    if (trainStream) trainStream.close();
+    trainStream = null;
+  }
+
+  function subscribeTrains(params, onData, onError, appendOnly) {
+    closeTrainStream();
+    var source = new EventSource("/api/stream/next_trains?" + params);
+    var received = false;
+    trainStream = source;
+    source.onmessage = function (e) {
+      var data;
+      try { data = JSON.parse(e.data); } catch (err) { return; }
+      // Only the first message of a "see more" subscription appends; later ones redraw the list
+      onData(data, appendOnly && !received);
+      received = true;
+    };
+    source.onerror = function () {
+      // EventSource reconnects by itself; only report if we never got data
+      if (!received && source.readyState === EventSource.CLOSED) {
+        if (trainStream === source) trainStream = null;
+        onError(new Error("Could not load trains."));
+      }
+    };
   }
 
   el("form").addEventListener("submit", function (e) {
@@ -472,11 +516,16 @@
     fetch("/api/health")
       .then(function (r) { return safeJson(r, {}); })
       .then(function (data) {
-        var ok = data["511_api"] === "healthy";
+        var state = data["511_api"];
+        var ok = state === "healthy" || state === "degraded";
         if (dot) {
           dot.className = "api-status-dot " + (ok ? "api-status-ok" : "api-status-down");
         }
-        if (text) text.textContent = ok ? "511 API healthy" : "511 API unreachable";
+        if (text) {
+          text.textContent = state === "healthy" ? "511 API healthy"
+            : state === "degraded" ? "511 API degraded"
+            : state === "unknown" ? "511 API status pending" : "511 API unreachable";
+        }
       })
       .catch(function () {
         if (dot) dot.className = "api-status-dot api-status-down";
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request CPU and allocations of building next_trains answers from the GTFS-RT
+snapshot, legacy per-visit dicts with ISO strings vs. Departure records formatted once.
+Run from project root: python3 scripts/bench_departures.py [--feed tripupdates.pb] [--gtfs caltrain_gtfs.zip]
+
+Without --feed / --gtfs, synthetic Caltrain-sized ones are generated. To record real ones:
+  curl -o tripupdates.pb "https://api.511.org/transit/tripupdates?api_key=$API_KEY&agency=CT"
+  curl -o caltrain_gtfs.zip "https://api.511.org/transit/datafeeds?api_key=$API_KEY&operator_id=CT"
+One request = the departures at one platform (limit 5), sorted and formatted as next_trains
+does; with --to variants each train also gets its arrival at the line's far terminal.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add project root so backend can be imported (run from repo root: python3 scripts/bench_departures.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend import caltrain, gtfs_static
+from fixtures import synthetic_feed, synthetic_gtfs_zip
+
+LIMIT = 5
+
+
+# --- The previous pipeline: 12-key dicts with ISO strings, re-parsed when formatting ---
+
+def legacy_utc_to_local(iso_utc_str):
+    if not iso_utc_str:
+        return None
+    try:
+        dt = datetime.fromisoformat(iso_utc_str.replace("Z", "+00:00"))
+        local = dt.astimezone(caltrain.PACIFIC)
+        h = local.hour % 12 or 12
+        return f"{h}:{local.minute:02d} {local.strftime('%p')}"
+    except (ValueError, TypeError):
+        return None
+
+
+def legacy_epoch_to_local(ts):
+    local = datetime.fromtimestamp(ts, tz=caltrain.PACIFIC)
+    h = local.hour % 12 or 12
+    return f"{h}:{local.minute:02d} {local.strftime('%p')}"
+
+
+def legacy_visits(snap, stop_id):
+    visits = []
+    for d in caltrain.gtfs_rt_departures(snap.stops, stop_id, int(time.time()) - 60, limit=LIMIT):
+        iso_str = datetime.fromtimestamp(d.ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+        local = legacy_utc_to_local(iso_str)
+        visits.append({
+            "trip_id": d.trip_id, "line_name": d.route_id, "line_ref": d.route_id, "destination": d.route_id or "—",
+            "expected_departure": iso_str, "expected_arrival": iso_str,
+            "aimed_departure": iso_str, "aimed_arrival": iso_str,
+            "expected_departure_local": local, "expected_arrival_local": local,
+            "aimed_departure_local": local, "aimed_arrival_local": local,
+        })
+
+    def sort_key(v):
+        t = v.get("expected_departure") or v.get("expected_arrival") or ""
+        return (t == "", t)
+
+    visits.sort(key=sort_key)
+    return visits
+
+
+def legacy_minutes_until(iso_utc_str):
+    dt = datetime.fromisoformat(iso_utc_str.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int((dt - datetime.now(timezone.utc)).total_seconds() / 60)
+
+
+def legacy_trip_arrival(trip_timetable, rt_trips, trip_id, from_id, to_id, departure_iso):
+    if trip_timetable is None or not trip_id:
+        return None
+    dep_ts = caltrain._iso_to_epoch(departure_iso)
+    schedule = caltrain._trip_schedule(*trip_timetable, trip_id, from_id, to_id)
+    if dep_ts is None or schedule is None:
+        return None
+    sched_dep, sched_arr, sched_dep_to = schedule
+    arrival_ts = dep_ts + sched_arr - sched_dep
+    rt = rt_trips.get(trip_id, {}).get(to_id)
+    if rt is not None and rt.ts - (sched_dep_to - sched_arr) >= dep_ts:
+        arrival_ts = rt.ts - (sched_dep_to - sched_arr)
+    scheduled_ts = caltrain._service_day_base(sched_dep, dep_ts) + sched_arr
+    return (arrival_ts - dep_ts) // 60, legacy_epoch_to_local(scheduled_ts), legacy_epoch_to_local(arrival_ts)
+
+
+def legacy_request(snap, stop_id, to_id, trip_timetable):
+    trains = []
+    for t in legacy_visits(snap, stop_id):
+        line_ref = t.get("line_ref") or ""
+        exp_dep = t.get("expected_departure") or t.get("expected_arrival")
+        train = {
+            "service": caltrain._service_tag.__wrapped__(line_ref) or (t.get("line_name") or "").strip() or "—",
+            "destination": (t.get("destination") or "").strip() or "—",
+            "time": t.get("expected_departure_local") or t.get("expected_arrival_local") or "—",
+            "minutes_until": legacy_minutes_until(exp_dep) if exp_dep else None,
+        }
+        if to_id:
+            arrival = legacy_trip_arrival(trip_timetable, snap.trips, t.get("trip_id"), stop_id, to_id, exp_dep)
+            if arrival is not None:
+                train["travel_minutes"], train["scheduled_arrival"], train["arrival"] = arrival
+        trains.append(train)
+    return trains
+
+
+# --- Current pipeline ---
+
+def departure_request(snap, stop_id, to_id, trip_timetable):
+    departures = caltrain._gtfs_rt_visits(snap, stop_id, limit=LIMIT)
+    departures.sort(key=lambda d: (d.expected_departure is None, d.expected_departure or 0))
+    return caltrain._format_trains(departures, stop_id, to_id, None, trip_timetable, snap.trips, time.time())
+
+
+IMPLS = {"legacy dicts": legacy_request, "departures": departure_request}
+
+
+def measure(fn, requests, rounds):
+    """(CPU us per request, peak traced KB per request, blocks retained by one request's result)."""
+    for args in requests:
+        fn(*args)
+    start = time.process_time()
+    for _ in range(rounds):
+        for args in requests:
+            fn(*args)
+    cpu_us = (time.process_time() - start) / (rounds * len(requests)) * 1e6
+    peaks, blocks = [], []
+    tracemalloc.start()
+    for args in requests:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        peaks.append(peak - base)
+        blocks.append(sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0))
+        del result
+    tracemalloc.stop()
+    return cpu_us, sum(peaks) / len(peaks) / 1024, sum(blocks) / len(blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feed", help="recorded tripupdates protobuf")
+    parser.add_argument("--gtfs", help="recorded GTFS zip (for --to arrivals)")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    content = Path(args.feed).read_bytes() if args.feed else synthetic_feed().SerializeToString()
+    snap = caltrain._parse_gtfs_rt_feed(content)
+    data = gtfs_static.parse_gtfs_zip(Path(args.gtfs).read_bytes() if args.gtfs else synthetic_gtfs_zip())
+    trip_timetable = (data.stop_times, caltrain._trip_timetable_from_stop_times(data.stop_times))
+    stop_ids = sorted(snap.stops)
+    terminal = {"2": "70262", "1": "70011"}  # southbound -> San Jose Diridon, northbound -> San Francisco
+
+    print(f"{len(stop_ids)} stops in feed, {len(snap.feed.entity)} trip updates, {args.rounds} rounds")
+    print(f"{'pipeline':<14} {'to':<4} {'CPU us/req':>11} {'peak KB/req':>12} {'blocks/req':>11}")
+    for with_to in (False, True):
+        requests = [
+            (snap, stop_id, terminal.get(stop_id[-1]) if with_to else None, trip_timetable) for stop_id in stop_ids
+        ]
+        for name, fn in IMPLS.items():
+            cpu_us, peak_kb, blocks = measure(fn, requests, args.rounds)
+            print(f"{name:<14} {'yes' if with_to else 'no':<4} {cpu_us:>11.1f} {peak_kb:>12.2f} {blocks:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-request scan of the GTFS-RT feed vs. lookup in the per-stop index.
+Run from project root: python3 scripts/bench_gtfs_rt_index.py [--feed tripupdates.pb]
+
+Without --feed, a synthetic Caltrain-sized feed is generated. To record a real one:
+  curl -o tripupdates.pb "https://api.511.org/transit/tripupdates?api_key=$API_KEY&agency=CT"
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add project root so backend can be imported (run from repo root: python3 scripts/bench_gtfs_rt_index.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.transit import gtfs_realtime_pb2
+
+from backend import caltrain
+from fixtures import synthetic_feed
+
+
+def scan(feed, stop_id, now_ts):
+    """The original per-request algorithm: walk every stop_time_update in the feed."""
+    out = []
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        for stu in entity.trip_update.stop_time_update:
+            if stu.stop_id != stop_id:
+                continue
+            dep = stu.departure if stu.HasField("departure") else stu.arrival if stu.HasField("arrival") else None
+            arr = stu.arrival if stu.HasField("arrival") else stu.departure if stu.HasField("departure") else None
+            ts = dep.time if dep and dep.time else (arr.time if arr and arr.time else 0)
+            if ts < now_ts - 60:
+                continue
+            out.append(ts)
+            break
+    out.sort()
+    return out
+
+
+def bench(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feed", help="recorded tripupdates protobuf (default: synthetic)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.feed:
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(Path(args.feed).read_bytes())
+        now_ts = feed.header.timestamp or int(time.time())
+    else:
+        feed = synthetic_feed()
+        now_ts = int(time.time())
+    updates = sum(len(e.trip_update.stop_time_update) for e in feed.entity if e.HasField("trip_update"))
+    print(f"Feed: {len(feed.entity)} entities, {updates} stop_time_updates")
+
+    build = bench(lambda: caltrain._index_gtfs_rt_feed(feed), max(1, args.repeat // 20))
+    index = caltrain._index_gtfs_rt_feed(feed)
+    stop_ids = sorted(index) or [s["id"] for s in caltrain.EMBEDDED_STOPS]
+    print(f"Index build (once per snapshot): {build * 1e3:.2f} ms for {len(stop_ids)} stops")
+
+    for stop_id in stop_ids:
+        expected = scan(feed, stop_id, now_ts)[:args.limit]
+        got = [d.ts for d in caltrain.gtfs_rt_departures(index, stop_id, now_ts - 60, limit=args.limit)]
+        if expected != got:
+            print(f"MISMATCH at {stop_id}: scan={expected} index={got}")
+            sys.exit(1)
+
+    def all_scan():
+        for stop_id in stop_ids:
+            scan(feed, stop_id, now_ts)
+
+    def all_index():
+        for stop_id in stop_ids:
+            caltrain.gtfs_rt_departures(index, stop_id, now_ts - 60, limit=args.limit)
+
+    t_scan = bench(all_scan, max(1, args.repeat // 10)) / len(stop_ids)
+    t_index = bench(all_index, args.repeat) / len(stop_ids)
+    print(f"Per-stop scan:   {t_scan * 1e6:10.1f} us")
+    print(f"Per-stop lookup: {t_index * 1e6:10.1f} us  ({t_scan / t_index:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
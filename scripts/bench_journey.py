@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: journey planner (connection scan) over every station pair for a full service day.
+Run from project root: python3 scripts/bench_journey.py [--gtfs caltrain_gtfs.zip] [--step 30]
+
+Without --gtfs, the synthetic Caltrain-sized feed is used. To record the real one:
+  curl -o caltrain_gtfs.zip "https://api.511.org/transit/datafeeds?api_key=$API_KEY&operator_id=CT"
+Queries leave every --step minutes from 05:00 to 23:59 on the next weekday, once against the
+static timetable and once with a synthetic GTFS-Realtime snapshot applied.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root so backend can be imported (run from repo root: python3 scripts/bench_journey.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend import caltrain, gtfs_static
+from backend.journey import ConnectionTimetable
+from backend.schedule import Schedule
+from backend.stations import display_name
+from fixtures import synthetic_feed, synthetic_gtfs_zip
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def run(timetable, stations, departures, rt=None):
+    """Plan every (origin, destination, departure); return per-query ms and how many found a train."""
+    rt_trips, rt_version = rt or (None, None)
+    times, found = [], 0
+    for origin, from_ids in stations.items():
+        for dest, to_ids in stations.items():
+            if origin == dest:
+                continue
+            for ts in departures:
+                start = time.perf_counter()
+                itineraries = timetable.plan(from_ids, to_ids, ts, rt_trips=rt_trips, rt_version=rt_version)
+                times.append((time.perf_counter() - start) * 1000)
+                found += bool(itineraries)
+    return times, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gtfs", help="recorded GTFS zip (e.g. Caltrain's)")
+    parser.add_argument("--step", type=int, default=30, help="minutes between departure times (default 30)")
+    args = parser.parse_args()
+
+    content = Path(args.gtfs).read_bytes() if args.gtfs else synthetic_gtfs_zip()
+    data = gtfs_static.parse_gtfs_zip(content)
+    start = time.perf_counter()
+    schedule = Schedule(data, caltrain.PACIFIC)
+    timetable = ConnectionTimetable(data, schedule)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    stations = {}
+    for s in data.stops:
+        stations.setdefault(display_name(s), []).append(s["id"])
+    day = datetime.now(caltrain.PACIFIC).date() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    first = int(datetime(day.year, day.month, day.day, 5, tzinfo=caltrain.PACIFIC).timestamp())
+    departures = list(range(first, first + 19 * 3600, args.step * 60))
+
+    start = time.perf_counter()
+    timetable.connections(day)
+    day_ms = (time.perf_counter() - start) * 1000
+    snap = caltrain._parse_gtfs_rt_feed(synthetic_feed(now=first + 3 * 3600).SerializeToString())
+    start = time.perf_counter()
+    timetable.connections(day, snap.trips, snap.version)
+    rt_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{len(stations)} stations, {len(departures)} departure times, {len(data.stop_times)} stop_times rows")
+    print(f"build {build_ms:.1f} ms, day connections {day_ms:.1f} ms, realtime patch {rt_ms:.1f} ms")
+    print(f"{'timetable':<10} {'queries':>8} {'found':>7} {'mean ms':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+    for label, rt in (("static", None), ("realtime", (snap.trips, snap.version))):
+        times, found = run(timetable, stations, departures, rt)
+        times.sort()
+        print(f"{label:<10} {len(times):>8} {found:>7} {statistics.fmean(times):>8.3f} {percentile(times, 50):>7.3f} "
+              f"{percentile(times, 95):>7.3f} {percentile(times, 99):>7.3f} {times[-1]:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
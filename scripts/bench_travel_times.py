@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark: travel-time matrix build time and peak RSS, legacy all-pairs lists vs. streaming columns.
+Run from project root: python3 scripts/bench_travel_times.py [--gtfs caltrain_gtfs.zip]
+
+Always runs the synthetic Caltrain-sized feed and a synthetic 10x feed; add --gtfs for the real one:
+  curl -o caltrain_gtfs.zip "https://api.511.org/transit/datafeeds?api_key=$API_KEY&operator_id=CT"
+Each build runs in its own process so peak RSS is not polluted by the previous one; a second,
+traced run reports the peak of Python allocations (finer-grained than RSS on small feeds).
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+# Add project root so backend can be imported (run from repo root: python3 scripts/bench_travel_times.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend import caltrain, gtfs_static
+from fixtures import synthetic_gtfs_zip
+
+
+def legacy_build(content):
+    """The original builder: every stop_times row as a dict, every (i, j) minute value in a list."""
+    pairs_minutes = {}
+    with zipfile.ZipFile(io.BytesIO(content), "r") as zf:
+        stop_times_file = next((n for n in zf.namelist() if n.lower() == "stop_times.txt"), None)
+        with zf.open(stop_times_file) as f:
+            rows = [row for row in csv.DictReader(io.TextIOWrapper(f, encoding="utf-8"))]
+    by_trip = {}
+    for row in rows:
+        trip_id = (row.get("trip_id") or "").strip()
+        stop_id = (row.get("stop_id") or "").strip()
+        arr = gtfs_static.gtfs_time_to_seconds(row.get("arrival_time"))
+        dep = gtfs_static.gtfs_time_to_seconds(row.get("departure_time"))
+        try:
+            seq = int((row.get("stop_sequence") or "").strip())
+        except (ValueError, TypeError):
+            continue
+        if not trip_id or not stop_id or dep is None:
+            continue
+        by_trip.setdefault(trip_id, []).append((seq, stop_id, dep, arr))
+    for stop_list in by_trip.values():
+        stop_list.sort(key=lambda x: x[0])
+        for i in range(len(stop_list)):
+            _, from_id, dep_i, _ = stop_list[i]
+            for j in range(i + 1, len(stop_list)):
+                _, to_id, dep_j, arr_j = stop_list[j]
+                to_time = arr_j if arr_j is not None else dep_j
+                minutes = (to_time - dep_i) // 60
+                if minutes >= 0:
+                    pairs_minutes.setdefault((from_id, to_id), []).append(minutes)
+    travel_times = {}
+    for key, mins_list in pairs_minutes.items():
+        mins_list.sort()
+        mid = len(mins_list) // 2
+        travel_times[key] = mins_list[mid] if len(mins_list) % 2 else (mins_list[mid - 1] + mins_list[mid]) // 2
+    return travel_times
+
+
+def streaming_build(content):
+    with zipfile.ZipFile(io.BytesIO(content), "r") as zf:
+        stop_times = gtfs_static._parse_stop_times(zf)
+    return caltrain._travel_times_from_stop_times(stop_times)
+
+
+BUILDERS = {"legacy": legacy_build, "streaming": streaming_build}
+
+
+def worker(impl, path):
+    """Run one build in this process; print elapsed, peak RSS growth, traced peak and a result digest."""
+    content = Path(path).read_bytes()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    travel_times = BUILDERS[impl](content)
+    elapsed = time.perf_counter() - start
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del travel_times
+    tracemalloc.start()
+    travel_times = BUILDERS[impl](content)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    digest = hashlib.sha1(json.dumps(sorted(travel_times.items())).encode()).hexdigest()
+    print(json.dumps({"seconds": elapsed, "peak_rss_kb": rss_peak - rss_before, "traced_peak": traced_peak,
+                      "pairs": len(travel_times), "digest": digest}))
+
+
+def run(impl, path):
+    out = subprocess.run([sys.executable, __file__, "--worker", impl, path], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gtfs", help="recorded GTFS zip (e.g. Caltrain's) to include")
+    parser.add_argument("--worker", nargs=2, metavar=("IMPL", "ZIP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        feeds = []
+        if args.gtfs:
+            feeds.append(("recorded", args.gtfs))
+        for label, scale in (("synthetic 1x", 1), ("synthetic 10x", 10)):
+            path = Path(tmp) / f"gtfs_{scale}.zip"
+            path.write_bytes(synthetic_gtfs_zip(scale=scale))
+            feeds.append((label, str(path)))
+
+        print(f"{'feed':<15} {'builder':<10} {'build s':>9} {'peak RSS MB':>12} {'peak alloc MB':>14} {'pairs':>7}")
+        for label, path in feeds:
+            results = {impl: run(impl, path) for impl in BUILDERS}
+            for impl, r in results.items():
+                print(f"{label:<15} {impl:<10} {r['seconds']:>9.3f} {r['peak_rss_kb'] / 1024:>12.1f} "
+                      f"{r['traced_peak'] / 2**20:>14.1f} {r['pairs']:>7}")
+            if results["legacy"]["digest"] != results["streaming"]["digest"]:
+                print(f"MISMATCH: builders disagree on {label}")
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,14 @@ Run from project root: python3 scripts/debug_api.py
 
 Stops are now loaded from the GTFS feed (511 NeTEx /transit/stops no longer
 returns a list). This script checks StopMonitoring (with/without stopcode) and get_caltrain_stops().
+
+To inspect a recorded incident offline, serve its archive (see backend/replay.py) with the stub
+and point both the raw requests and the backend at it:
+  python3 scripts/stub_511.py --archive incident.arc --port 8511 &
+  API_BASE_URL=http://127.0.0.1:8511 python3 scripts/debug_api.py
 """
 
+import asyncio
 import os
 import sys
 from pathlib import Path
@@ -19,17 +25,21 @@ from dotenv import load_dotenv
 load_dotenv(Path(__file__).resolve().parent / ".env")
 load_dotenv(Path(__file__).resolve().parent.parent / "backend" / ".env")
 
+API_BASE_URL = os.getenv("API_BASE_URL", "https://api.511.org").rstrip("/")
 API_KEY = os.getenv("API_KEY")
-if not API_KEY:
+if not API_KEY and API_BASE_URL == "https://api.511.org":
     print("ERROR: API_KEY not set. Add it to .env (see .env.example)")
     sys.exit(1)
-print("OK: API_KEY is set")
+if not API_KEY:
+    # A local stub or archive replay doesn't check the key
+    API_KEY = os.environ["API_KEY"] = "stub"
+print(f"OK: API_KEY is set ({API_BASE_URL})")
 
 import requests
 
 # --- 1. Raw 511 stops API ---
 print("\n--- 511 Stops API (raw) ---")
-url = "https://api.511.org/transit/stops"
+url = f"{API_BASE_URL}/transit/stops"
 params = {"api_key": API_KEY, "operator_id": "CT", "format": "json"}
 try:
     r = requests.get(url, params=params)
@@ -120,10 +130,9 @@ else:
 print("\n--- Our get_caltrain_stops() ---")
 # Clear cache so we hit API
 from backend import caltrain
-caltrain._stops_cache = None
-caltrain._stops_cache_time = 0
+caltrain._stops_cache(caltrain.CALTRAIN_OPERATOR_ID).invalidate()
 try:
-    stops = caltrain.get_caltrain_stops()
+    stops = asyncio.run(caltrain.get_caltrain_stops())
     print(f"  Returned {len(stops)} stops")
     if stops:
         print(f"  First 3: {[(s.get('id'), s.get('Name')) for s in stops[:3]]}")
@@ -143,7 +152,7 @@ print(f"  First item: {stops[0] if stops else 'N/A'}")
 # --- 4. StopMonitoring (with stopcode, then without) ---
 print("\n--- 511 StopMonitoring API ---")
 stop_id = stops[0]["id"] if stops else "70031"
-url2 = "https://api.511.org/transit/StopMonitoring"
+url2 = f"{API_BASE_URL}/transit/StopMonitoring"
 
 for label, params2 in [
     ("WITH stopcode", {"api_key": API_KEY, "agency": "CT", "stopcode": stop_id, "format": "json"}),
@@ -181,7 +190,7 @@ stop_ids_seen = set()
 try:
     from google.transit import gtfs_realtime_pb2
     r3 = requests.get(
-        "https://api.511.org/transit/tripupdates",
+        f"{API_BASE_URL}/transit/tripupdates",
         params={"api_key": API_KEY, "agency": "CT"},
         timeout=10,
     )
@@ -209,7 +218,7 @@ except Exception as e:
 print("\n--- 511 Stop Timetable (scheduled departures) ---")
 try:
     r4 = requests.get(
-        "https://api.511.org/transit/stoptimetable",
+        f"{API_BASE_URL}/transit/stoptimetable",
         params={"api_key": API_KEY, "operatorref": "CT", "monitoringref": stop_id, "format": "json"},
         timeout=10,
     )
@@ -234,11 +243,11 @@ print("DATA SOURCE PRIORITY ORDER")
 print("=" * 60)
 print("""
   Priority 1: gtfs_realtime    - GTFS-Realtime Trip Updates (real-time)
-  Priority 2: stop_timetable   - SIRI Stop Timetable (scheduled)
+  Priority 2: stop_timetable   - static GTFS schedule, local (SIRI Stop Timetable until GTFS loads)
   Priority 3: stop_monitoring  - SIRI StopMonitoring (live when available)
   First non-empty source wins. UI shows: Real-time / Scheduled / Live
 """)
-sources = caltrain.debug_data_sources(stop_id)
+sources = asyncio.run(caltrain.debug_data_sources(stop_id))
 winner = None
 for key, visits in sources.items():
     label = key.replace("priority_1_", "1. ").replace("priority_2_", "2. ").replace("priority_3_", "3. ")
@@ -260,7 +269,7 @@ if stop_ids_seen and stop_id not in stop_ids_seen:
     test_stops.append(list(stop_ids_seen)[0])
 for test_stop in test_stops:
     try:
-        visits, source = caltrain.get_next_trains(test_stop, limit=5)
+        visits, source = asyncio.run(caltrain.get_next_trains(test_stop, limit=5))
         print(f"  Stop {test_stop}: {len(visits)} train(s) (source: {source})")
         for i, t in enumerate(visits[:3]):
             print(f"    {i+1}. {t.get('line_ref', '?')} -> {t.get('destination', '?')} @ {t.get('expected_departure_local', '?')}")
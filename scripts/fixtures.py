@@ -0,0 +1,114 @@
+"""
+Synthetic 511 fixtures for benchmarks and the local stub (scripts/stub_511.py).
+Deterministic for a given seed, so runs are comparable without an API key.
+"""
+
+import csv
+import io
+import random
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.transit import gtfs_realtime_pb2
+
+from backend import caltrain
+
+
+def synthetic_feed(trips=120, seed=1, now=None):
+    """FeedMessage with `trips` trip updates over the embedded Caltrain stops, starting around now."""
+    rnd = random.Random(seed)
+    stop_ids = [s["id"] for s in caltrain.EMBEDDED_STOPS]
+    now = int(time.time()) if now is None else now
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = now
+    for n in range(trips):
+        southbound = n % 2 == 0
+        platform = [s for s in stop_ids if s.endswith("2" if southbound else "1")]
+        if not southbound:
+            platform.reverse()
+        e = feed.entity.add()
+        e.id = str(n)
+        e.trip_update.trip.trip_id = str(100 + n)
+        e.trip_update.trip.route_id = rnd.choice(["Local Weekday", "Limited", "Express"])
+        t = now + rnd.randint(-1800, 4 * 3600)
+        for stop_id in platform:
+            if rnd.random() < 0.2:
+                continue
+            stu = e.trip_update.stop_time_update.add()
+            stu.stop_id = stop_id
+            stu.departure.time = t
+            stu.departure.delay = rnd.choice([0, 0, 60, 120])
+            t += rnd.randint(120, 360)
+    return feed
+
+
+# Rough line geometry for synthetic coordinates: San Francisco (4th & King) to Tamien
+_LINE_START = (37.7764, -122.3947)
+_LINE_END = (37.3114, -121.8830)
+
+# (route_id, every n-th station served)
+_PATTERNS = [("Local Weekday", 1), ("Limited", 2), ("Baby Bullet", 4)]
+
+
+def _gtfs_time(sec):
+    return f"{sec // 3600:02d}:{sec % 3600 // 60:02d}:{sec % 60:02d}"
+
+
+def synthetic_gtfs_zip(scale=1, seed=1):
+    """
+    GTFS zip (bytes) shaped like Caltrain's: the embedded stops on a straight line, weekday and
+    weekend service, Local / Limited / Baby Bullet patterns. scale multiplies the trip count
+    (scale=10 gives a feed ten times Caltrain's size for benchmarks).
+    """
+    rnd = random.Random(seed)
+    stations = [s for s in caltrain.EMBEDDED_STOPS if s["id"].endswith("2")]
+    n = len(stations)
+
+    def coords(i):
+        f = i / max(1, n - 1)
+        return (round(_LINE_START[0] + f * (_LINE_END[0] - _LINE_START[0]), 6),
+                round(_LINE_START[1] + f * (_LINE_END[1] - _LINE_START[1]), 6))
+
+    stops = [["stop_id", "stop_name", "stop_lat", "stop_lon", "location_type"]]
+    for i, st in enumerate(stations):
+        lat, lon = coords(i)
+        stops.append([st["id"][:-1] + "1", st["Name"].replace("Southbound", "Northbound"), lat, lon + 0.0002, 0])
+        stops.append([st["id"], st["Name"], lat, lon - 0.0002, 0])
+    trips = [["route_id", "service_id", "trip_id", "trip_headsign", "direction_id"]]
+    stop_times = [["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]]
+    trip_no = 100
+    for service_id, per_direction in (("WK", 46 * scale), ("WE", 16 * scale)):
+        for direction_id in (0, 1):
+            for k in range(per_direction):
+                route_id, every = _PATTERNS[k % len(_PATTERNS)] if service_id == "WK" else _PATTERNS[0]
+                order = list(range(n)) if direction_id == 0 else list(range(n - 1, -1, -1))
+                served = [i for j, i in enumerate(order) if j % every == 0 or j == len(order) - 1]
+                trip_id = str(trip_no)
+                trip_no += 1
+                headsign = stations[served[-1]]["Name"].split(" Caltrain")[0]
+                trips.append([route_id, service_id, trip_id, headsign, direction_id])
+                t = 4 * 3600 + 30 * 60 + k * (20 * 3600 // per_direction) + rnd.randint(0, 120)
+                for seq, i in enumerate(served, start=1):
+                    stop_id = stations[i]["id"] if direction_id == 0 else stations[i]["id"][:-1] + "1"
+                    stop_times.append([trip_id, _gtfs_time(t), _gtfs_time(t + 30), stop_id, seq])
+                    t += 30 + rnd.randint(150, 210) * (every if every < 4 else 3)
+    calendar = [["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+                 "start_date", "end_date"],
+                ["WK", 1, 1, 1, 1, 1, 0, 0, "20240101", "20301231"],
+                ["WE", 0, 0, 0, 0, 0, 1, 1, "20240101", "20301231"]]
+    calendar_dates = [["service_id", "date", "exception_type"],
+                      ["WK", "20261126", 2], ["WE", "20261126", 1]]
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, rows in (("stops.txt", stops), ("trips.txt", trips), ("stop_times.txt", stop_times),
+                           ("calendar.txt", calendar), ("calendar_dates.txt", calendar_dates)):
+            text = io.StringIO()
+            csv.writer(text, lineterminator="\n").writerows(rows)
+            # Fixed timestamp so the same inputs always give byte-identical zips
+            zf.writestr(zipfile.ZipInfo(name, date_time=(2026, 1, 1, 0, 0, 0)), text.getvalue())
+    return buf.getvalue()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Load test: throughput and latency of the API end to end, with the local 511 stub as upstream.
+Run from project root: python3 scripts/loadtest.py [--duration 30] [--concurrency 32] [--json run.json]
+
+Starts scripts/stub_511.py and uvicorn backend.server:app on free ports (pass --target and --stub
+to use running ones instead; the stub must be stub_511.py for its /stub endpoints). Recorded
+--feed / --gtfs / --stopmonitoring / --stoptimetable are handed to the stub. Each phase then
+runs for --duration seconds with --concurrency clients looping over a weighted request mix.
+
+--phase name[:key=value,...] (repeatable) sets stub faults for one phase through /stub/config:
+latency, jitter (seconds), error_rate (0-1), empty_feed (0/1); settings not given are reset.
+Default phases: baseline, slow-511 (latency=1.5), flaky-511 (error_rate=0.3), empty-feed.
+--mix route=weight,... picks the routes (default next_trains=70,nearest_station=20,stops=10).
+
+Reports, per phase and route, requests, req/s, p50 / p99 / max latency and non-2xx responses,
+plus the 511 calls the backend made during the phase and the load generator's own CPU use (if
+it is near a full core, run against --target from another machine for the server's ceiling).
+--json saves the report with the git commit; --compare a saved report prints this run's p50,
+p99 and req/s next to it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Add project root so backend can be imported (run from repo root: python3 scripts/loadtest.py)
+sys.path.insert(0, str(ROOT))
+
+import httpx
+
+from backend import caltrain
+from backend.stations import display_name
+from fixtures import _LINE_END, _LINE_START
+
+DEFAULT_PHASES = ("baseline", "slow-511:latency=1.5", "flaky-511:error_rate=0.3", "empty-feed:empty_feed=1")
+DEFAULT_MIX = "next_trains=70,nearest_station=20,stops=10"
+STUB_DEFAULTS = {"latency": 0, "jitter": 0, "error_rate": 0, "empty_feed": 0}
+
+STATIONS = sorted({display_name(s) for s in caltrain.EMBEDDED_STOPS})
+
+
+def next_trains_request(rnd):
+    params = {"stop": rnd.choice(STATIONS), "direction": rnd.choice(("northbound", "southbound"))}
+    if rnd.random() < 0.3:
+        params["to"] = rnd.choice([s for s in STATIONS if s != params["stop"]])
+    return "/api/next_trains", params
+
+
+def nearest_station_request(rnd):
+    """A point within about a mile of the line (where the synthetic GTFS puts the stations)."""
+    f = rnd.random()
+    lat = _LINE_START[0] + f * (_LINE_END[0] - _LINE_START[0]) + rnd.uniform(-0.015, 0.015)
+    lon = _LINE_START[1] + f * (_LINE_END[1] - _LINE_START[1]) + rnd.uniform(-0.015, 0.015)
+    return "/api/nearest_station", {"lat": f"{lat:.5f}", "lon": f"{lon:.5f}"}
+
+
+def stops_request(rnd):
+    return "/api/stops", None
+
+
+ROUTES = {"next_trains": next_trains_request, "nearest_station": nearest_station_request, "stops": stops_request}
+
+
+def parse_phase(spec):
+    name, _, settings = spec.partition(":")
+    config = dict(STUB_DEFAULTS)
+    for item in filter(None, settings.split(",")):
+        key, _, value = item.partition("=")
+        if key not in config:
+            raise SystemExit(f"unknown stub setting {key!r} in phase {spec!r}")
+        config[key] = value
+    return name, config
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(","):
+        route, _, weight = item.partition("=")
+        if route not in ROUTES:
+            raise SystemExit(f"unknown route {route!r} (choose from {', '.join(ROUTES)})")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn(args, cache_dir):
+    """Start the stub and the backend; returns (processes, target URL, stub URL)."""
+    stub_port, api_port = free_port(), free_port()
+    stub_cmd = [sys.executable, str(ROOT / "scripts" / "stub_511.py"), "--port", str(stub_port)]
+    for opt in ("feed", "gtfs", "stopmonitoring", "stoptimetable"):
+        if getattr(args, opt):
+            stub_cmd += [f"--{opt}", getattr(args, opt)]
+    env = {**os.environ, "API_BASE_URL": f"http://127.0.0.1:{stub_port}", "API_KEY": "stub", "GTFS_CACHE_DIR": cache_dir}
+    api_cmd = [sys.executable, "-m", "uvicorn", "backend.server:app", "--port", str(api_port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    procs = [subprocess.Popen(stub_cmd, cwd=ROOT, stdout=subprocess.DEVNULL),
+             subprocess.Popen(api_cmd, cwd=ROOT, env=env)]
+    return procs, f"http://127.0.0.1:{api_port}", f"http://127.0.0.1:{stub_port}"
+
+
+async def wait_ready(client, target, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{target}/api/stops")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit(f"backend at {target} not ready after {timeout}s")
+
+
+async def stub_stats(client, stub):
+    return (await client.get(f"{stub}/stub/stats")).json()
+
+
+async def run_phase(client, target, mix, duration, concurrency, seed):
+    """{route: [(latency s, status)]} for duration seconds of concurrency looping clients."""
+    results = {route: [] for route in mix}
+    routes, weights = list(mix), list(mix.values())
+    end = time.monotonic() + duration
+
+    async def worker(n):
+        rnd = random.Random(seed * 1000 + n)
+        while time.monotonic() < end:
+            route = rnd.choices(routes, weights)[0]
+            path, params = ROUTES[route](rnd)
+            start = time.perf_counter()
+            try:
+                status = (await client.get(target + path, params=params)).status_code
+            except httpx.HTTPError:
+                status = 0
+            results[route].append((time.perf_counter() - start, status))
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return results
+
+
+def summarize(results, duration):
+    routes = {}
+    for route, samples in results.items():
+        if not samples:
+            continue
+        latencies = sorted(s[0] * 1000 for s in samples)
+        routes[route] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / duration, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(latencies[-1], 2),
+            "non_2xx": sum(1 for s in samples if not 200 <= s[1] < 300),
+        }
+    return routes
+
+
+def upstream_calls(before, after):
+    return {
+        endpoint: counts["requests"] - before.get(endpoint, {}).get("requests", 0)
+        for endpoint, counts in sorted(after.items())
+        if counts["requests"] - before.get(endpoint, {}).get("requests", 0)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    old_phases = (baseline or {}).get("phases", {})
+    if baseline:
+        print(f"compared with {baseline.get('commit')} ({baseline.get('date')}): old -> new")
+    for phase, result in report["phases"].items():
+        print(f"\n== {phase} {result['stub']} (load generator CPU {result['loadgen_cpu_pct']}%)")
+        print(f"{'route':<16} {'requests':>9} {'req/s':>16} {'p50 ms':>18} {'p99 ms':>18} {'max ms':>9} {'non-2xx':>8}")
+        old_routes = old_phases.get(phase, {}).get("routes", {})
+        for route, r in result["routes"].items():
+            old = old_routes.get(route)
+
+            def col(key):
+                return f"{old[key]} -> {r[key]}" if old else str(r[key])
+
+            print(f"{route:<16} {r['requests']:>9} {col('rps'):>16} {col('p50_ms'):>18} {col('p99_ms'):>18} "
+                  f"{r['max_ms']:>9} {r['non_2xx']:>8}")
+        calls = ", ".join(f"{k} {v}" for k, v in result["upstream_calls"].items()) or "none"
+        print(f"511 calls: {calls}")
+
+
+async def main_async(args):
+    mix = parse_mix(args.mix)
+    phases = [parse_phase(p) for p in (args.phase or DEFAULT_PHASES)]
+    procs = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if args.target:
+            target, stub = args.target.rstrip("/"), args.stub.rstrip("/")
+        else:
+            procs, target, stub = spawn(args, cache_dir)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        try:
+            async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+                await wait_ready(client, target)
+                await run_phase(client, target, mix, 1, min(4, args.concurrency), seed=0)  # warm-up
+                report = {
+                    "commit": git_commit(),
+                    "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "settings": {"duration": args.duration, "concurrency": args.concurrency,
+                                 "workers": args.workers, "mix": mix},
+                    "phases": {},
+                }
+                for seed, (name, config) in enumerate(phases, start=1):
+                    await client.get(f"{stub}/stub/config", params=config)
+                    before = await stub_stats(client, stub)
+                    cpu = time.process_time()
+                    results = await run_phase(client, target, mix, args.duration, args.concurrency, seed)
+                    cpu = time.process_time() - cpu
+                    after = await stub_stats(client, stub)
+                    report["phases"][name] = {
+                        "stub": {k: v for k, v in config.items() if str(v) not in ("0", "0.0")},
+                        # Near 100 (or the backend's cores on the same host): the load generator is the limit
+                        "loadgen_cpu_pct": round(cpu / args.duration * 100),
+                        "routes": summarize(results, args.duration),
+                        "upstream_calls": upstream_calls(before, after),
+                    }
+                await client.get(f"{stub}/stub/config", params=STUB_DEFAULTS)
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.wait()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per phase (default 30)")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients (default 32)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when spawning (default 1)")
+    parser.add_argument("--phase", action="append", help="name[:key=value,...] (repeatable)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route weights (default {DEFAULT_MIX})")
+    parser.add_argument("--target", help="running backend base URL (default: spawn one)")
+    parser.add_argument("--stub", help="running stub_511.py base URL (required with --target)")
+    parser.add_argument("--feed", help="recorded tripupdates protobuf for the stub")
+    parser.add_argument("--gtfs", help="recorded GTFS zip for the stub")
+    parser.add_argument("--stopmonitoring", help="recorded StopMonitoring JSON for the stub")
+    parser.add_argument("--stoptimetable", help="recorded stoptimetable JSON for the stub")
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--compare", help="report from an earlier run to compare with")
+    args = parser.parse_args()
+    if args.target and not args.stub:
+        parser.error("--target needs --stub")
+
+    report = asyncio.run(main_async(args))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, baseline)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
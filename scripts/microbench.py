@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks: ns/op and allocation of the parsing and lookup hot paths, checked against a baseline.
+Run from project root: python3 scripts/microbench.py [--save] [--baseline FILE] [--threshold 20] [-k resolve]
+
+Offline and deterministic: the fixtures are the synthetic Caltrain-sized feed and GTFS zip from
+fixtures.py (pass --feed / --gtfs for recorded ones), installed into the backend's caches so the
+async lookups run their warm path without any 511 call.
+
+Each benchmark loops over a fixed list of inputs for at least --min-time seconds, --repeat times,
+and keeps the fastest run (ns/op). Allocation is traced separately over one pass: peak bytes
+allocated during an op and blocks still held after it, averaged per op.
+
+--save writes the results to the baseline file (default scripts/microbench_baseline.json).
+Otherwise, when a baseline exists, a benchmark regresses if its ns/op or its peak bytes grew by
+more than --threshold percent (bytes get ALLOC_SLACK_BYTES of slack for small ops), and the
+exit status is 1. Timings only compare on the same machine and Python: the baseline records
+both, and a mismatch is reported.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Add project root so backend can be imported (run from repo root: python3 scripts/microbench.py)
+sys.path.insert(0, str(ROOT))
+
+from backend import caltrain, gtfs_static
+from backend.stations import display_name
+from fixtures import _LINE_END, _LINE_START, synthetic_feed, synthetic_gtfs_zip
+
+DEFAULT_BASELINE = ROOT / "scripts" / "microbench_baseline.json"
+ALLOC_SLACK_BYTES = 256
+OPERATOR = caltrain.CALTRAIN_OPERATOR_ID
+
+# fn(*args) for each args in inputs is one op each; setup() (if any) runs before each measurement
+Bench = namedtuple("Bench", "name fn inputs is_async setup")
+
+
+def make_fixtures(feed_path, gtfs_path):
+    """Parse the fixtures and install them as the backend's current GTFS / GTFS-RT data."""
+    content = Path(feed_path).read_bytes() if feed_path else synthetic_feed().SerializeToString()
+    gtfs_zip = Path(gtfs_path).read_bytes() if gtfs_path else synthetic_gtfs_zip()
+    data = gtfs_static.parse_gtfs_zip(gtfs_zip)
+    snap = caltrain._parse_gtfs_rt_feed(content)
+    caltrain._gtfs_static_bundle(OPERATOR).install(data, None, None, time.time())
+    caltrain._gtfs_static_cache(OPERATOR).install(data)
+    caltrain._travel_times_cache(OPERATOR).install(
+        caltrain.TravelTimes(data.version, caltrain._travel_times_from_stop_times(data.stop_times))
+    )
+    return content, gtfs_zip, data, snap
+
+
+def make_benches(content, gtfs_zip, data, snap):
+    rnd = random.Random(1)
+    rt_cache = caltrain._gtfs_rt_cache(OPERATOR)
+
+    def fresh_snapshot():
+        # Re-installed before each measurement so the TTL never triggers a refresh (a 511 call)
+        rt_cache.install(snap)
+
+    stop_ids = sorted(snap.stops)
+    stations = sorted({display_name(s) for s in data.stops})
+    # Stop IDs, station names (+ direction), full platform names and partial names, as users send them
+    queries = [(s, None) for s in stop_ids[:8]]
+    queries += [(name, rnd.choice(("northbound", "southbound"))) for name in stations]
+    queries += [(s["Name"], None) for s in data.stops[:8]]
+    queries += [("jose", "southbound"), ("mateo", "northbound"), ("palo", "northbound"), ("22nd", "southbound")]
+    directions = [(name, d) for name in stations for d in ("northbound", "southbound")]
+    points = []
+    for _ in range(200):
+        f = rnd.random()
+        points.append((_LINE_START[0] + f * (_LINE_END[0] - _LINE_START[0]) + rnd.uniform(-0.02, 0.02),
+                       _LINE_START[1] + f * (_LINE_END[1] - _LINE_START[1]) + rnd.uniform(-0.02, 0.02)))
+    now = int(time.time())
+    # Departure times over the next three hours, as formatted for next_trains answers
+    timestamps = [(now + rnd.randint(0, 3 * 3600),) for _ in range(500)]
+    iso_times = [(caltrain._epoch_to_iso(ts),) for (ts,) in timestamps[:100]]
+    departures = [caltrain._gtfs_rt_visits(snap, stop_id, limit=5) for stop_id in stop_ids]
+    format_inputs = [(raw, stop_ids[i], None, 20, None, snap.trips, now) for i, raw in enumerate(departures)]
+
+    return [
+        Bench("gtfs_rt.parse_feed", caltrain._parse_gtfs_rt_feed, [(content,)], False, None),
+        Bench("gtfs_rt.visits", caltrain._gtfs_rt_visits, [(snap, s, 5) for s in stop_ids], False, None),
+        Bench("gtfs_rt.next_trains_from_gtfs_rt", caltrain._get_next_trains_from_gtfs_rt,
+              [(s, OPERATOR, 5) for s in stop_ids], True, fresh_snapshot),
+        Bench("gtfs.parse_zip", gtfs_static.parse_gtfs_zip, [(gtfs_zip,)], False, None),
+        Bench("gtfs.fetch_stops", caltrain._fetch_stops_from_gtfs, [(OPERATOR, False), (OPERATOR, True)], True, None),
+        Bench("gtfs.travel_times", caltrain._travel_times_from_stop_times, [(data.stop_times,)], False, None),
+        Bench("stops.resolve_stop", caltrain._resolve_stop, queries, True, None),
+        Bench("stops.in_direction", caltrain.get_stops_in_direction, directions, True, None),
+        Bench("stops.nearest_station", caltrain.get_nearest_station, points, True, None),
+        Bench("time.epoch_to_local", caltrain._epoch_to_local, timestamps, False, None),
+        Bench("time.iso_to_epoch", caltrain._iso_to_epoch, iso_times, False, None),
+        Bench("time.format_trains", caltrain._format_trains, format_inputs, False, None),
+    ]
+
+
+def _pass(bench):
+    """One timed pass over the inputs (a coroutine for async benchmarks); returns ns."""
+    fn, inputs = bench.fn, bench.inputs
+    if bench.is_async:
+        async def run():
+            start = time.perf_counter_ns()
+            for args in inputs:
+                await fn(*args)
+            return time.perf_counter_ns() - start
+        return run()
+    start = time.perf_counter_ns()
+    for args in inputs:
+        fn(*args)
+    return time.perf_counter_ns() - start
+
+
+def measure_time(loop, bench, min_time, repeat):
+    """Fastest ns/op over repeat runs of at least min_time seconds each."""
+    def one_pass():
+        result = _pass(bench)
+        return loop.run_until_complete(result) if bench.is_async else result
+
+    if bench.setup:
+        bench.setup()
+    one_pass()  # warm caches and lazily built indexes
+    best = None
+    for _ in range(repeat):
+        if bench.setup:
+            bench.setup()
+        elapsed, ops = 0, 0
+        while elapsed < min_time * 1e9:
+            elapsed += one_pass()
+            ops += len(bench.inputs)
+        best = elapsed / ops if best is None else min(best, elapsed / ops)
+    return best
+
+
+def measure_alloc(loop, bench):
+    """(peak bytes allocated during an op, blocks retained after it), averaged over one pass."""
+    if bench.setup:
+        bench.setup()
+    peaks, blocks = 0, 0
+    tracemalloc.start()
+    for args in bench.inputs:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = loop.run_until_complete(bench.fn(*args)) if bench.is_async else bench.fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        peaks += peak - base
+        blocks += sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+        del result
+    tracemalloc.stop()
+    n = len(bench.inputs)
+    return peaks / n, blocks / n
+
+
+def machine():
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "node": platform.node()}
+
+
+def regressions(name, result, base, threshold):
+    """Messages for each metric of result more than threshold percent above base."""
+    found = []
+    if result["ns_per_op"] > base["ns_per_op"] * (1 + threshold / 100):
+        found.append(f"{name}: {base['ns_per_op']:.0f} -> {result['ns_per_op']:.0f} ns/op")
+    if result["peak_bytes"] > base["peak_bytes"] * (1 + threshold / 100) + ALLOC_SLACK_BYTES:
+        found.append(f"{name}: {base['peak_bytes']:.0f} -> {result['peak_bytes']:.0f} peak bytes/op")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feed", help="recorded tripupdates protobuf")
+    parser.add_argument("--gtfs", help="recorded GTFS zip")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="write this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=20, help="allowed regression in percent (default 20)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed run (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark, fastest kept (default 5)")
+    parser.add_argument("-k", dest="select", help="only benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    benches = make_benches(*make_fixtures(args.feed, args.gtfs))
+    if args.select:
+        benches = [b for b in benches if args.select in b.name]
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() and not args.save else None
+    base_results = (baseline or {}).get("results", {})
+    if baseline and baseline.get("machine") != machine():
+        print(f"note: baseline was recorded on {baseline.get('machine')}; timings may not be comparable")
+
+    loop = asyncio.new_event_loop()
+    results, failed = {}, []
+    print(f"{'benchmark':<34} {'ns/op':>12} {'peak B/op':>10} {'blocks/op':>10} {'vs baseline':>12}")
+    for bench in benches:
+        ns = measure_time(loop, bench, args.min_time, args.repeat)
+        peak, blocks = measure_alloc(loop, bench)
+        result = results[bench.name] = {"ns_per_op": round(ns, 1), "peak_bytes": round(peak, 1),
+                                        "blocks": round(blocks, 2)}
+        base = base_results.get(bench.name)
+        change = f"{(ns / base['ns_per_op'] - 1) * 100:+.1f}%" if base else "-"
+        print(f"{bench.name:<34} {ns:>12.0f} {peak:>10.0f} {blocks:>10.2f} {change:>12}")
+        if base:
+            failed += regressions(bench.name, result, base, args.threshold)
+    loop.close()
+
+    if args.save:
+        baseline_path.write_text(json.dumps({"machine": machine(), "results": results}, indent=2) + "\n")
+        print(f"baseline written to {baseline_path}")
+    elif baseline is None:
+        print(f"no baseline at {baseline_path}; run with --save to record one")
+    if failed:
+        print(f"\nregressed beyond {args.threshold:g}%:")
+        for message in failed:
+            print(f"  {message}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
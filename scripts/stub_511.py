@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for api.511.org, for running the backend without an API key.
+Run from project root: python3 scripts/stub_511.py [--port 8511] [--feed tripupdates.pb] [--gtfs gtfs.zip]
+
+Then start the backend against it:
+  API_BASE_URL=http://127.0.0.1:8511 API_KEY=stub uvicorn backend.server:app
+
+Serves /transit/tripupdates (recorded --feed, or a fresh synthetic feed per request),
+/transit/stops, StopMonitoring / stoptimetable (recorded --stopmonitoring / --stoptimetable
+JSON, else empty deliveries), and /transit/datafeeds (--gtfs zip, or a synthetic one) with an
+ETag so conditional requests get 304. With --archive, /transit requests are answered from a
+replay archive recorded with UPSTREAM_RECORD (see backend/replay.py) instead, at --speed.
+
+Faults for load tests (scripts/loadtest.py): --latency/--jitter delay every response,
+--error-rate answers that fraction of /transit requests with 503, --empty-feed serves a
+tripupdates feed with no entities. They can be changed while running:
+  GET /stub/config?latency=1.5&error_rate=0.2&empty_feed=1   (returns the current settings)
+  GET /stub/stats                                           (requests and injected errors per endpoint)
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.transit import gtfs_realtime_pb2
+
+from backend import caltrain, replay
+from fixtures import synthetic_feed, synthetic_gtfs_zip
+
+# Settings /stub/config may change, with their types
+CONFIG_KEYS = {
+    "latency": float, "jitter": float, "error_rate": float,
+    "empty_feed": lambda v: v.lower() not in ("0", "false", ""),
+}
+
+
+def _json_body(obj):
+    # 511 prefixes its JSON with a UTF-8 BOM; mimic it so the client's decoding is exercised
+    return json.dumps(obj).encode("utf-8-sig")
+
+
+def _empty_feed():
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = int(time.time())
+    return feed.SerializeToString()
+
+
+def _recorded_json(path):
+    """A recorded 511 JSON response as served (BOM added if the recording lost it)."""
+    body = Path(path).read_bytes()
+    return body if body.startswith(b"\xef\xbb\xbf") else b"\xef\xbb\xbf" + body
+
+
+def make_handler(args):
+    feed_bytes = Path(args.feed).read_bytes() if args.feed else None
+    gtfs_bytes = Path(args.gtfs).read_bytes() if args.gtfs else synthetic_gtfs_zip()
+    gtfs_etag = '"%s"' % hashlib.sha1(gtfs_bytes).hexdigest()
+    points = [{"id": s["id"], "Name": s["Name"]} for s in caltrain.EMBEDDED_STOPS]
+    monitoring = _recorded_json(args.stopmonitoring) if args.stopmonitoring else _json_body(
+        {"ServiceDelivery": {"StopMonitoringDelivery": {"MonitoredStopVisit": []}}}
+    )
+    timetable = _recorded_json(args.stoptimetable) if args.stoptimetable else _json_body(
+        {"Siri": {"ServiceDelivery": {"StopTimetableDelivery": {"TimetabledStopVisit": []}}}}
+    )
+    config = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+              "empty_feed": args.empty_feed}
+    stats = {}  # endpoint -> {"requests", "errors"}
+    lock = threading.Lock()
+    replayer = replay.Replayer(args.archive, speed=args.speed, shift_times=not args.no_shift) if args.archive else None
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _control(self, path, query):
+            if path == "/stub/config":
+                with lock:
+                    for key, value in query.items():
+                        if key in CONFIG_KEYS:
+                            config[key] = CONFIG_KEYS[key](value[-1])
+                    body = dict(config)
+            else:
+                with lock:
+                    body = {name: dict(counts) for name, counts in stats.items()}
+            self._send(200, json.dumps(body).encode("utf-8"), "application/json")
+
+        def _replay(self, replayer, endpoint, query):
+            params = {k: v[-1] for k, v in parse_qs(query, keep_blank_values=True).items()}
+            answer = replayer.respond(endpoint, params, {"If-None-Match": self.headers.get("If-None-Match")})
+            if answer is None:
+                return self._send(404, b"not in archive", "text/plain")
+            record, status, headers, body = answer
+            time.sleep(record.latency_ms / 1000 / args.speed)
+            if status == 0:
+                # Recorded without a response (timeout, reset): drop the connection
+                self.close_connection = True
+                return
+            content_type = headers.pop("Content-Type", "application/octet-stream")
+            self._send(status, body, content_type, headers)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = url.path
+            if path in ("/stub/config", "/stub/stats"):
+                return self._control(path, parse_qs(url.query, keep_blank_values=True))
+            with lock:
+                latency, jitter, error_rate, empty_feed = (
+                    config["latency"], config["jitter"], config["error_rate"], config["empty_feed"]
+                )
+                counts = stats.setdefault(path.rsplit("/", 1)[-1], {"requests": 0, "errors": 0})
+                counts["requests"] += 1
+                fail = error_rate and random.random() < error_rate
+                if fail:
+                    counts["errors"] += 1
+            if latency or jitter:
+                time.sleep(latency + random.uniform(0, jitter))
+            if fail:
+                self._send(503, b"injected error", "text/plain")
+            elif replayer is not None and path.startswith("/transit/"):
+                self._replay(replayer, path.rsplit("/", 1)[-1], url.query)
+            elif path == "/transit/tripupdates":
+                if empty_feed:
+                    body = _empty_feed()
+                else:
+                    body = feed_bytes if feed_bytes is not None else synthetic_feed().SerializeToString()
+                self._send(200, body, "application/x-protobuf")
+            elif path == "/transit/stops":
+                body = _json_body({"Contents": {"dataObjects": {"ScheduledStopPoint": points}}})
+                self._send(200, body, "application/json")
+            elif path == "/transit/StopMonitoring":
+                self._send(200, monitoring, "application/json")
+            elif path == "/transit/stoptimetable":
+                self._send(200, timetable, "application/json")
+            elif path == "/transit/datafeeds":
+                if self.headers.get("If-None-Match") == gtfs_etag:
+                    self._send(304, b"", "application/zip", {"ETag": gtfs_etag})
+                else:
+                    self._send(200, gtfs_bytes, "application/zip", {"ETag": gtfs_etag})
+            else:
+                self._send(404, b"not found", "text/plain")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8511)
+    parser.add_argument("--feed", help="recorded tripupdates protobuf to serve")
+    parser.add_argument("--gtfs", help="GTFS zip to serve from /transit/datafeeds")
+    parser.add_argument("--stopmonitoring", help="recorded StopMonitoring JSON to serve")
+    parser.add_argument("--stoptimetable", help="recorded stoptimetable JSON to serve")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to sleep before every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of /transit requests answered 503")
+    parser.add_argument("--empty-feed", action="store_true", help="serve tripupdates with no entities")
+    parser.add_argument("--archive", help="replay archive (UPSTREAM_RECORD) to answer /transit requests from")
+    parser.add_argument("--speed", type=float, default=1.0, help="archive replay speed (default 1: original pace)")
+    parser.add_argument("--no-shift", action="store_true", help="serve archived feed times as recorded")
+    parser.add_argument("--verbose", action="store_true", help="log each request")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    print(f"511 stub on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,14 @@ Usage: python start.py [stop] [direction]
        python start.py "San Francisco" southbound
 """
 
+import asyncio
 import sys
 from backend.caltrain import next_trains
 
 if __name__ == "__main__":
     stop_input = (sys.argv[1] if len(sys.argv) > 1 else "").strip() or "70031"
     direction = (sys.argv[2] if len(sys.argv) > 2 else "").strip() or None
-    result = next_trains(stop_input, limit=5, direction=direction)
+    result = asyncio.run(next_trains(stop_input, limit=5, direction=direction))
     if not result["stop_id"]:
         if result.get("message"):
             print(result["message"])